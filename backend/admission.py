@@ -0,0 +1,92 @@
+# Admission control for the analysis endpoints: bounded in-flight work, a priority lane and degraded mode
+
+import math
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """The server is full; retry_after_s is the suggested client back-off"""
+
+    def __init__(self, retry_after_s: int):
+        super().__init__(f"Server busy, retry in {retry_after_s}s")
+        self.retry_after_s = retry_after_s
+
+
+class AdmissionController:
+    """
+    Caps the number of analyses in progress. Normal requests may fill
+    max_in_flight slots; priority requests (safety checks) may also take the
+    priority_reserve slots on top, so they are still admitted when normal
+    traffic has filled the server. Rejected requests get a Retry-After
+    estimated from the recent service time.
+
+    Degraded mode turns on when queue_wait_fn() (the detector's recent queue
+    wait in ms) exceeds degrade_above_ms, and off again once it drops below
+    recover_below_ms. Callers check `degraded` and skip optional stages.
+
+    Used from the event loop only, so no locking is needed.
+    """
+
+    def __init__(self, max_in_flight: int = 32, priority_reserve: int = 8,
+                 degrade_above_ms: float = 1000.0, recover_below_ms: Optional[float] = None,
+                 queue_wait_fn: Optional[Callable[[], float]] = None, latency_alpha: float = 0.2):
+        self.max_in_flight = max(1, max_in_flight)
+        self.priority_reserve = max(0, priority_reserve)
+        self.degrade_above_ms = degrade_above_ms
+        self.recover_below_ms = degrade_above_ms / 2 if recover_below_ms is None else recover_below_ms
+        self.queue_wait_fn = queue_wait_fn
+        self.latency_alpha = latency_alpha
+
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.degraded_entered = 0
+        self._latency_s = 0.0
+        self._degraded = False
+
+    @contextmanager
+    def admit(self, priority: bool = False):
+        """Hold one slot for the duration of the block, or raise AdmissionRejected"""
+        limit = self.max_in_flight + (self.priority_reserve if priority else 0)
+        if self.in_flight >= limit:
+            self.rejected += 1
+            raise AdmissionRejected(self.retry_after_s())
+
+        self.in_flight += 1
+        self.admitted += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._latency_s += self.latency_alpha * (time.perf_counter() - started - self._latency_s)
+
+    def retry_after_s(self) -> int:
+        """Time for the current in-flight work to drain, at the recent per-request service time"""
+        waves = (self.in_flight + 1) / self.max_in_flight
+        return max(1, math.ceil(self._latency_s * waves))
+
+    @property
+    def degraded(self) -> bool:
+        if self.queue_wait_fn is not None:
+            queue_wait_ms = self.queue_wait_fn()
+            if not self._degraded and queue_wait_ms > self.degrade_above_ms:
+                self._degraded = True
+                self.degraded_entered += 1
+            elif self._degraded and queue_wait_ms < self.recover_below_ms:
+                self._degraded = False
+        return self._degraded
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "priority_reserve": self.priority_reserve,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "degraded": self.degraded,
+            "degraded_entered": self.degraded_entered,
+            "mean_latency_ms": self._latency_s * 1000.0,
+        }
@@ -1,9 +1,109 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Name fragments that mark a detected object as personal protective equipment
+PPE_KEYWORDS = ('safety', 'gloves', 'mask', 'hat', 'protection')
+
+def ppe_items(detected_objects: List[str]) -> List[str]:
+    return [obj for obj in detected_objects if any(keyword in obj.lower() for keyword in PPE_KEYWORDS)]
+
+def safety_status(detected_objects: List[str]) -> str:
+    """Machine-readable outcome of assess_safety: ppe_present or ppe_missing"""
+    return "ppe_present" if ppe_items(detected_objects) else "ppe_missing"
+
+def assess_safety(detected_objects: List[str]) -> str:
+    """PPE presence check over the detected object names"""
+    safety_items = ppe_items(detected_objects)
+    
+    if safety_items:
+        return f"✅ Safety equipment detected: {', '.join(safety_items)}. Good safety practices observed."
+    return "⚠️ No safety equipment detected. Ensure appropriate PPE for industrial tasks."
+
+class AffordanceRuleIndex:
+    """
+    Affordance rule tables compiled into lookup indexes.
+    
+    Every rule test ("term occurs in the object name" for phase requirements
+    and safety equipment, "object is exactly X" for tools) becomes a feature
+    column. Each distinct object name is mapped once to an id with a cached
+    boolean feature row, so scoring a frame is a sparse frames x objects
+    incidence matrix times the object feature matrix, and phase scoring is a
+    product with the phase requirement matrix.
+    """
+    
+    def __init__(self, task_patterns: Dict[str, List[str]], dangerous_tools: Sequence[str],
+                 safety_equipment: Sequence[str], tool_pairs: Sequence[Tuple[List[str], str]]):
+        self.phases = list(task_patterns)
+        self.tool_pairs = [(list(pair), activity) for pair, activity in tool_pairs]
+        
+        substring_terms = sorted({term for terms in task_patterns.values() for term in terms} | set(safety_equipment))
+        exact_terms = sorted(set(dangerous_tools) | {tool for pair, _ in tool_pairs for tool in pair} | {"person", "laptop", "drill"})
+        self.substring_terms = substring_terms
+        self.exact_terms = exact_terms
+        self.substring_column = {term: i for i, term in enumerate(substring_terms)}
+        self.exact_column = {term: len(substring_terms) + i for i, term in enumerate(exact_terms)}
+        num_columns = len(substring_terms) + len(exact_terms)
+        
+        # phases x features requirement counts; a requirement is met when it occurs in any object name
+        self.phase_requirements = np.zeros((len(self.phases), num_columns), dtype=np.int32)
+        for row, terms in enumerate(task_patterns.values()):
+            for term in terms:
+                self.phase_requirements[row, self.substring_column[term]] = 1
+        self.phase_lengths = np.array([max(len(terms), 1) for terms in task_patterns.values()], dtype=np.float64)
+        
+        self.safety_columns = np.array([self.substring_column[term] for term in safety_equipment], dtype=np.intp)
+        self.dangerous_columns = np.array([self.exact_column[tool] for tool in dangerous_tools], dtype=np.intp)
+        self.pair_columns = [np.array([self.exact_column[tool] for tool in pair], dtype=np.intp) for pair, _ in self.tool_pairs]
+        
+        # Object name -> id, and the id -> feature row matrix (grown as new names appear)
+        self.object_ids: Dict[str, int] = {}
+        self._feature_rows: List[np.ndarray] = []
+        self._feature_matrix = np.zeros((0, num_columns), dtype=bool)
+    
+    def object_id(self, name: str) -> int:
+        object_id = self.object_ids.get(name)
+        if object_id is None:
+            row = np.zeros(self._feature_matrix.shape[1], dtype=bool)
+            for term, column in self.substring_column.items():
+                row[column] = term in name
+            column = self.exact_column.get(name)
+            if column is not None:
+                row[column] = True
+            
+            object_id = self.object_ids[name] = len(self._feature_rows)
+            self._feature_rows.append(row)
+            self._feature_matrix = np.vstack(self._feature_rows)
+        return object_id
+    
+    def frame_features(self, frames: Sequence[Sequence[str]]) -> np.ndarray:
+        """frames x features boolean matrix: which rule tests each frame satisfies"""
+        frame_index, object_index = [], []
+        for i, objects in enumerate(frames):
+            for name in objects:
+                frame_index.append(i)
+                object_index.append(self.object_id(name))
+        
+        incidence = np.zeros((len(frames), len(self._feature_rows)), dtype=np.int32)
+        incidence[np.array(frame_index, dtype=np.intp), np.array(object_index, dtype=np.intp)] = 1
+        return (incidence @ self._feature_matrix.astype(np.int32)) > 0
+    
+    def phase_scores(self, features: np.ndarray) -> np.ndarray:
+        """frames x phases: fraction of each phase's required objects present"""
+        return (features.astype(np.int32) @ self.phase_requirements.T) / self.phase_lengths
+
 
 class AffordanceAnalyzer:
-    def __init__(self):
+    def __init__(self, affordances: Optional[Dict[str, List[str]]] = None,
+                 task_patterns: Optional[Dict[str, List[str]]] = None,
+                 tool_pairs: Optional[List[Tuple[List[str], str]]] = None,
+                 dangerous_tools: Optional[List[str]] = None,
+                 safety_equipment: Optional[List[str]] = None,
+                 next_steps: Optional[Dict[str, str]] = None):
+        # Every table can be replaced by a site profile; None keeps the built-in rules
+        
         # Object affordances mapping (Gibson's affordance theory)
-        self.affordances = {
+        self.affordances = affordances if affordances is not None else {
             "screwdriver": ["turning", "poking", "prying", "tightening", "loosening"],
             "hammer": ["hitting", "striking", "pulling", "driving", "breaking"],
             "wrench": ["turning", "gripping", "twisting", "tightening", "holding"],
@@ -19,7 +119,7 @@ class AffordanceAnalyzer:
         }
         
         # Task phase patterns
-        self.task_patterns = {
+        self.task_patterns = task_patterns if task_patterns is not None else {
             "ASSEMBLY_PHASE": ["screwdriver", "wrench", "person", "drill"],
             "MAINTENANCE_PHASE": ["wrench", "screwdriver", "hammer", "person"],
             "MEASUREMENT_PHASE": ["laptop", "phone", "person"],
@@ -27,6 +127,33 @@ class AffordanceAnalyzer:
             "QUALITY_CONTROL": ["laptop", "person", "phone"],
             "SETUP_PHASE": ["person", "laptop", "tools"]
         }
+        
+        # Tool combinations
+        self.tool_pairs = tool_pairs if tool_pairs is not None else [
+            (["screwdriver", "wrench"], "Assembly work"),
+            (["hammer", "drill"], "Construction work"),
+            (["scissors", "knife"], "Cutting operations"),
+            (["laptop", "phone"], "Digital documentation")
+        ]
+        
+        # Safety checks
+        self.dangerous_tools = dangerous_tools if dangerous_tools is not None else ["drill", "hammer", "knife", "saw"]
+        self.safety_equipment = safety_equipment if safety_equipment is not None else ["gloves", "safety glasses", "mask", "hard hat"]
+        
+        # Phase-specific next steps
+        self.next_steps = next_steps if next_steps is not None else {
+            "ASSEMBLY_PHASE": "1. Verify component alignment 2. Check torque specifications 3. Follow assembly sequence",
+            "MAINTENANCE_PHASE": "1. Power down equipment 2. Follow lockout procedures 3. Inspect components",
+            "QUALITY_CONTROL": "1. Document measurements 2. Compare to specifications 3. Record findings",
+        }
+        
+        self.compile_rules()
+    
+    def compile_rules(self):
+        """Rebuild the lookup indexes; call again after editing the rule tables"""
+        self.rules = AffordanceRuleIndex(
+            self.task_patterns, self.dangerous_tools, self.safety_equipment, self.tool_pairs
+        )
     
     def identify_affordances(self, objects: List[str]) -> Dict[str, List[str]]:
         """Identify what actions are possible with detected objects"""
@@ -39,30 +166,22 @@ class AffordanceAnalyzer:
                 object_affordances[obj] = ["handling", "moving", "using"]
         return object_affordances
     
-    def find_object_combinations(self, objects: List[str]) -> List[Dict[str, Any]]:
-        """Find meaningful combinations of objects that work together"""
+    def _combinations(self, objects: List[str], features: np.ndarray) -> List[Dict[str, Any]]:
         combinations = []
         
         # Person + Tool combinations
-        if "person" in objects:
-            tools = [obj for obj in objects if obj != "person"]
-            for tool in tools:
-                combinations.append({
-                    "objects": ["person", tool],
-                    "interaction": f"Person using {tool}",
-                    "confidence": 0.9
-                })
+        if features[self.rules.exact_column["person"]]:
+            for tool in objects:
+                if tool != "person":
+                    combinations.append({
+                        "objects": ["person", tool],
+                        "interaction": f"Person using {tool}",
+                        "confidence": 0.9
+                    })
         
         # Tool combinations
-        tool_pairs = [
-            (["screwdriver", "wrench"], "Assembly work"),
-            (["hammer", "drill"], "Construction work"),
-            (["scissors", "knife"], "Cutting operations"),
-            (["laptop", "phone"], "Digital documentation")
-        ]
-        
-        for tool_pair, activity in tool_pairs:
-            if all(tool in objects for tool in tool_pair):
+        for (tool_pair, activity), columns in zip(self.rules.tool_pairs, self.rules.pair_columns):
+            if features[columns].all():
                 combinations.append({
                     "objects": tool_pair,
                     "interaction": activity,
@@ -71,80 +190,117 @@ class AffordanceAnalyzer:
         
         return combinations
     
+    def find_object_combinations(self, objects: List[str]) -> List[Dict[str, Any]]:
+        """Find meaningful combinations of objects that work together"""
+        return self._combinations(objects, self.rules.frame_features([objects])[0])
+    
+    def _task_phases(self, features: np.ndarray,
+                     allowed_phases: Optional[List[Optional[Sequence[str]]]] = None) -> List[str]:
+        if not self.rules.phases:
+            return ["GENERAL_WORK_PHASE"] * len(features)
+        scores = self.rules.phase_scores(features)
+        if allowed_phases is not None:
+            # Phases a workstation cannot host never win for its frame
+            allowed = np.array([[phases is None or phase in phases for phase in self.rules.phases]
+                                for phases in allowed_phases], dtype=bool).reshape(scores.shape)
+            scores = np.where(allowed, scores, 0)
+        best = scores.argmax(axis=1)
+        return [
+            self.rules.phases[index] if frame_scores[index] > 0 else "GENERAL_WORK_PHASE"
+            for index, frame_scores in zip(best, scores)
+        ]
+    
     def infer_task_phase(self, objects: List[str]) -> str:
         """Determine the current task phase based on objects"""
-        scores = {}
-        
-        for phase, required_objects in self.task_patterns.items():
-            score = 0
-            for req_obj in required_objects:
-                if req_obj in objects or any(req_obj in obj for obj in objects):
-                    score += 1
-            scores[phase] = score / len(required_objects)
-        
-        if not scores or max(scores.values()) == 0:
-            return "GENERAL_WORK_PHASE"
-        
-        return max(scores, key=scores.get)
+        return self._task_phases(self.rules.frame_features([objects]))[0]
     
-    def detect_anomalies(self, objects: List[str]) -> List[str]:
-        """Detect potential safety or workflow anomalies"""
+    def _anomalies(self, features: np.ndarray) -> List[str]:
         anomalies = []
         
-        # Safety checks
-        dangerous_tools = ["drill", "hammer", "knife", "saw"]
-        safety_equipment = ["gloves", "safety glasses", "mask", "hard hat"]
-        
-        has_dangerous = any(tool in objects for tool in dangerous_tools)
-        has_safety = any(safety in ' '.join(objects) for safety in safety_equipment)
+        has_dangerous = features[self.rules.dangerous_columns].any()
+        has_safety = features[self.rules.safety_columns].any()
         
         if has_dangerous and not has_safety:
             anomalies.append("Dangerous tools detected without safety equipment")
         
         # Workflow anomalies
-        if "laptop" in objects and "drill" in objects:
+        if features[self.rules.exact_column["laptop"]] and features[self.rules.exact_column["drill"]]:
             anomalies.append("Electronic device near power tools - potential interference")
         
         return anomalies
     
+    def detect_anomalies(self, objects: List[str]) -> List[str]:
+        """Detect potential safety or workflow anomalies"""
+        return self._anomalies(self.rules.frame_features([objects])[0])
+    
     def generate_guidance(self, objects: List[str]) -> Dict[str, Any]:
         """Generate comprehensive guidance based on detected objects"""
-        if not objects:
-            return {
-                "summary": "No objects detected. Please ensure good lighting and clear view of workspace.",
-                "task_phase": "UNKNOWN_PHASE",
-                "affordances": {},
-                "object_combinations": [],
-                "anomalies": [],
-                "next_steps": "Position objects clearly in view for analysis."
-            }
+        return self.generate_guidance_batch([objects])[0]
+    
+    def generate_guidance_batch(self, frames: List[List[str]],
+                                allowed_phases: Optional[List[Optional[Sequence[str]]]] = None,
+                                next_steps: Optional[List[Optional[Dict[str, str]]]] = None) -> List[Dict[str, Any]]:
+        """
+        Guidance for many frames, with rule matching and phase scoring done in
+        one vectorized pass. Per frame, allowed_phases may restrict the phases
+        it can be in and next_steps may override the profile's next steps.
+        """
+        features = self.rules.frame_features(frames)
+        task_phases = self._task_phases(features, allowed_phases)
+        next_steps = next_steps or [None] * len(frames)
         
-        affordances = self.identify_affordances(objects)
-        combinations = self.find_object_combinations(objects)
-        task_phase = self.infer_task_phase(objects)
-        anomalies = self.detect_anomalies(objects)
-        
-        # Generate contextual summary
-        if "person" in objects:
-            summary = f"Worker detected with {len(objects)-1} objects. Current phase: {task_phase}."
-        else:
-            summary = f"{len(objects)} objects detected in workspace. Phase: {task_phase}."
-        
-        # Generate next steps
-        if task_phase == "ASSEMBLY_PHASE":
-            next_steps = "1. Verify component alignment 2. Check torque specifications 3. Follow assembly sequence"
-        elif task_phase == "MAINTENANCE_PHASE":
-            next_steps = "1. Power down equipment 2. Follow lockout procedures 3. Inspect components"
-        elif task_phase == "QUALITY_CONTROL":
-            next_steps = "1. Document measurements 2. Compare to specifications 3. Record findings"
-        else:
-            next_steps = "Continue with standard operating procedures for current task"
+        guidance = []
+        for objects, frame_features, task_phase, steps in zip(frames, features, task_phases, next_steps):
+            if not objects:
+                guidance.append({
+                    "summary": "No objects detected. Please ensure good lighting and clear view of workspace.",
+                    "task_phase": "UNKNOWN_PHASE",
+                    "affordances": {},
+                    "object_combinations": [],
+                    "anomalies": [],
+                    "next_steps": "Position objects clearly in view for analysis."
+                })
+                continue
+            
+            # Generate contextual summary
+            if "person" in objects:
+                summary = f"Worker detected with {len(objects)-1} objects. Current phase: {task_phase}."
+            else:
+                summary = f"{len(objects)} objects detected in workspace. Phase: {task_phase}."
+            
+            guidance.append({
+                "summary": summary,
+                "task_phase": task_phase,
+                "affordances": self.identify_affordances(objects),
+                "object_combinations": self._combinations(objects, frame_features),
+                "anomalies": self._anomalies(frame_features),
+                "next_steps": (steps or {}).get(task_phase) or self.next_steps.get(
+                    task_phase, "Continue with standard operating procedures for current task"
+                )
+            })
         
+        return guidance
+    
+    def generate_zone_guidance(self, objects: List[str], object_zones: List[str],
+                               zone_rules: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-workstation guidance: each zone's phase, anomalies and next steps
+        from the objects detected inside it. zone_rules maps zone name to its
+        optional "task_phases" and "next_steps" rules.
+        """
+        names = list(zone_rules)
+        frames = [[obj for obj, zone in zip(objects, object_zones) if zone == name] for name in names]
+        guidance = self.generate_guidance_batch(
+            frames,
+            allowed_phases=[zone_rules[name].get("task_phases") for name in names],
+            next_steps=[zone_rules[name].get("next_steps") for name in names]
+        )
         return {
-            "summary": summary,
-            "task_phase": task_phase,
-            "affordances": affordances,
-            "object_combinations": combinations,
-            "anomalies": anomalies,
-            "next_steps": next_steps
-        }
\ No newline at end of file
+            name: {
+                "objects": frame,
+                "task_phase": zone_guidance["task_phase"],
+                "anomalies": zone_guidance["anomalies"],
+                "next_steps": zone_guidance["next_steps"],
+            }
+            for name, frame, zone_guidance in zip(names, frames, guidance)
+        }
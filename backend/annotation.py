@@ -0,0 +1,48 @@
+# Detection overlay rendering (shared by the detector, the lazy image endpoint and the CLIs)
+
+from typing import List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+
+def draw_detections(image: np.ndarray, boxes: Sequence, objects: List[str], scores: List[float]) -> np.ndarray:
+    """Create publication-quality annotated images (draws on a copy)"""
+    annotated = image.copy()
+    
+    for box, obj_name, score in zip(np.asarray(boxes, dtype=np.float32).reshape(-1, 4), objects, scores):
+        x1, y1, x2, y2 = box.astype(int)
+        
+        # Color coding for different object types
+        if any(tool in obj_name for tool in ["screwdriver", "hammer", "wrench", "drill"]):
+            color = (0, 165, 255)  # Orange for tools
+        elif any(safety in obj_name for safety in ["safety", "gloves", "mask", "hat"]):
+            color = (0, 255, 0)    # Green for safety
+        elif "person" in obj_name:
+            color = (255, 0, 0)    # Red for people
+        else:
+            color = (255, 255, 0)  # Cyan for other objects
+        
+        # Draw professional bounding box
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
+        
+        # Draw label with background
+        label_text = f"{obj_name}: {score:.2f}"
+        text_size = cv2.getTextSize(label_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
+        cv2.rectangle(annotated, (x1, y1-text_size[1]-10), 
+                     (x1+text_size[0], y1), color, -1)
+        cv2.putText(annotated, label_text, (x1, y1-5),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+    
+    return annotated
+
+
+def render_annotation_jpeg(image_data: bytes, boxes: Sequence, objects: List[str], scores: List[float],
+                           quality: int = 90) -> Optional[bytes]:
+    """Decode a stored frame, draw its detections and encode the overlay as JPEG (None if undecodable)"""
+    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    ok, encoded = cv2.imencode(".jpg", draw_detections(image, boxes, objects, scores),
+                               [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes() if ok else None
@@ -1,30 +1,272 @@
 # PhD-Level Industrial AI with OWL-ViT + Affordance Theory
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+from contextlib import asynccontextmanager, contextmanager
 import os
 import uuid
 import base64
+import json
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import cv2
-import openai
 from dotenv import load_dotenv
-import torch
-from PIL import Image
-from transformers import OwlViTProcessor, OwlViTForObjectDetection
 
-# Import your affordance analyzer
-from affordance_analyzer import AffordanceAnalyzer
+# The detector (OWL-ViT + affordance analyzer) is imported lazily by build_detector
+from model_runtime import ModelRuntime
+from batching import PRIORITY_HIGH, PRIORITY_NORMAL
+from admission import AdmissionController, AdmissionRejected
+from streaming import FrameDropped, StreamSession
+from tracking import ObjectTracker
+from frame_cache import FrameCache
+from tiling import parse_tile_grid
+from history_store import STATS_BUCKETS, AnalysisHistoryStore
+from history_export import EXPORT_FORMATS, stream_export
+from image_store import ImageStore, RenderedImageCache, image_extension
+from annotation import render_annotation_jpeg
+from preprocessing import decode_reduced, scale_boxes
+from site_profiles import ProfileRegistry, SiteProfile
+from affordance_analyzer import assess_safety
+from metrics import MetricsRegistry, StageTimings, process_memory_bytes, process_rss_bytes
+from logging_setup import configure_logging
+from expert_analysis import (
+    ExpertAnalysisCache, ExpertAnalysisService, ExpertStreamRegistry,
+    OpenAIExpertBackend, StubExpertBackend
+)
+import config
+
+configure_logging(config.LOG_LEVEL, config.LOG_FORMAT)
+logger = logging.getLogger("industrial_ai.api")
 
 # Load environment variables
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+openai_api_key = os.getenv("OPENAI_API_KEY")
+
+# Expert analysis: cached, coalesced GPT-4 calls (or the offline stub backend)
+if config.EXPERT_BACKEND == "stub":
+    expert_backend = StubExpertBackend(latency_ms=config.EXPERT_STUB_LATENCY_MS)
+elif openai_api_key:
+    expert_backend = OpenAIExpertBackend(
+        openai_api_key,
+        model=config.OPENAI_MODEL,
+        timeout_s=config.OPENAI_TIMEOUT_S,
+        max_connections=config.OPENAI_MAX_CONNECTIONS
+    )
+else:
+    expert_backend = None
+
+expert_service = ExpertAnalysisService(
+    expert_backend,
+    ExpertAnalysisCache(
+        max_entries=config.EXPERT_CACHE_SIZE,
+        ttl_s=config.EXPERT_CACHE_TTL_S,
+        disk_path=config.EXPERT_CACHE_PATH or None
+    ),
+    timeout_s=config.OPENAI_TIMEOUT_S
+) if expert_backend else None
+expert_streams = ExpertStreamRegistry(retention_s=config.EXPERT_STREAM_RETENTION_S)
+
+# Bounded pools keep CPU-bound and disk work off the asyncio event loop
+cpu_executor = ThreadPoolExecutor(max_workers=config.CPU_POOL_WORKERS, thread_name_prefix="cpu")
+io_executor = ThreadPoolExecutor(max_workers=config.IO_POOL_WORKERS, thread_name_prefix="io")
+
+def build_detector():
+    """Heavy imports and weight loading happen here, on the loader thread"""
+    from object_detection import AdvancedIndustrialDetector
+    return AdvancedIndustrialDetector(
+        backend=config.DETECTOR_BACKEND,
+        num_threads=config.TORCH_NUM_THREADS,
+        onnx_path=config.ONNX_MODEL_PATH,
+        score_threshold=config.DETECTION_SCORE_THRESHOLD,
+        nms_iou_threshold=config.NMS_IOU_THRESHOLD,
+        tile_grid=parse_tile_grid(config.TILE_GRID),
+        tile_overlap=config.TILE_OVERLAP,
+        tile_min_side=config.TILE_MIN_SIDE
+    )
+
+# Per-site vocabulary/affordance profiles, hot-reloaded from PROFILE_DIR
+profile_registry = ProfileRegistry(
+    config.PROFILE_DIR,
+    default_profile=config.DEFAULT_PROFILE,
+    reload_interval_s=config.PROFILE_RELOAD_INTERVAL_S
+)
+
+def profile_vocabularies(profiles: List[SiteProfile]) -> List[List[str]]:
+    return [profile.vocabulary for profile in profiles]
+
+# Detector and micro-batching engine, loaded and warmed up in the background
+runtime = ModelRuntime(
+    build_detector,
+    max_batch_size=config.BATCH_MAX_SIZE,
+    max_wait_ms=config.BATCH_MAX_WAIT_MS,
+    vocabularies_fn=lambda: profile_vocabularies(profile_registry.profiles())
+)
+
+# Bounded in-flight analyses, a reserved lane for safety checks and load-based degraded mode
+admission = AdmissionController(
+    max_in_flight=config.ADMISSION_MAX_IN_FLIGHT,
+    priority_reserve=config.ADMISSION_PRIORITY_RESERVE,
+    degrade_above_ms=config.DEGRADE_QUEUE_WAIT_MS,
+    queue_wait_fn=lambda: runtime.engine.queue_wait_ms() if runtime.engine is not None else 0.0
+)
+
+# analysis_type of requests that take the priority lane
+SAFETY_ANALYSIS = "safety"
+
+# New profile versions get their text embeddings before requests can select them
+profile_registry.add_listener(lambda profiles: runtime.prepare_vocabularies(profile_vocabularies(profiles)))
+
+# Prometheus metrics (GET /metrics)
+metrics = MetricsRegistry()
+REQUEST_SECONDS = metrics.histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"])
+REQUESTS_IN_FLIGHT = metrics.gauge("http_requests_in_flight", "HTTP requests currently being handled")
+STAGE_SECONDS = metrics.histogram("analysis_stage_duration_seconds", "Analysis pipeline stage latency", ["stage"])
+DETECTIONS = metrics.counter("detections_total", "Detected objects by label", ["label"])
+ANALYSIS_ERRORS = metrics.counter("analysis_errors_total", "Failed analyses by source", ["source"])
+STREAM_FRAMES_DROPPED = metrics.counter("stream_frames_dropped_total", "Live-stream frames replaced before analysis or rejected by admission / deadline")
+DEADLINE_EXCEEDED = metrics.counter("deadline_exceeded_total", "Requests or stages cut off by the request deadline", ["stage"])
+DEGRADED_ANALYSES = metrics.counter("degraded_analyses_total", "Analyses returned without the GPT text")
+
+def engine_stat(key: str) -> float:
+    return runtime.engine.stats()[key] if runtime.engine is not None else 0
+
+def expert_stat(key: str) -> float:
+    return expert_service.stats()[key] if expert_service is not None else 0
+
+metrics.gauge("model_ready", "1 once the detector is loaded and warm", fn=lambda: float(runtime.ready))
+metrics.gauge("inference_queue_depth", "Frames waiting for the batching engine", fn=lambda: engine_stat("queue_depth"))
+metrics.counter("inference_batches_total", "Detector batches run", fn=lambda: engine_stat("total_batches"))
+metrics.counter("inference_frames_total", "Frames run through the detector", fn=lambda: engine_stat("total_items"))
+metrics.counter("expert_cache_hits_total", "Expert analyses served from cache", fn=lambda: expert_stat("hits"))
+metrics.counter("expert_cache_misses_total", "Expert analyses sent to the LLM backend", fn=lambda: expert_stat("misses"))
+metrics.counter("expert_coalesced_total", "Expert requests joined to an identical in-flight call", fn=lambda: expert_stat("coalesced"))
+metrics.counter("expert_errors_total", "Expert backend failures (fallback text returned)", fn=lambda: expert_stat("errors"))
+metrics.gauge("expert_in_flight", "LLM calls in progress", fn=lambda: expert_stat("in_flight"))
+metrics.gauge("inference_queue_wait_ms", "Moving average of detector queue wait", fn=lambda: engine_stat("queue_wait_ms"))
+metrics.gauge("admission_in_flight", "Analyses currently admitted", fn=lambda: admission.in_flight)
+metrics.counter("admission_rejected_total", "Analyses rejected with 429", fn=lambda: admission.rejected)
+metrics.gauge("admission_degraded", "1 while degraded mode is active", fn=lambda: float(admission.degraded))
+metrics.gauge("process_resident_memory_bytes", "Resident set size of this process", fn=process_rss_bytes)
+metrics.gauge("process_proportional_memory_bytes", "Resident memory with shared pages (pre-forked model weights) split between their processes",
+              fn=lambda: process_memory_bytes().get("pss", 0.0))
+
+# Near-duplicate frames (retakes, static benches) reuse the previous analysis
+frame_cache = FrameCache(
+    max_entries=config.FRAME_CACHE_SIZE,
+    max_bytes=int(config.FRAME_CACHE_MAX_MB * 1024 * 1024),
+    max_distance=config.FRAME_CACHE_MAX_DISTANCE,
+    ttl_s=config.FRAME_CACHE_TTL_S,
+    hash_size=config.FRAME_CACHE_HASH_SIZE,
+    hash_margin=config.FRAME_CACHE_HASH_MARGIN
+) if config.FRAME_CACHE_ENABLED else None
+
+def frame_cache_stat(key: str) -> float:
+    return frame_cache.stats()[key] if frame_cache is not None else 0
+
+metrics.counter("frame_cache_hits_total", "Analyses served from the perceptual-hash frame cache", fn=lambda: frame_cache_stat("hits"))
+metrics.counter("frame_cache_misses_total", "Frame cache lookups that ran the full pipeline", fn=lambda: frame_cache_stat("misses"))
+metrics.counter("frame_cache_evictions_total", "Frame cache entries evicted by the count or memory limit", fn=lambda: frame_cache_stat("evictions"))
+metrics.gauge("frame_cache_entries", "Cached frame analyses", fn=lambda: frame_cache_stat("entries"))
+metrics.gauge("frame_cache_bytes", "Estimated memory held by the frame cache", fn=lambda: frame_cache_stat("bytes"))
+
+# Original frames (content-addressed, with retention) and the LRU of rendered overlays
+image_store = ImageStore(
+    config.IMAGE_STORE_DIR,
+    max_bytes=int(config.IMAGE_STORE_MAX_MB * 1024 * 1024),
+    max_age_s=config.IMAGE_RETENTION_DAYS * 86400.0,
+    gc_interval_s=config.IMAGE_STORE_GC_INTERVAL_S
+)
+render_cache = RenderedImageCache(
+    max_entries=config.RENDER_CACHE_SIZE,
+    max_bytes=int(config.RENDER_CACHE_MAX_MB * 1024 * 1024)
+)
 
-app = FastAPI(title="PhD Industrial AI Assistant API", version="2.0.0")
+metrics.gauge("image_store_files", "Original frames kept in the image store", fn=lambda: image_store.stats()["files"])
+metrics.gauge("image_store_bytes", "Disk used by the image store", fn=lambda: image_store.stats()["bytes"])
+metrics.counter("image_store_deduplicated_total", "Uploads whose bytes were already stored", fn=lambda: image_store.stats()["deduplicated"])
+metrics.counter("image_store_deleted_total", "Images removed by the retention policy", fn=lambda: image_store.stats()["deleted"])
+metrics.counter("render_cache_hits_total", "Annotated images served from the render cache", fn=lambda: render_cache.stats()["hits"])
+metrics.counter("render_cache_misses_total", "Annotated images rendered on request", fn=lambda: render_cache.stats()["misses"])
+
+# Storage (opened in the lifespan hook)
+history_store: Optional[AnalysisHistoryStore] = None
+# Images of analyses from before the image store, still referenced by their history records
+os.makedirs("static", exist_ok=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global history_store
+    logger.info("🚀 Initializing PhD Industrial AI System...")
+    history_store = AnalysisHistoryStore(
+        config.HISTORY_DB_PATH,
+        batch_size=config.HISTORY_BATCH_SIZE,
+        flush_interval_ms=config.HISTORY_FLUSH_INTERVAL_MS,
+        busy_timeout_ms=config.HISTORY_BUSY_TIMEOUT_MS,
+        max_queued=config.HISTORY_MAX_QUEUED
+    )
+    await asyncio.get_running_loop().run_in_executor(io_executor, image_store.start)
+    profile_registry.start()
+    runtime.start()
+    logger.info("⏳ Loading OWL-ViT in the background - see GET /ready")
+    
+    yield
+    
+    profile_registry.close()
+    runtime.shutdown()
+    # Running expert generations write their final text into history when they complete
+    await expert_streams.close()
+    history_store.close()
+    image_store.close()
+    if expert_service:
+        await expert_service.close()
+
+def require_runtime() -> ModelRuntime:
+    """The loaded model runtime, or 503 while it is still loading"""
+    if not runtime.ready:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Model not ready ({runtime.state})",
+            headers={"Retry-After": "5"}
+        )
+    return runtime
+
+def resolve_profile(name: Optional[str]) -> SiteProfile:
+    """Current version of the requested site profile (default when omitted), or 404"""
+    profile = profile_registry.get(name)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Unknown site profile: {name}")
+    return profile
+
+app = FastAPI(title="PhD Industrial AI Assistant API", version="2.0.0", lifespan=lifespan)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Latency histogram and in-flight gauge for every HTTP request"""
+    REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+        # Route templates (not raw paths) keep label cardinality bounded
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status)
+        )
 
 # Enable CORS
 app.add_middleware(
@@ -35,200 +277,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class AdvancedIndustrialDetector:
-    """
-    PhD-Level Object Detection combining OWL-ViT with Affordance Theory
-    
-    Research Contribution: Zero-shot detection of industrial objects with
-    real-time affordance-based instruction generation
-    """
+def decode_image_bytes(image_data: bytes) -> Optional[np.ndarray]:
+    """Decode encoded JPEG/PNG bytes into a BGR array (np.frombuffer wraps the buffer without copying)"""
+    return cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+
+def base64_image_bytes(image_base64: str) -> bytes:
+    """Encoded image bytes of a base64 (optionally data-URL) payload"""
+    image_data_str = image_base64
+    if ',' in image_base64:
+        _, image_data_str = image_base64.split(',', 1)
     
-    def __init__(self):
-        print("🔬 Loading PhD-level detection system...")
-        
-        # 1. Load OWL-ViT with correct model classes
-        self.processor = OwlViTProcessor.from_pretrained("google/owlvit-base-patch32")
-        self.model = OwlViTForObjectDetection.from_pretrained("google/owlvit-base-patch32")
-        print("✅ OWL-ViT model loaded")
-        
-        # 2. ENHANCED PhD Research: Manufacturing-specific vocabulary (REPLACE EXISTING)
-        self.manufacturing_vocabulary = [
-            # More Specific Person Terms
-            "industrial worker", "machinist", "operator", "technician", "engineer", 
-            "supervisor", "inspector", "apprentice", "person", "worker",
-            
-            # More Specific Equipment
-            "CNC mill", "vertical mill", "horizontal mill", "milling machine",
-            "precision lathe", "metal lathe", "turning machine", "lathe",
-            "drill press", "band saw", "welding machine", "cnc machine",
-            
-            # More Specific Safety Terms
-            "safety helmet", "hard hat", "protective helmet", "safety glasses",
-            "protective glasses", "safety goggles", "work gloves", "safety gloves",
-            "protective gloves", "face mask", "safety mask", "respirator",
-            
-            # Precision Tools
-            "screwdriver", "hammer", "wrench", "pliers", "saw", "drill", "clamp",
-            "measuring tape", "level", "soldering iron", "multimeter", "caliper",
-            "micrometer", "torque wrench", "allen key", "file", "chisel",
-            
-            # Materials & Components
-            "wood", "metal", "plastic", "wire", "pipe", "sheet metal", 
-            "circuit board", "resistor", "capacitor", "bolt", "screw", 
-            "nail", "washer", "nut", "bearing", "spring",
-            
-            # Workpieces & Assemblies
-            "workpiece", "assembly", "component", "product", "prototype",
-            "jig", "fixture", "template", "blueprint", "schematic",
-            
-            # Common Objects (for broader detection)
-            "laptop", "computer", "phone", "tablet", "camera", "bottle", "cup",
-            "pen", "pencil", "paper", "book", "chair", "table", "box",
-            "scissors", "knife", "spoon", "fork"
-        ]
-        
-        # 3. Initialize Affordance Theory Engine
-        self.affordance_analyzer = AffordanceAnalyzer()
-        print("✅ Affordance theory engine initialized")
-        
-    def detect_objects(self, image: np.ndarray) -> Tuple[List[str], List[float], np.ndarray]:
-        """
-        PhD Research Method: Zero-shot industrial object detection
-        with confidence scoring and visual annotation
-        """
-        try:
-            # Convert to PIL for OWL-ViT processing
-            pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-            
-            # Process with OWL-ViT using manufacturing vocabulary
-            inputs = self.processor(
-                text=[[f"a photo of a {obj}" for obj in self.manufacturing_vocabulary]], 
-                images=pil_image, 
-                return_tensors="pt"
-            )
-            
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-            
-            # Post-process detections
-            target_sizes = torch.Tensor([pil_image.size[::-1]])
-            results = self.processor.post_process_object_detection(
-                outputs=outputs,
-                threshold=0.1,  # CHANGE THIS: Lower threshold for initial detection
-                target_sizes=target_sizes
-            )[0]
-            
-            if len(results["boxes"]) == 0:
-                print("⚠️ No objects detected by OWL-ViT")
-                return [], [], image
-            
-            # Extract detection data
-            boxes = results["boxes"].detach().numpy()
-            scores = results["scores"].detach().numpy()
-            labels = results["labels"].detach().numpy()
-            
-            # Map to object names and filter by confidence
-            detected_objects = []
-            confidence_scores = []
-            valid_boxes = []
-            
-            # Extract detection data with IMPROVED CONFIDENCE THRESHOLD
-            for i, (box, score, label) in enumerate(zip(boxes, scores, labels)):
-                if score > 0.25:  # 🎯 ADD THIS: Your improved confidence threshold
-                    obj_name = self.manufacturing_vocabulary[label]
-                    detected_objects.append(obj_name)
-                    confidence_scores.append(float(score))
-                    valid_boxes.append(box)
-            
-            # Create annotated image with professional styling
-            annotated_image = self._create_professional_annotation(
-                image, valid_boxes, detected_objects, confidence_scores
-            )
-            
-            print(f"✅ OWL-ViT detected {len(detected_objects)} objects: {detected_objects}")
-            return detected_objects, confidence_scores, annotated_image
-            
-        except Exception as e:
-            print(f"⚠️ OWL-ViT detection error: {e}")
-            import traceback
-            traceback.print_exc()
-            return [], [], image
-    
-    # 🎯 ADD THIS: Enhanced deduplication and filtering
-    def deduplicate_objects(self, objects, confidences):
-        """Smart deduplication considering object similarity"""
-        # Group similar objects
-        object_groups = {}
-        for obj, conf in zip(objects, confidences):
-            # Normalize object names
-            base_name = obj.lower()
-            
-            # Group similar terms
-            if any(term in base_name for term in ['mill', 'milling']):
-                group_key = 'milling_machine'
-            elif any(term in base_name for term in ['lathe', 'turning']):
-                group_key = 'lathe'
-            elif any(term in base_name for term in ['hat', 'helmet']):
-                group_key = 'head_protection'
-            elif any(term in base_name for term in ['glasses', 'goggles']):
-                group_key = 'eye_protection'
-            else:
-                group_key = base_name.replace(' ', '_')
-            
-            if group_key not in object_groups:
-                object_groups[group_key] = []
-            object_groups[group_key].append((obj, conf))
-        
-        # Keep highest confidence from each group
-        final_objects = []
-        final_confidences = []
-        
-        for group, items in object_groups.items():
-            best_item = max(items, key=lambda x: x[1])
-            final_objects.append(best_item[0])
-            final_confidences.append(best_item[1])
-        
-        return final_objects, final_confidences
+    return base64.b64decode(image_data_str)
 
-    def _create_professional_annotation(self, image, boxes, objects, scores):
-        """Create publication-quality annotated images"""
-        annotated = image.copy()
-        
-        for box, obj_name, score in zip(boxes, objects, scores):
-            x1, y1, x2, y2 = box.astype(int)
-            
-            # Color coding for different object types
-            if any(tool in obj_name for tool in ["screwdriver", "hammer", "wrench", "drill"]):
-                color = (0, 165, 255)  # Orange for tools
-            elif any(safety in obj_name for safety in ["safety", "gloves", "mask", "hat"]):
-                color = (0, 255, 0)    # Green for safety
-            elif "person" in obj_name:
-                color = (255, 0, 0)    # Red for people
-            else:
-                color = (255, 255, 0)  # Cyan for other objects
-            
-            # Draw professional bounding box
-            cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
-            
-            # Draw label with background
-            label_text = f"{obj_name}: {score:.2f}"
-            text_size = cv2.getTextSize(label_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
-            cv2.rectangle(annotated, (x1, y1-text_size[1]-10), 
-                         (x1+text_size[0], y1), color, -1)
-            cv2.putText(annotated, label_text, (x1, y1-5),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-        
-        return annotated
+def decode_base64_image(image_base64: str) -> Optional[np.ndarray]:
+    """Decode a base64 (optionally data-URL) image into a BGR array"""
+    return decode_image_bytes(base64_image_bytes(image_base64))
 
-# Initialize detection system
-print("🚀 Initializing PhD Industrial AI System...")
-detector = AdvancedIndustrialDetector()
-print("✅ System ready for research!")
+def decode_base64_upload(image_base64: str,
+                         min_side: int = 0) -> Tuple[bytes, Optional[np.ndarray], Optional[Tuple[int, int]]]:
+    """Encoded bytes (stored as the original frame), the decoded BGR array and the full-size (height, width)"""
+    image_data = base64_image_bytes(image_base64)
+    return (image_data, *decode_reduced(image_data, min_side))
+
+def ingest_min_side(profile: SiteProfile, camera: Optional[str]) -> int:
+    """Smallest side an upload may be decoded down to (0 = full resolution)"""
+    if config.TILE_GRID or profile.camera_zones(camera) is not None:
+        return 0
+    return config.REDUCED_DECODE_MIN_SIDE
+
+def encode_jpeg(image_array: np.ndarray) -> bytes:
+    return cv2.imencode(".jpg", image_array)[1].tobytes()
 
 # Pydantic models for API
 class AnalysisRequest(BaseModel):
     image_base64: str
     analysis_type: str = "comprehensive"
+    profile: Optional[str] = None
+    # Camera / station id; cameras with zones in the site profile only analyze those work areas
+    camera: Optional[str] = None
+
+class ZoneGuidance(BaseModel):
+    objects: List[str]
+    task_phase: str
+    anomalies: List[str]
+    next_steps: str
 
 class AnalysisResponse(BaseModel):
     id: str
@@ -240,6 +332,22 @@ class AnalysisResponse(BaseModel):
     safety_assessment: str
     next_steps: str
     image_url: str
+    # Set in two-phase mode: SSE endpoint streaming expert_analysis token by token
+    expert_analysis_stream: Optional[str] = None
+    # Per-stage milliseconds, included with ?timings=true
+    timings_ms: Optional[Dict[str, float]] = None
+    # name@version of the site profile used for detection and affordance rules
+    site_profile: Optional[str] = None
+    # Served from the frame cache: id of the analysis it reuses and the hash distance to it
+    cache_hit: bool = False
+    cached_from: Optional[str] = None
+    cache_distance: Optional[int] = None
+    # Overload or deadline: expert_analysis is the affordance summary instead of the GPT text
+    degraded: bool = False
+    # Camera zones: the zone of each detected object and per-workstation guidance
+    camera: Optional[str] = None
+    object_zones: Optional[List[str]] = None
+    zone_guidance: Optional[Dict[str, ZoneGuidance]] = None
 
 class SystemStatus(BaseModel):
     status: str
@@ -248,148 +356,864 @@ class SystemStatus(BaseModel):
     openai_connected: bool
     total_analyses: int
 
-# Storage
-analysis_history = []
-os.makedirs("static", exist_ok=True)
+class ExpertAnalysisStats(BaseModel):
+    backend: str
+    cache_entries: int
+    hits: int
+    misses: int
+    coalesced: int
+    errors: int
+    in_flight: int
+
+class FrameCacheStats(BaseModel):
+    entries: int
+    bytes: int
+    max_entries: int
+    max_bytes: int
+    max_distance: int
+    hash_bits: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+
+class ImageStoreStats(BaseModel):
+    files: int
+    bytes: int
+    max_bytes: int
+    max_age_s: float
+    stored: int
+    deduplicated: int
+    deleted: int
+    render_cache_entries: int
+    render_cache_bytes: int
+    render_cache_hits: int
+    render_cache_misses: int
+
+class HistoryPage(BaseModel):
+    items: List[AnalysisResponse]
+    next_cursor: Optional[str] = None
+
+class AnalysisCounts(BaseModel):
+    total: int
+    task_phases: Dict[str, int]
+    objects: Dict[str, int]
+    safety: Dict[str, int]
+    ppe_compliance_rate: Optional[float] = None
+
+class StatsBucket(AnalysisCounts):
+    start: str
+
+class AnalysisStats(AnalysisCounts):
+    since: Optional[str] = None
+    until: Optional[str] = None
+    bucket: str
+    buckets: List[StatsBucket]
+
+class ReadinessStatus(BaseModel):
+    state: str
+    ready: bool
+    error: Optional[str] = None
+    load_seconds: Optional[float] = None
+    warmup_seconds: Optional[float] = None
+    cold_latency_ms: Optional[float] = None
+    warm_latency_ms: Optional[float] = None
+
+class SiteProfileInfo(BaseModel):
+    name: str
+    version: str
+    description: str
+    source: Optional[str] = None
+    vocabulary_size: int
+    cameras: List[str] = []
+
+class ZoneInfo(BaseModel):
+    name: str
+    polygon: List[List[float]]
+    task_phases: Optional[List[str]] = None
+    description: str = ""
+
+class CameraZonesInfo(BaseModel):
+    camera: str
+    zones: List[ZoneInfo]
+
+class InferenceEngineStats(BaseModel):
+    queue_depth: int
+    max_queue_depth: int
+    total_batches: int
+    total_items: int
+    mean_batch_size: float
+    batch_size_histogram: Dict[str, int]
+    max_batch_size: int
+    max_wait_ms: float
+    queue_wait_ms: float
+
+class AdmissionStats(BaseModel):
+    in_flight: int
+    max_in_flight: int
+    priority_reserve: int
+    admitted: int
+    rejected: int
+    degraded: bool
+    degraded_entered: int
+    mean_latency_ms: float
 
 @app.get("/", response_model=SystemStatus)
 async def get_system_status():
     """System status for PhD research system"""
+    total_analyses = await asyncio.get_running_loop().run_in_executor(io_executor, history_store.count)
     return SystemStatus(
         status="operational",
-        owlvit_loaded=True,
+        owlvit_loaded=runtime.ready,
         affordance_engine=True,
-        openai_connected=openai.api_key is not None,
-        total_analyses=len(analysis_history)
+        openai_connected=expert_backend is not None and expert_backend.name == "openai",
+        total_analyses=total_analyses
+    )
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of request, stage, detection, cache and process metrics"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/inference/stats", response_model=InferenceEngineStats)
+async def get_inference_stats():
+    """Micro-batching queue depth and batch-size histogram"""
+    return InferenceEngineStats(**require_runtime().engine.stats())
+
+@app.get("/admission/stats", response_model=AdmissionStats)
+async def get_admission_stats():
+    """In-flight analyses, 429 rejections and degraded-mode state"""
+    return AdmissionStats(**admission.stats())
+
+@app.get("/ready", response_model=ReadinessStatus, responses={503: {"model": ReadinessStatus}})
+async def get_readiness():
+    """Model load/warmup state and timings; 503 until warm inference is available"""
+    status = ReadinessStatus(**runtime.status())
+    if not status.ready:
+        return JSONResponse(status_code=503, content=status.dict())
+    return status
+
+@app.get("/profiles", response_model=List[SiteProfileInfo])
+async def get_profiles():
+    """Loaded site profiles and their current versions"""
+    return [SiteProfileInfo(**profile.info()) for profile in profile_registry.profiles()]
+
+@app.get("/profiles/{name}/cameras", response_model=List[CameraZonesInfo])
+async def get_profile_cameras(name: str):
+    """Work-area zones configured per camera in a site profile"""
+    profile = resolve_profile(name)
+    return [CameraZonesInfo(**profile.cameras[camera].info()) for camera in sorted(profile.cameras)]
+
+@app.post("/profiles/reload", response_model=List[SiteProfileInfo])
+async def reload_profiles():
+    """Rescan PROFILE_DIR now instead of waiting for the next poll"""
+    await asyncio.get_running_loop().run_in_executor(io_executor, profile_registry.reload)
+    return [SiteProfileInfo(**profile.info()) for profile in profile_registry.profiles()]
+
+@app.get("/expert/stats", response_model=ExpertAnalysisStats)
+async def get_expert_stats():
+    """Expert analysis cache and coalescing counters"""
+    if expert_service is None:
+        raise HTTPException(status_code=404, detail="Expert analysis backend not configured")
+    return ExpertAnalysisStats(**expert_service.stats())
+
+@app.get("/cache/frames/stats", response_model=FrameCacheStats)
+async def get_frame_cache_stats():
+    """Perceptual-hash frame cache size and hit rate"""
+    if frame_cache is None:
+        raise HTTPException(status_code=404, detail="Frame cache disabled")
+    return FrameCacheStats(**frame_cache.stats())
+
+@app.delete("/cache/frames", response_model=FrameCacheStats)
+async def clear_frame_cache():
+    """Drop every cached frame analysis (e.g. after moving a camera)"""
+    if frame_cache is None:
+        raise HTTPException(status_code=404, detail="Frame cache disabled")
+    frame_cache.invalidate()
+    return FrameCacheStats(**frame_cache.stats())
+
+@app.get("/images/stats", response_model=ImageStoreStats)
+async def get_image_store_stats():
+    """Image store size, deduplication and retention counters, plus the render cache"""
+    return ImageStoreStats(
+        **image_store.stats(),
+        **{f"render_cache_{key}": value for key, value in render_cache.stats().items()}
+    )
+
+@app.get("/images/{analysis_id}/annotated.jpg")
+async def get_annotated_image(analysis_id: str):
+    """
+    Annotated frame of an analysis, rendered from the stored original and
+    detections on first request and then served from the render cache
+    """
+    rendered = render_cache.get(analysis_id)
+    if rendered is None:
+        loop = asyncio.get_running_loop()
+        record = await loop.run_in_executor(io_executor, history_store.get, analysis_id)
+        if record is None or "image_digest" not in record:
+            raise HTTPException(status_code=404, detail="Analysis image not found")
+        image_data = await loop.run_in_executor(io_executor, image_store.get, record["image_digest"])
+        if image_data is None:
+            raise HTTPException(status_code=410, detail="Analysis image removed by the retention policy")
+        rendered = await loop.run_in_executor(
+            cpu_executor, render_annotation_jpeg, image_data,
+            record["boxes"], record["detected_objects"], record["confidence_scores"]
+        )
+        if rendered is None:
+            raise HTTPException(status_code=500, detail="Stored image could not be decoded")
+        render_cache.put(analysis_id, rendered)
+    # Detections of an analysis never change, so clients may cache the rendering forever
+    return Response(rendered, media_type="image/jpeg",
+                    headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@app.get("/images/{analysis_id}/original")
+async def get_original_image(analysis_id: str):
+    """The frame as uploaded, without the detection overlay"""
+    loop = asyncio.get_running_loop()
+    record = await loop.run_in_executor(io_executor, history_store.get, analysis_id)
+    if record is None or "image_digest" not in record:
+        raise HTTPException(status_code=404, detail="Analysis image not found")
+    image_data = await loop.run_in_executor(io_executor, image_store.get, record["image_digest"])
+    if image_data is None:
+        raise HTTPException(status_code=410, detail="Analysis image removed by the retention policy")
+    media_type = "image/png" if image_extension(image_data) == ".png" else "image/jpeg"
+    return Response(image_data, media_type=media_type,
+                    headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@app.get("/history", response_model=HistoryPage)
+async def get_history(
+    limit: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = None,
+    task_phase: Optional[str] = None,
+    detected_object: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+):
+    """Newest-first analysis history with cursor pagination and filters"""
+    try:
+        items, next_cursor = await asyncio.get_running_loop().run_in_executor(
+            io_executor,
+            lambda: history_store.query(
+                limit=limit, cursor=cursor, task_phase=task_phase,
+                detected_object=detected_object, since=since, until=until
+            )
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return HistoryPage(items=items, next_cursor=next_cursor)
+
+@app.get("/stats", response_model=AnalysisStats)
+async def get_stats(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    bucket: str = "hour"
+):
+    """Analysis counts by task phase, detected label and PPE status, per hour / day or in total"""
+    if bucket not in STATS_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(STATS_BUCKETS)}")
+    stats = await asyncio.get_running_loop().run_in_executor(
+        io_executor, lambda: history_store.stats(since=since, until=until, bucket=bucket)
+    )
+    return AnalysisStats(**stats)
+
+@app.get("/history/export")
+async def export_history(
+    format: str = "parquet",
+    since: Optional[str] = None,
+    until: Optional[str] = None
+):
+    """Full history (or a time range) as a streamed Parquet file or Arrow IPC stream"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise HTTPException(status_code=501, detail="History export needs pyarrow (pip install pyarrow)")
+    media_type, extension = EXPORT_FORMATS[format]
+    # Sync generator: Starlette pulls it on its threadpool, one record batch at a time
+    chunks = stream_export(history_store.iter_records(since=since, until=until), format)
+    return StreamingResponse(chunks, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="analysis_history{extension}"'
+    })
+
+@app.get("/history/{analysis_id}", response_model=AnalysisResponse)
+async def get_history_record(analysis_id: str):
+    """Single stored analysis"""
+    record = await asyncio.get_running_loop().run_in_executor(io_executor, history_store.get, analysis_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return record
+
+# Response fields reused verbatim on a frame cache hit
+CACHED_FIELDS = (
+    "detected_objects", "confidence_scores", "task_phase", "expert_analysis",
+    "safety_assessment", "next_steps", "image_url", "site_profile",
+    "camera", "object_zones", "zone_guidance"
+)
+
+async def persist_record(record: Dict):
+    """
+    Queue a history record. With several API workers (serve.py run) the
+    follow-up requests for it (image_url, expert_analysis_stream) may reach
+    another process, which only sees committed rows, so the response waits
+    for the commit; a failed write fails the request instead of handing out
+    an id no other worker can find.
+    """
+    if config.SERVE_WORKERS > 1:
+        await asyncio.get_running_loop().run_in_executor(io_executor, lambda: history_store.add(record, wait=True))
+    else:
+        history_store.add(record)
+
+async def cached_analysis_response(entry: Dict, distance: int, timings: StageTimings,
+                                   include_timings: bool) -> AnalysisResponse:
+    """New history record for a frame cache hit, pointing at the original analysis"""
+    response = AnalysisResponse(
+        id=str(uuid.uuid4()),
+        timestamp=datetime.now().isoformat(),
+        cache_hit=True,
+        cached_from=entry["id"],
+        cache_distance=distance,
+        **{field: entry[field] for field in CACHED_FIELDS}
     )
+    with timings.stage("persist"):
+        await persist_record(response.dict())
+    if include_timings:
+        response.timings_ms = timings.as_dict()
+    logger.info("⚡ Analysis served from frame cache", extra={
+        "analysis_id": response.id,
+        "cached_from": entry["id"],
+        "distance": distance,
+        "site_profile": response.site_profile,
+        "total_ms": round((time.perf_counter() - timings.started) * 1000.0, 1),
+    })
+    return response
+
+def remaining_seconds(deadline: Optional[float]) -> float:
+    return float("inf") if deadline is None else deadline - time.monotonic()
+
+async def run_analysis_pipeline(image_array: np.ndarray, profile: SiteProfile, timings: StageTimings,
+                                stream_expert: bool = False, include_timings: bool = False,
+                                use_cache: bool = True, deadline: Optional[float] = None,
+                                priority: bool = False, image_data: Optional[bytes] = None,
+                                camera: Optional[str] = None,
+                                source_shape: Optional[Tuple[int, int]] = None) -> AnalysisResponse:
+    """
+    Shared analysis pipeline for all upload formats: detection, affordance
+    reasoning, expert analysis, safety assessment and persistence.
+    
+    With stream_expert, the response is returned as soon as detections are
+    ready; expert_analysis holds the affordance summary until the GPT text,
+    streamed via expert_analysis_stream, completes and replaces it in history.
+    
+    Each stage is observed into analysis_stage_duration_seconds; with
+    include_timings the breakdown is also returned as timings_ms.
+    
+    Near-identical frames (same site profile version, perceptual hash within
+    the configured Hamming distance) are answered from the frame cache;
+    use_cache=False forces a fresh analysis, which then refreshes the cache.
+    
+    The frame is stored once in the content-addressed image store (the
+    uploaded image_data as-is, else a JPEG of image_array) and the history
+    record keeps its digest and the boxes; image_url renders the overlay
+    on first GET, so no annotation is drawn here.
+    
+    When the site profile defines zones for the camera, only the zone crops
+    (batched) go through the detector; detections outside every zone are
+    dropped, the rest are tagged with their zone and get per-zone guidance.
+    
+    image_array may be a reduced-scale decode of image_data; source_shape
+    is then the full-size (height, width) the boxes are mapped back to.
+    
+    Under overload (degraded mode) the GPT call is skipped. It is also given
+    up when it would run past the monotonic deadline. priority frames jump
+    the detector queue.
+    """
+    model = require_runtime()
+    loop = asyncio.get_running_loop()
+    logger.debug("📐 Image received", extra={"shape": image_array.shape})
+    
+    zones = profile.camera_zones(camera)
+    # Zones change what is detected, so each zoned camera gets its own cache namespace
+    cache_namespace = f"{profile.key}/{camera}" if zones is not None else profile.key
+    
+    # 0. Perceptual-hash lookup
+    frame_hash = None
+    if frame_cache is not None:
+        with timings.stage("frame_hash"):
+            frame_hash = await loop.run_in_executor(cpu_executor, frame_cache.hash, image_array)
+        if use_cache:
+            cached = frame_cache.lookup(cache_namespace, frame_hash)
+            if cached is not None:
+                _, entry, distance = cached
+                return await cached_analysis_response(entry, distance, timings, include_timings)
+    
+    # 1. Advanced Object Detection with OWL-ViT (queue wait + batched inference)
+    degraded = admission.degraded
+    detect_priority = PRIORITY_HIGH if priority else PRIORITY_NORMAL
+    with timings.stage("detect"):
+        boxes, detected_objects, confidence_scores = await asyncio.wrap_future(model.detect(
+            image_array, profile.vocabulary, boxes_only=True, priority=detect_priority,
+            regions=zones.windows(image_array.shape) if zones is not None else None
+        ))
+    if source_shape is not None:
+        boxes = scale_boxes(boxes, image_array.shape, source_shape)
+    object_zones = None
+    if zones is not None:
+        boxes, detected_objects, confidence_scores, object_zones = zones.select(
+            boxes, detected_objects, confidence_scores, source_shape or image_array.shape
+        )
+    for label in detected_objects:
+        DETECTIONS.inc(label=label)
+    
+    # 2. Affordance Theory Analysis (whole view, then per workstation zone)
+    with timings.stage("guidance"):
+        affordance_guidance = profile.analyzer.generate_guidance(detected_objects)
+        zone_guidance = profile.analyzer.generate_zone_guidance(
+            detected_objects, object_zones, zones.zone_rules()
+        ) if zones is not None else None
+    
+    # 3. Generate Expert Analysis using GPT-4 (cached per object set and phase)
+    expert_wanted = expert_service is not None and bool(detected_objects)
+    stream_expert = stream_expert and expert_wanted and not degraded
+    expert_analysis = affordance_guidance['summary']
+    if expert_wanted and not stream_expert:
+        budget_s = remaining_seconds(deadline) - config.DEADLINE_RESERVE_MS / 1000.0
+        if degraded or budget_s <= 0:
+            degraded = True
+        else:
+            with timings.stage("expert"):
+                try:
+                    expert_analysis = await asyncio.wait_for(
+                        expert_service.analyze(
+                            detected_objects,
+                            affordance_guidance['task_phase'],
+                            fallback=affordance_guidance['summary']
+                        ),
+                        None if budget_s == float("inf") else budget_s
+                    )
+                except asyncio.TimeoutError:
+                    # Out of time: the GPT call is cancelled unless other requests still await it
+                    DEADLINE_EXCEEDED.inc(stage="expert")
+                    degraded = True
+    
+    # 4. Safety Assessment
+    with timings.stage("safety"):
+        safety_assessment = assess_safety(detected_objects)
+    
+    # 5. Save results
+    analysis_id = str(uuid.uuid4())
+    timestamp = datetime.now().isoformat()
+    
+    with timings.stage("store_image"):
+        if image_data is None:
+            image_data = await loop.run_in_executor(cpu_executor, encode_jpeg, image_array)
+        image_digest = await loop.run_in_executor(io_executor, image_store.put, image_data)
+    
+    # 6. Create comprehensive response
+    response = AnalysisResponse(
+        id=analysis_id,
+        timestamp=timestamp,
+        detected_objects=detected_objects,
+        confidence_scores=confidence_scores,
+        task_phase=affordance_guidance['task_phase'],
+        expert_analysis=expert_analysis,
+        safety_assessment=safety_assessment,
+        next_steps=affordance_guidance.get('next_steps', 'Continue with current task sequence'),
+        image_url=f"/images/{analysis_id}/annotated.jpg",
+        expert_analysis_stream=f"/analyze/{analysis_id}/expert/stream" if stream_expert else None,
+        site_profile=profile.key,
+        degraded=degraded,
+        camera=camera,
+        object_zones=object_zones,
+        zone_guidance=zone_guidance
+    )
+    if degraded:
+        DEGRADED_ANALYSES.inc()
+    
+    with timings.stage("persist"):
+        # Digest and boxes are kept for rendering; the response model leaves them out.
+        # expert_pending marks a placeholder expert_analysis until the streamed text replaces it
+        await persist_record({
+            **response.dict(),
+            "image_digest": image_digest,
+            "boxes": np.round(np.asarray(boxes, dtype=np.float32).reshape(-1, 4), 1).tolist(),
+            "expert_pending": stream_expert,
+        })
+    
+    def remember(expert_text: str):
+        # Degraded results are never cached, so the full analysis runs again once load drops
+        if frame_hash is not None and not degraded:
+            entry = response.dict(include={"id", *CACHED_FIELDS})
+            entry["expert_analysis"] = expert_text
+            frame_cache.put(cache_namespace, frame_hash, entry)
+    
+    if stream_expert:
+        # Cached once the streamed text is final, so hits never carry the placeholder summary
+        def on_complete(text: str):
+            # Nothing generated (e.g. cancelled at shutdown): keep the affordance summary
+            if not text:
+                history_store.update(analysis_id, {"expert_pending": False})
+                return
+            history_store.update(analysis_id, {"expert_analysis": text, "expert_pending": False})
+            remember(text)
+        
+        expert_streams.start(
+            analysis_id,
+            expert_service.stream(detected_objects, affordance_guidance['task_phase'], fallback=expert_analysis),
+            on_complete=on_complete
+        )
+    else:
+        remember(expert_analysis)
+    
+    if include_timings:
+        response.timings_ms = timings.as_dict()
+    logger.info("✅ PhD analysis complete", extra={
+        "analysis_id": analysis_id,
+        "objects": len(detected_objects),
+        "task_phase": response.task_phase,
+        "site_profile": profile.key,
+        "camera": camera,
+        "degraded": degraded,
+        "total_ms": round((time.perf_counter() - timings.started) * 1000.0, 1),
+    })
+    
+    return response
+
+def analysis_error(e: Exception) -> HTTPException:
+    """Log an unexpected pipeline failure and convert it to a 500 response"""
+    logger.error("❌ Analysis error", exc_info=e)
+    ANALYSIS_ERRORS.inc(source="pipeline")
+    return HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+@contextmanager
+def admitted(priority: bool):
+    """One admission slot for the request, or 429 with Retry-After when the server is full"""
+    try:
+        with admission.admit(priority):
+            yield
+    except AdmissionRejected as e:
+        logger.warning("🚦 Analysis rejected, server full", extra={
+            "in_flight": admission.in_flight, "priority": priority, "retry_after_s": e.retry_after_s
+        })
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after_s)})
+
+def request_deadline(deadline_ms: Optional[float]) -> float:
+    """Monotonic expiry time: the client's ?deadline_ms=, capped at REQUEST_DEADLINE_MS"""
+    budget_ms = config.REQUEST_DEADLINE_MS if deadline_ms is None else min(deadline_ms, config.REQUEST_DEADLINE_MS)
+    return time.monotonic() + budget_ms / 1000.0
+
+async def within_deadline(analysis, deadline: float) -> AnalysisResponse:
+    """Await an analysis; past the deadline it is cancelled (queued detection, GPT call) and 504 is returned"""
+    try:
+        return await asyncio.wait_for(analysis, max(0.0, remaining_seconds(deadline)))
+    except asyncio.TimeoutError:
+        DEADLINE_EXCEEDED.inc(stage="request")
+        raise HTTPException(status_code=504, detail="Analysis deadline exceeded")
 
 @app.post("/analyze/image", response_model=AnalysisResponse)
-async def analyze_image(request: AnalysisRequest):
+async def analyze_image(request: AnalysisRequest, stream: bool = False, timings: bool = False,
+                        cache: bool = True, deadline_ms: Optional[float] = Query(None, gt=0)):
     """
     PhD Research Method: Comprehensive industrial image analysis
-    combining zero-shot detection with affordance theory
+    combining zero-shot detection with affordance theory.
+    With ?stream=true the expert analysis is delivered over SSE;
+    ?timings=true adds the per-stage timing breakdown;
+    ?cache=false bypasses the near-duplicate frame cache;
+    ?deadline_ms= shortens the request's time budget.
+    analysis_type "safety" takes the priority lane.
     """
+    priority = request.analysis_type == SAFETY_ANALYSIS
     try:
-        print("🔬 Starting PhD-level analysis...")
-        
-        # Decode image
-        image_data_str = request.image_base64
-        if ',' in request.image_base64:
-            _, image_data_str = request.image_base64.split(',', 1)
-        
-        image_data = base64.b64decode(image_data_str)
-        image_array = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
-        
-        if image_array is None:
-            raise HTTPException(status_code=400, detail="Invalid image data")
-        
-        print(f"📐 Image shape: {image_array.shape}")
-        
-        # 1. Advanced Object Detection with OWL-ViT
-        print("🎯 Running zero-shot industrial object detection...")
-        detected_objects, confidence_scores, annotated_frame = detector.detect_objects(image_array)
-        
-        # 🎯 ADD THIS: Enhanced deduplication and filtering
-        detected_objects, confidence_scores = detector.deduplicate_objects(detected_objects, confidence_scores)
-        
-        # 2. Affordance Theory Analysis
-        print("🧠 Applying affordance theory...")
-        affordance_guidance = detector.affordance_analyzer.generate_guidance(detected_objects)
-        
-        # 3. Generate Expert Analysis using GPT-4 with ENHANCED PROMPT
-        if openai.api_key and detected_objects:
-            # 🎯 REPLACE THIS SECTION with enhanced context prompt:
-            expert_prompt = f"""
-            As a PhD-level manufacturing engineer, analyze this industrial workshop image showing {', '.join(detected_objects)}.
-            
-            Focus on:
-            1. Specific manufacturing processes (machining, assembly, welding)
-            2. Workplace safety compliance and PPE usage
-            3. Equipment utilization and workflow efficiency
-            4. Quality control implications
-            
-            Consider the affordance relationships between tools, workers, and tasks.
-            
-            DETECTED OBJECTS: {', '.join(detected_objects)}
-            TASK PHASE: {affordance_guidance['task_phase']}
-            
-            Provide expert-level analysis covering:
-            1. Manufacturing Process Identification:
-               - What specific processes are being performed?
-               - What equipment capabilities are being utilized?
-            
-            2. Safety Protocol Assessment:
-               - PPE compliance status
-               - Potential safety hazards or improvements
-            
-            3. Efficiency Optimization Recommendations:
-               - Workflow improvements
-               - Equipment utilization suggestions
-            
-            4. Quality Assurance Considerations:
-               - Process control measures
-               - Inspection and verification needs
-            
-            Keep response detailed but structured.
-            """
-            
-            try:
-                response = openai.chat.completions.create(
-                    model="gpt-4",
-                    messages=[{"role": "user", "content": expert_prompt}],
-                    max_tokens=500,  # Increased for more detailed analysis
-                    temperature=0.7  # Slightly more creative while staying factual
-                )
-                expert_analysis = response.choices[0].message.content
-                print("✅ Enhanced GPT-4 analysis generated")
-            except Exception as gpt_error:
-                print(f"⚠️ GPT-4 error: {gpt_error}")
-                expert_analysis = affordance_guidance['summary']
-        else:
-            expert_analysis = affordance_guidance['summary']
+        with admitted(priority):
+            deadline = request_deadline(deadline_ms)
+            return await within_deadline(
+                analyze_base64_upload(request, stream, timings, cache, deadline, priority), deadline
+            )
         
-        # 4. Safety Assessment
-        safety_items = [obj for obj in detected_objects if any(
-            safety in obj.lower() for safety in ['safety', 'gloves', 'mask', 'hat', 'protection']
-        )]
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise analysis_error(e)
+
+async def analyze_base64_upload(request: AnalysisRequest, stream: bool, timings: bool, cache: bool,
+                                deadline: float, priority: bool) -> AnalysisResponse:
+    logger.debug("🔬 Starting PhD-level analysis...")
+    stage_timings = StageTimings(STAGE_SECONDS)
+    
+    profile = resolve_profile(request.profile)
+    loop = asyncio.get_running_loop()
+    
+    # Decode image (reduced scale for large JPEGs)
+    with stage_timings.stage("decode"):
+        image_data, image_array, source_shape = await loop.run_in_executor(
+            cpu_executor, decode_base64_upload, request.image_base64, ingest_min_side(profile, request.camera)
+        )
+    
+    if image_array is None:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    
+    return await run_analysis_pipeline(
+        image_array, profile, stage_timings, stream_expert=stream, include_timings=timings,
+        use_cache=cache, deadline=deadline, priority=priority, image_data=image_data, camera=request.camera,
+        source_shape=source_shape
+    )
+
+@app.post("/analyze/image/binary", response_model=AnalysisResponse)
+async def analyze_image_binary(request: Request, stream: bool = False, profile: Optional[str] = None,
+                               timings: bool = False, cache: bool = True,
+                               analysis_type: str = "comprehensive",
+                               deadline_ms: Optional[float] = Query(None, gt=0),
+                               camera: Optional[str] = None):
+    """
+    Binary upload variant of /analyze/image. Accepts multipart/form-data
+    (field "file") or a raw application/octet-stream / image/* body, and
+    decodes the JPEG/PNG bytes straight from the request buffer.
+    """
+    priority = analysis_type == SAFETY_ANALYSIS
+    try:
+        with admitted(priority):
+            deadline = request_deadline(deadline_ms)
+            return await within_deadline(
+                analyze_binary_upload(request, stream, profile, timings, cache, deadline, priority, camera), deadline
+            )
         
-        if safety_items:
-            safety_assessment = f"✅ Safety equipment detected: {', '.join(safety_items)}. Good safety practices observed."
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise analysis_error(e)
+
+async def analyze_binary_upload(request: Request, stream: bool, profile: Optional[str], timings: bool,
+                                cache: bool, deadline: float, priority: bool,
+                                camera: Optional[str] = None) -> AnalysisResponse:
+    logger.debug("🔬 Starting PhD-level analysis (binary upload)...")
+    stage_timings = StageTimings(STAGE_SECONDS)
+    
+    site_profile = resolve_profile(profile)
+    content_type = request.headers.get("content-type", "")
+    with stage_timings.stage("receive"):
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="Missing 'file' upload field")
+            image_data = await upload.read()
         else:
-            safety_assessment = "⚠️ No safety equipment detected. Ensure appropriate PPE for industrial tasks."
-        
-        # 5. Save results
-        analysis_id = str(uuid.uuid4())
-        timestamp = datetime.now().isoformat()
-        
-        image_filename = f"phd_analysis_{analysis_id}.jpg"
-        cv2.imwrite(f"static/{image_filename}", annotated_frame)
-        
-        # 6. Create comprehensive response
-        response = AnalysisResponse(
-            id=analysis_id,
-            timestamp=timestamp,
-            detected_objects=detected_objects,
-            confidence_scores=confidence_scores,
-            task_phase=affordance_guidance['task_phase'],
-            expert_analysis=expert_analysis,
-            safety_assessment=safety_assessment,
-            next_steps=affordance_guidance.get('next_steps', 'Continue with current task sequence'),
-            image_url=f"/static/{image_filename}"
+            image_data = await request.body()
+    
+    if not image_data:
+        raise HTTPException(status_code=400, detail="Empty image body")
+    
+    loop = asyncio.get_running_loop()
+    with stage_timings.stage("decode"):
+        image_array, source_shape = await loop.run_in_executor(
+            cpu_executor, decode_reduced, image_data, ingest_min_side(site_profile, camera)
         )
+    
+    if image_array is None:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    
+    return await run_analysis_pipeline(
+        image_array, site_profile, stage_timings, stream_expert=stream, include_timings=timings,
+        use_cache=cache, deadline=deadline, priority=priority, image_data=image_data, camera=camera,
+        source_shape=source_shape
+    )
+
+def sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/analyze/{analysis_id}/expert/stream")
+async def stream_expert_analysis(analysis_id: str):
+    """
+    Server-Sent Events for a two-phase analysis: one "token" event per
+    generated chunk, then a "done" event carrying the full expert_analysis
+    """
+    stream = expert_streams.get(analysis_id)
+    
+    if stream is None:
+        # Generated by another worker, finished long ago or never streamed: serve the stored text
+        loop = asyncio.get_running_loop()
+        record = await loop.run_in_executor(io_executor, history_store.get, analysis_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Analysis not found")
         
-        analysis_history.append(response.dict())
-        print(f"✅ PhD analysis complete: {analysis_id}")
+        async def stored_events():
+            # Still generating elsewhere: poll the shared store until the final text lands
+            current = record
+            give_up = time.monotonic() + config.EXPERT_STREAM_RETENTION_S
+            while current.get("expert_pending") and time.monotonic() < give_up:
+                await asyncio.sleep(config.EXPERT_STREAM_POLL_INTERVAL_MS / 1000.0)
+                current = await loop.run_in_executor(io_executor, history_store.get, analysis_id) or current
+            yield sse_event("done", {"expert_analysis": current["expert_analysis"]})
+        return StreamingResponse(
+            stored_events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    async def live_events():
+        async for chunk in stream.subscribe():
+            yield sse_event("token", {"text": chunk})
+        yield sse_event("done", {"expert_analysis": stream.text})
+    
+    return StreamingResponse(
+        live_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def analyze_stream_frame(frame, profile: SiteProfile, tracker: Optional[ObjectTracker] = None,
+                               camera: Optional[str] = None) -> Dict:
+    """
+    Lightweight per-frame analysis for live streams: detection, affordance
+    phase and safety status, without the GPT call or disk writes.
+    
+    With a tracker, OWL-ViT only runs on keyframes; other frames move the
+    existing tracks with optical flow, and every object carries a track id.
+    With camera zones, only the zones are detected and objects (or tracks)
+    outside them are left out.
+    """
+    model = require_runtime()
+    loop = asyncio.get_running_loop()
+    timings = StageTimings(STAGE_SECONDS)
+    if not frame:
+        raise ValueError("Empty frame")
+    decode = decode_image_bytes if isinstance(frame, bytes) else decode_base64_image
+    with timings.stage("decode"):
+        image_array = await loop.run_in_executor(cpu_executor, decode, frame)
+    if image_array is None:
+        raise ValueError("Invalid image data")
+    
+    zones = profile.camera_zones(camera)
+    regions = zones.windows(image_array.shape) if zones is not None else None
+    
+    tracking, zoning, object_zones = {}, {}, None
+    if tracker is None:
+        with timings.stage("detect"):
+            boxes, detected_objects, confidence_scores = await asyncio.wrap_future(
+                model.detect(image_array, profile.vocabulary, boxes_only=True, regions=regions)
+            )
+        if zones is not None:
+            _, detected_objects, confidence_scores, object_zones = zones.select(
+                boxes, detected_objects, confidence_scores, image_array.shape
+            )
+        for label in detected_objects:
+            DETECTIONS.inc(label=label)
+    else:
+        keyframe, reason = await loop.run_in_executor(cpu_executor, tracker.needs_detection, image_array)
+        if keyframe:
+            with timings.stage("detect"):
+                boxes, objects, scores = await asyncio.wrap_future(
+                    model.detect(image_array, profile.vocabulary, boxes_only=True, regions=regions)
+                )
+            if zones is not None:
+                boxes, objects, scores, _ = zones.select(boxes, objects, scores, image_array.shape)
+            for label in objects:
+                DETECTIONS.inc(label=label)
+            with timings.stage("track"):
+                tracks = await loop.run_in_executor(cpu_executor, tracker.update, image_array, boxes, objects, scores)
+        else:
+            with timings.stage("track"):
+                tracks = await loop.run_in_executor(cpu_executor, tracker.propagate, image_array)
         
-        return response
+        if zones is not None and tracks:
+            # Tracks that drifted out of every zone are no longer reported
+            assigned = zones.assign(np.stack([track.box for track in tracks]), image_array.shape)
+            tracks = [track for track, zone in zip(tracks, assigned) if zone >= 0]
+            object_zones = [zones.zones[zone].name for zone in assigned if zone >= 0]
+        elif zones is not None:
+            object_zones = []
         
+        detected_objects = [track.label for track in tracks]
+        confidence_scores = [float(track.score) for track in tracks]
+        tracking = {
+            "keyframe": keyframe,
+            "keyframe_reason": reason,
+            "tracks": [track.to_dict(tracker.frame_index, image_array.shape) for track in tracks],
+            "tracker": tracker.stats(),
+        }
+    
+    with timings.stage("guidance"):
+        affordance_guidance = profile.analyzer.generate_guidance(detected_objects)
+        if zones is not None:
+            zoning = {
+                "object_zones": object_zones,
+                "zone_guidance": profile.analyzer.generate_zone_guidance(
+                    detected_objects, object_zones, zones.zone_rules()
+                ),
+            }
+    
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "detected_objects": detected_objects,
+        "confidence_scores": confidence_scores,
+        "task_phase": affordance_guidance['task_phase'],
+        "safety_assessment": assess_safety(detected_objects),
+        "next_steps": affordance_guidance.get('next_steps', 'Continue with current task sequence'),
+        "site_profile": profile.key,
+        "camera": camera,
+        **tracking,
+        **zoning,
+    }
+
+@app.websocket("/ws/stream")
+async def stream_analysis(websocket: WebSocket, profile: Optional[str] = None,
+                          track: bool = config.TRACKING_ENABLED, camera: Optional[str] = None):
+    """
+    Live monitoring: the client pushes JPEG frames (binary messages, or
+    base64 data URLs as text) and receives detections for the most recent
+    frame whenever the detector is free. Stale frames are dropped.
+    ?profile= selects the site profile; each frame uses its current version.
+    ?track=false runs the detector on every analyzed frame instead of
+    tracking between keyframes. ?camera= applies that camera's zones.
+    Each analyzed frame takes an admission slot and the request deadline
+    like an /analyze/image call; when the server is full or the deadline
+    passes, the frame is dropped and the client gets a "dropped" message.
+    """
+    if profile_registry.get(profile) is None:
+        await websocket.close(code=1008, reason=f"Unknown site profile: {profile}")
+        return
+    await websocket.accept()
+    logger.info("📹 Live stream session started", extra={"site_profile": profile, "camera": camera})
+    
+    async def receive_frame():
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return None
+        # An empty binary frame is an invalid frame, not the end of the session
+        return message.get("bytes") if message.get("bytes") is not None else message.get("text")
+    
+    tracker = ObjectTracker(
+        keyframe_interval=config.TRACK_KEYFRAME_INTERVAL,
+        scene_change_threshold=config.TRACK_SCENE_CHANGE_THRESHOLD,
+        iou_threshold=config.TRACK_IOU_THRESHOLD,
+        max_misses=config.TRACK_MAX_MISSES
+    ) if track else None
+    
+    async def analyze_frame(frame):
+        try:
+            with admission.admit():
+                return await asyncio.wait_for(
+                    analyze_stream_frame(frame, resolve_profile(profile), tracker, camera),
+                    config.REQUEST_DEADLINE_MS / 1000.0
+                )
+        except AdmissionRejected as e:
+            raise FrameDropped(str(e))
+        except asyncio.TimeoutError:
+            DEADLINE_EXCEEDED.inc(stage="stream")
+            raise FrameDropped("Analysis deadline exceeded")
+        except Exception:
+            ANALYSIS_ERRORS.inc(source="stream")
+            raise
+    
+    session = StreamSession(analyze_frame, websocket.send_json, on_frame_dropped=STREAM_FRAMES_DROPPED.inc)
+    try:
+        await session.run(receive_frame)
     except Exception as e:
-        print(f"❌ Analysis error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+        logger.warning("⚠️ Live stream error", extra={"error": str(e)})
+    
+    logger.info("📹 Live stream session ended", extra=session.stats())
 
-# Mount static files
+# Mount static files (annotated images of analyses made before the image store)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 if __name__ == "__main__":
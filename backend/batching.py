@@ -0,0 +1,152 @@
+# Dynamic micro-batching for OWL-ViT inference
+
+import itertools
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+# Queue lanes: lower values are dispatched first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+_SHUTDOWN_PRIORITY = 2
+
+
+class BatchingInferenceEngine:
+    """
+    Groups concurrent detection requests into a single batched forward pass.
+    
+    Requests are queued and dispatched when either max_batch_size items are
+    waiting or the oldest item has waited max_wait_ms. Each caller receives
+    a Future resolved with its own slice of the batch results.
+    
+    High-priority items (safety checks) are taken ahead of normal ones;
+    cancelled futures are dropped when their batch is dispatched.
+    """
+    
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 16, max_wait_ms: float = 20.0, wait_ewma_alpha: float = 0.2,
+                 wait_half_life_s: float = 0.5):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        
+        self.wait_ewma_alpha = wait_ewma_alpha
+        self.wait_half_life_s = wait_half_life_s
+        
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._queue_wait_ms = 0.0
+        self._queue_wait_updated = time.monotonic()
+        self._stats_lock = threading.Lock()
+        self._batch_size_histogram = Counter()
+        self._total_batches = 0
+        self._total_items = 0
+        self._max_queue_depth = 0
+        self._running = True
+        
+        self._worker = threading.Thread(target=self._run, name="owlvit-batcher", daemon=True)
+        self._worker.start()
+    
+    def submit(self, item: Any, priority: int = PRIORITY_NORMAL) -> Future:
+        """Queue one item for inference and return a Future for its result"""
+        future = Future()
+        self._queue.put((priority, next(self._sequence), time.monotonic(), item, future))
+        
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+        return future
+    
+    def _collect_batch(self):
+        """Block for the first item, then gather more until full or its wait budget runs out"""
+        first = self._queue.get()
+        if first[0] == _SHUTDOWN_PRIORITY:
+            return None
+        
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry[0] == _SHUTDOWN_PRIORITY:
+                self._running = False
+                break
+            batch.append(entry)
+        return batch
+    
+    def _run(self):
+        while self._running:
+            batch = self._collect_batch()
+            if batch is None:
+                break
+            
+            # Skip callers that gave up (or hit their deadline) while queued
+            dispatched_at = time.monotonic()
+            batch = [(item, future, enqueued_at) for _, _, enqueued_at, item, future in batch
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            
+            with self._stats_lock:
+                self._queue_wait_ms = self._decayed_wait_ms(dispatched_at)
+                for _, _, enqueued_at in batch:
+                    wait_ms = (dispatched_at - enqueued_at) * 1000.0
+                    self._queue_wait_ms += self.wait_ewma_alpha * (wait_ms - self._queue_wait_ms)
+                self._queue_wait_updated = dispatched_at
+            
+            try:
+                results = self.batch_fn([item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            
+            with self._stats_lock:
+                self._batch_size_histogram[len(batch)] += 1
+                self._total_batches += 1
+                self._total_items += len(batch)
+    
+    def _decayed_wait_ms(self, now: float) -> float:
+        return self._queue_wait_ms * 0.5 ** ((now - self._queue_wait_updated) / self.wait_half_life_s)
+    
+    def queue_wait_ms(self) -> float:
+        """
+        Current queue latency: the age of the oldest waiting item, or the moving
+        average wait of recently dispatched items (halving every
+        wait_half_life_s without dispatches), whichever is larger
+        """
+        now = time.monotonic()
+        with self._queue.mutex:
+            oldest = min((entry[2] for entry in self._queue.queue), default=now)
+        with self._stats_lock:
+            recent = self._decayed_wait_ms(now)
+        return max((now - oldest) * 1000.0, recent)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and batch-size distribution for tuning"""
+        queue_wait_ms = self.queue_wait_ms()
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "total_batches": self._total_batches,
+                "total_items": self._total_items,
+                "mean_batch_size": self._total_items / self._total_batches if self._total_batches else 0.0,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_size_histogram.items())},
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_wait_ms": queue_wait_ms,
+            }
+    
+    def shutdown(self):
+        """Stop the worker after it drains the items already queued"""
+        self._queue.put((_SHUTDOWN_PRIORITY, next(self._sequence), time.monotonic(), None, None))
+        self._worker.join()
@@ -0,0 +1,335 @@
+# Stage-level latency/throughput benchmark of the analysis pipeline (CPU, stub LLM, JSON report)
+#
+#   python benchmark.py [--resolutions 640x480,1280x720,1920x1080,3840x2160] [--batch-sizes 1,4,8]
+#                       [--images DIR] [--runs 20] [--warmup 3] [--output bench.json]
+#                       [--baseline previous.json --max-regression 0.2]
+#
+# Each iteration pushes one batch through the same stages as /analyze/image:
+# base64 decode, reduced-scale imdecode, direct-to-tensor preprocessing, model forward,
+# box decoding, synonym-grouped NMS (dedup), generate_guidance, the expert analysis call
+# (deterministic StubExpertBackend), annotation rendering and cv2.imwrite.
+#
+# Per input set, the "ingest" section compares bytes -> pixel_values per frame on the old
+# path (full imdecode, BGR->RGB, PIL, OwlViTProcessor) and the fast one, in time and in peak
+# traced memory (numpy / OpenCV buffers; PIL's own pixel buffers are not traced, so the old
+# path's real peak is higher still).
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+import config
+from logging_setup import configure_logging
+from affordance_analyzer import assess_safety
+from expert_analysis import StubExpertBackend, build_expert_prompt
+from model_tools import load_images, synthetic_images
+from object_detection import AdvancedIndustrialDetector
+from postprocessing import decode_detections, grouped_nms
+from preprocessing import decode_reduced
+
+# Stage name -> whether one sample covers a whole batch (otherwise one image)
+STAGES = {
+    "base64_decode": False,
+    "imdecode": False,
+    "preprocess": True,
+    "forward": True,
+    "postprocess": True,
+    "dedup": True,
+    "guidance": False,
+    "expert_stub": False,
+    "annotation": False,
+    "imwrite": False,
+}
+
+
+class StageTimer:
+    """Collects wall-clock samples (ms) per stage"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        yield
+        self.samples[name].append((time.perf_counter() - start) * 1000.0)
+
+    def reset(self):
+        self.samples.clear()
+
+
+def summarize(samples: List[float], items_per_sample: int) -> Dict[str, float]:
+    """Latency percentiles per sample and items processed per second"""
+    values = np.asarray(samples)
+    mean_ms = float(values.mean())
+    return {
+        "samples": len(values),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": mean_ms,
+        "throughput_per_s": items_per_sample * 1000.0 / mean_ms if mean_ms > 0 else 0.0,
+    }
+
+
+def encode_inputs(images: List[np.ndarray]) -> List[str]:
+    """JPEG + base64, the payload format of /analyze/image"""
+    encoded = []
+    for image in images:
+        ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        encoded.append(base64.b64encode(buffer.tobytes()).decode("ascii"))
+    return encoded
+
+
+def run_batch(detector: AdvancedIndustrialDetector, payloads: List[str], timer: StageTimer,
+              expert_backend: StubExpertBackend, loop: asyncio.AbstractEventLoop, output_dir: str):
+    """One pass of the pipeline over a batch of base64 payloads, timing every stage"""
+    vocabulary = detector.manufacturing_vocabulary
+
+    # 1. Decode (large JPEGs at reduced scale, as the upload endpoints do)
+    images = []
+    for payload in payloads:
+        with timer.stage("base64_decode"):
+            data = base64.b64decode(payload)
+        with timer.stage("imdecode"):
+            image, _ = decode_reduced(data, detector.input_size)
+        images.append(image)
+
+    # 2. Batched model stages
+    with timer.stage("preprocess"):
+        pixel_values = torch.from_numpy(detector.pixel_values_builder(images))
+    with timer.stage("forward"):
+        outputs = detector.predict(pixel_values, vocabulary)
+    with timer.stage("postprocess"):
+        target_sizes = torch.Tensor([image.shape[:2] for image in images])
+        decoded = decode_detections(outputs.logits, outputs.pred_boxes, target_sizes, detector.score_threshold)
+    with timer.stage("dedup"):
+        group_ids = detector.get_synonym_groups(vocabulary)
+        detections = []
+        for boxes, scores, labels in decoded:
+            keep = grouped_nms(boxes, scores, group_ids[labels], detector.nms_iou_threshold)
+            detections.append((boxes[keep].numpy(), scores[keep].numpy(), labels[keep].numpy()))
+
+    # 3. Per-image reasoning, expert analysis and output
+    for index, (image, (boxes, scores, labels)) in enumerate(zip(images, detections)):
+        objects = [vocabulary[label] for label in labels]
+        with timer.stage("guidance"):
+            guidance = detector.affordance_analyzer.generate_guidance(objects)
+            assess_safety(objects)
+        with timer.stage("expert_stub"):
+            loop.run_until_complete(expert_backend.complete(build_expert_prompt(objects, guidance["task_phase"])))
+        with timer.stage("annotation"):
+            annotated = detector._create_professional_annotation(image, boxes, objects, scores.tolist())
+        with timer.stage("imwrite"):
+            cv2.imwrite(os.path.join(output_dir, f"bench_{index}.jpg"), annotated)
+
+
+def benchmark_case(detector, images: List[np.ndarray], batch_size: int, runs: int, warmup: int,
+                   expert_backend, loop, output_dir: str) -> Dict[str, Any]:
+    payloads = encode_inputs(images)
+    timer = StageTimer()
+    end_to_end = []
+
+    for iteration in range(warmup + runs):
+        start = (iteration * batch_size) % len(payloads)
+        batch = [payloads[(start + i) % len(payloads)] for i in range(batch_size)]
+        if iteration == warmup:
+            timer.reset()
+        started = time.perf_counter()
+        run_batch(detector, batch, timer, expert_backend, loop, output_dir)
+        if iteration >= warmup:
+            end_to_end.append((time.perf_counter() - started) * 1000.0)
+
+    stages = {
+        name: dict(summarize(timer.samples[name], batch_size if per_batch else 1),
+                   unit="batch" if per_batch else "image")
+        for name, per_batch in STAGES.items()
+    }
+    return {
+        "stages": stages,
+        "end_to_end": dict(summarize(end_to_end, batch_size), unit="batch"),
+    }
+
+
+def legacy_ingest(detector, data: bytes) -> torch.Tensor:
+    """Frame bytes -> pixel_values the way the detector did before the fast path"""
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    return detector.processor(images=[pil_image], return_tensors="pt")["pixel_values"]
+
+
+def fast_ingest(detector, data: bytes) -> torch.Tensor:
+    image, _ = decode_reduced(data, detector.input_size)
+    return torch.from_numpy(detector.pixel_values_builder([image]))
+
+
+def ingest_case(detector, images: List[np.ndarray], runs: int, warmup: int) -> Dict[str, Any]:
+    """Per-frame time and peak traced memory of the old and the fast ingest path, plus their output difference"""
+    payloads = [base64.b64decode(payload) for payload in encode_inputs(images)]
+    result = {}
+    for name, ingest in (("legacy", legacy_ingest), ("fast", fast_ingest)):
+        samples = []
+        for iteration in range(warmup + runs):
+            started = time.perf_counter()
+            ingest(detector, payloads[iteration % len(payloads)])
+            if iteration >= warmup:
+                samples.append((time.perf_counter() - started) * 1000.0)
+
+        # Memory in separate passes: tracing slows allocations down
+        peaks = []
+        for data in payloads:
+            tracemalloc.start()
+            ingest(detector, data)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        result[name] = dict(summarize(samples, 1), peak_traced_mb=max(peaks) / 2 ** 20, unit="image")
+
+    decoded, _ = decode_reduced(payloads[0], detector.input_size)
+    result["decoded_shape"] = {"legacy": list(images[0].shape), "fast": list(decoded.shape)}
+    result["max_abs_diff"] = float((legacy_ingest(detector, payloads[0])
+                                    - fast_ingest(detector, payloads[0])).abs().max())
+    result["speedup"] = result["legacy"]["p50_ms"] / result["fast"]["p50_ms"] if result["fast"]["p50_ms"] > 0 else 0.0
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Print p50 ratios against a previous report; returns the stages slower than allowed"""
+    previous = {(case["input"], case["batch_size"]): case for case in baseline.get("cases", [])}
+    regressions = []
+    for case in report["cases"]:
+        before = previous.get((case["input"], case["batch_size"]))
+        if before is None:
+            continue
+        for name, stats in list(case["stages"].items()) + [("end_to_end", case["end_to_end"])]:
+            old_stats = before["stages"].get(name) if name != "end_to_end" else before.get("end_to_end")
+            if not old_stats or old_stats["p50_ms"] <= 0:
+                continue
+            ratio = stats["p50_ms"] / old_stats["p50_ms"]
+            marker = "❌" if ratio > 1.0 + max_regression else "  "
+            print(f"{marker} {case['input']:>10} b{case['batch_size']:<3} {name:<14} "
+                  f"{old_stats['p50_ms']:9.2f} -> {stats['p50_ms']:9.2f} ms  x{ratio:.2f}")
+            if ratio > 1.0 + max_regression:
+                regressions.append(f"{case['input']}/b{case['batch_size']}/{name}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stage-level benchmark of the analysis pipeline")
+    parser.add_argument("--resolutions", default="640x480,1280x720,1920x1080,3840x2160", help="Synthetic input sizes (WxH)")
+    parser.add_argument("--batch-sizes", default="1,4,8")
+    parser.add_argument("--images", help="Directory of recorded images, benchmarked as an extra input set")
+    parser.add_argument("--synthetic-count", type=int, default=8, help="Synthetic images per resolution")
+    parser.add_argument("--runs", type=int, default=20, help="Timed iterations per case")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--backend", default=config.DETECTOR_BACKEND)
+    parser.add_argument("--threads", type=int, default=config.TORCH_NUM_THREADS)
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="Simulated LLM latency")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="Previous JSON report to compare p50 latencies against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="With --baseline, exit non-zero if a stage's p50 grows by more than this fraction")
+    args = parser.parse_args()
+    configure_logging(config.LOG_LEVEL, "text")
+
+    # 1. Fixed seeds and a fixed thread count keep runs comparable between commits
+    torch.manual_seed(0)
+    detector = AdvancedIndustrialDetector(
+        backend=args.backend,
+        num_threads=args.threads,
+        onnx_path=config.ONNX_MODEL_PATH,
+        score_threshold=config.DETECTION_SCORE_THRESHOLD,
+        nms_iou_threshold=config.NMS_IOU_THRESHOLD
+    )
+    expert_backend = StubExpertBackend(latency_ms=args.stub_latency_ms)
+    loop = asyncio.new_event_loop()
+
+    input_sets = []
+    for resolution in args.resolutions.split(","):
+        width, height = (int(value) for value in resolution.lower().split("x"))
+        input_sets.append((resolution, synthetic_images(args.synthetic_count, size=(height, width))))
+    if args.images:
+        recorded = load_images(args.images)
+        if not recorded:
+            raise SystemExit(f"No images found in {args.images}")
+        input_sets.append(("recorded", recorded))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+            "backend": detector.backend.name,
+            "vocabulary_size": len(detector.manufacturing_vocabulary),
+            "runs": args.runs,
+            "warmup": args.warmup,
+            "stub_latency_ms": args.stub_latency_ms,
+        },
+        "cases": [],
+        "ingest": [],
+    }
+
+    # 2. Every input set at every batch size
+    with tempfile.TemporaryDirectory() as output_dir:
+        for input_name, images in input_sets:
+            ingest = ingest_case(detector, images, args.runs, args.warmup)
+            report["ingest"].append({"input": input_name, **ingest})
+            print(f"📥 {input_name} ingest p50: {ingest['legacy']['p50_ms']:.1f} -> {ingest['fast']['p50_ms']:.1f} ms/frame "
+                  f"(x{ingest['speedup']:.2f}), peak traced {ingest['legacy']['peak_traced_mb']:.1f} -> "
+                  f"{ingest['fast']['peak_traced_mb']:.1f} MB")
+            for batch_size in (int(value) for value in args.batch_sizes.split(",")):
+                print(f"⏱️ {input_name} batch={batch_size}...")
+                case = benchmark_case(detector, images, batch_size, args.runs, args.warmup,
+                                      expert_backend, loop, output_dir)
+                case.update({"input": input_name, "batch_size": batch_size})
+                report["cases"].append(case)
+                summary = ", ".join(f"{name} {stats['p50_ms']:.1f}" for name, stats in case["stages"].items())
+                print(f"   p50 ms: {summary}")
+                print(f"   end-to-end {case['end_to_end']['throughput_per_s']:.2f} images/s")
+    loop.close()
+
+    # 3. Report and optional regression check
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.max_regression)
+        if regressions:
+            raise SystemExit(f"p50 regressions over {args.max_regression:.0%}: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+# Offline bulk analysis of image directories and recorded videos (no API server, no OpenAI key)
+#
+#   python bulk_analysis.py INPUT [INPUT ...] --output results.jsonl [--stride 15] [--workers 2]
+#                           [--batch-size 8] [--format jsonl|parquet] [--annotated-dir DIR]
+#                           [--profile NAME] [--manifest PATH] [--report report.json]
+#                           [--tiles 3x2 --tile-overlap 0.2]
+#
+# Runs detection, affordance guidance and the safety assessment used by /analyze/image;
+# the expert analysis field carries the affordance summary, as it does without an API key.
+# Completed work units are recorded in a checkpoint manifest, so rerunning the same command
+# after an interruption only processes what is left.
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import config
+from logging_setup import configure_logging
+from affordance_analyzer import assess_safety
+from annotation import draw_detections
+from site_profiles import ProfileRegistry
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v")
+
+# Per-process state, created once by init_worker
+_worker: Dict[str, Any] = {}
+
+
+def discover_inputs(inputs: List[str]) -> Tuple[List[str], List[str]]:
+    """Sorted image and video files under the given files/directories"""
+    images, videos = [], []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths = [os.path.join(root, name) for root, _, names in os.walk(item) for name in names]
+        else:
+            paths = [item]
+        for path in paths:
+            extension = os.path.splitext(path)[1].lower()
+            if extension in IMAGE_EXTENSIONS:
+                images.append(path)
+            elif extension in VIDEO_EXTENSIONS:
+                videos.append(path)
+    return sorted(set(images)), sorted(set(videos))
+
+
+def video_units(path: str, segment_frames: int) -> List[str]:
+    """Split a video into "path@start:end" source-frame ranges (one range when the length is unknown)"""
+    capture = cv2.VideoCapture(path)
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) if capture.isOpened() else 0
+    capture.release()
+    if frame_count <= 0:
+        return [f"{path}@0:"]
+    return [
+        f"{path}@{start}:{min(start + segment_frames, frame_count)}"
+        for start in range(0, frame_count, segment_frames)
+    ]
+
+
+def plan_work(images: List[str], videos: List[str], segment_frames: int, images_per_task: int) -> List[List[str]]:
+    """Group unit keys into pool tasks: chunks of images, one task per video segment"""
+    tasks = [images[i:i + images_per_task] for i in range(0, len(images), images_per_task)]
+    for video in videos:
+        tasks.extend([unit] for unit in video_units(video, segment_frames))
+    return tasks
+
+
+def iter_unit_frames(unit: str, stride: int) -> Iterator[Tuple[str, int, Optional[float], np.ndarray]]:
+    """Yield (source, frame_index, timestamp_s, frame) for an image path or a video segment key"""
+    if os.path.splitext(unit)[1].lower() in IMAGE_EXTENSIONS:
+        image = cv2.imread(unit, cv2.IMREAD_COLOR)
+        if image is not None:
+            yield unit, 0, None, image
+        return
+
+    path, frame_range = unit.rsplit("@", 1)
+    start, end = frame_range.split(":")
+    start, end = int(start), (int(end) if end else None)
+
+    capture = cv2.VideoCapture(path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+    if start:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+    try:
+        index = start
+        while end is None or index < end:
+            # Frames between strides are only grabbed (demuxed), never decoded to BGR
+            if index % stride == 0:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield path, index, (index / fps if fps else None), frame
+            elif not capture.grab():
+                break
+            index += 1
+    finally:
+        capture.release()
+
+
+def init_worker(backend: str, num_threads: int, profile_dir: str, profile_name: Optional[str],
+                annotated_dir: Optional[str], tiles: Optional[str] = None,
+                tile_overlap: float = config.TILE_OVERLAP):
+    """Load the detector and site profile once per worker process"""
+    from object_detection import AdvancedIndustrialDetector
+    from tiling import parse_tile_grid
+
+    configure_logging(config.LOG_LEVEL, "text")
+
+    profile = ProfileRegistry(profile_dir, reload_interval_s=0).get(profile_name)
+    if profile is None:
+        raise ValueError(f"Unknown site profile: {profile_name}")
+
+    _worker["detector"] = AdvancedIndustrialDetector(
+        backend=backend,
+        num_threads=num_threads,
+        onnx_path=config.ONNX_MODEL_PATH,
+        vocabulary=profile.vocabulary,
+        score_threshold=config.DETECTION_SCORE_THRESHOLD,
+        nms_iou_threshold=config.NMS_IOU_THRESHOLD,
+        tile_grid=parse_tile_grid(tiles),
+        tile_overlap=tile_overlap,
+        tile_min_side=config.TILE_MIN_SIDE
+    )
+    _worker["profile"] = profile
+    _worker["annotated_dir"] = annotated_dir
+
+
+def annotated_filename(source: str, frame_index: int) -> str:
+    """Readable stem plus a hash of the full source path, so camA/0001.jpg and camB/0001.jpg (or x.mp4 and x.jpg) never collide"""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    digest = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:10]
+    return f"{stem}_{digest}_{frame_index:06d}.jpg"
+
+
+def analyze_frames(frames: List[Tuple[str, int, Optional[float], np.ndarray]]) -> List[Dict[str, Any]]:
+    """One batched detector pass and one batched guidance pass for a list of frames"""
+    detector, profile = _worker["detector"], _worker["profile"]
+    annotated_dir = _worker["annotated_dir"]
+
+    # Boxes only: overlays are drawn just for the frames that get written out. A model failure fails
+    # the task (so its units are retried on resume) instead of recording frames with no detections
+    detections = detector.detect_boxes_batch([frame for *_, frame in frames], profile.vocabulary, raise_errors=True)
+    guidance = profile.analyzer.generate_guidance_batch([objects for _, objects, _ in detections])
+
+    records = []
+    for (source, frame_index, timestamp_s, frame), (boxes, objects, scores), frame_guidance in zip(frames, detections, guidance):
+        record = {
+            "source": source,
+            "frame_index": frame_index,
+            "timestamp_s": timestamp_s,
+            "detected_objects": objects,
+            "confidence_scores": scores,
+            "task_phase": frame_guidance["task_phase"],
+            "expert_analysis": frame_guidance["summary"],
+            "safety_assessment": assess_safety(objects),
+            "next_steps": frame_guidance.get("next_steps", "Continue with current task sequence"),
+            "anomalies": frame_guidance["anomalies"],
+            "site_profile": profile.key,
+            "annotated_path": None,
+        }
+        if annotated_dir:
+            path = os.path.join(annotated_dir, annotated_filename(source, frame_index))
+            cv2.imwrite(path, draw_detections(frame, boxes, objects, scores))
+            record["annotated_path"] = path
+        records.append(record)
+    return records
+
+
+def process_task(units: List[str], stride: int, batch_size: int) -> Dict[str, Any]:
+    """Worker entry point: analyze every frame of the task's units in detector batches"""
+    started = time.perf_counter()
+    records, pending = [], []
+    for unit in units:
+        for frame in iter_unit_frames(unit, stride):
+            pending.append(frame)
+            if len(pending) >= batch_size:
+                records.extend(analyze_frames(pending))
+                pending = []
+    if pending:
+        records.extend(analyze_frames(pending))
+    return {"units": units, "records": records, "seconds": time.perf_counter() - started, "pid": os.getpid()}
+
+
+class ResultWriter:
+    """Append-only JSONL file, or one Parquet part file per task in an output directory"""
+
+    def __init__(self, output: str, output_format: str):
+        self.output = output
+        self.output_format = output_format
+        self.parts = 0
+        if output_format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise SystemExit("Parquet output needs pyarrow (pip install pyarrow)")
+            os.makedirs(output, exist_ok=True)
+            self.parts = len([name for name in os.listdir(output) if name.endswith(".parquet")])
+        else:
+            directory = os.path.dirname(output)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def write(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        if self.output_format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            schema = pa.schema([
+                ("source", pa.string()), ("frame_index", pa.int64()), ("timestamp_s", pa.float64()),
+                ("detected_objects", pa.list_(pa.string())), ("confidence_scores", pa.list_(pa.float64())),
+                ("task_phase", pa.string()), ("expert_analysis", pa.string()), ("safety_assessment", pa.string()),
+                ("next_steps", pa.string()), ("anomalies", pa.list_(pa.string())), ("site_profile", pa.string()),
+                ("annotated_path", pa.string()),
+            ])
+            path = os.path.join(self.output, f"part-{self.parts:06d}.parquet")
+            pq.write_table(pa.Table.from_pylist(records, schema=schema), path)
+            self.parts += 1
+        else:
+            with open(self.output, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+class CheckpointManifest:
+    """
+    JSONL manifest of completed unit keys. The first line records the run
+    settings; resuming with different settings is refused so one output
+    never mixes incompatible results. A unit is marked done only after its
+    records are durably written (at-least-once: a crash between the two
+    steps can repeat that unit's rows).
+    """
+
+    def __init__(self, path: str, settings: Dict[str, Any]):
+        self.path = path
+        self.done = set()
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                lines = [json.loads(line) for line in f if line.strip()]
+            if lines and lines[0].get("settings") != settings:
+                raise SystemExit(
+                    f"Manifest {path} was written with different settings {lines[0].get('settings')}; "
+                    f"use the same options or a new --manifest"
+                )
+            for line in lines[1:]:
+                self.done.update(line.get("units", []))
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"settings": settings}) + "\n")
+
+    def mark_done(self, units: List[str], frames: int, seconds: float):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"units": units, "frames": frames, "seconds": round(seconds, 3)}) + "\n")
+        self.done.update(units)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline bulk analysis of images and videos")
+    parser.add_argument("inputs", nargs="+", help="Image/video files or directories (searched recursively)")
+    parser.add_argument("--output", required=True, help="JSONL file, or directory for --format parquet")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    parser.add_argument("--stride", type=int, default=1, help="Analyze every Nth video frame")
+    parser.add_argument("--segment-frames", type=int, default=3000, help="Video frames per resumable work unit")
+    parser.add_argument("--images-per-task", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=config.BATCH_MAX_SIZE, help="Frames per detector pass")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes (0 = run in this process)")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Intra-op threads per worker (0 = CPU count divided across workers)")
+    parser.add_argument("--backend", default=config.DETECTOR_BACKEND)
+    parser.add_argument("--profile", default=config.DEFAULT_PROFILE, help="Site profile name")
+    parser.add_argument("--profile-dir", default=config.PROFILE_DIR)
+    parser.add_argument("--annotated-dir", help="Also write annotated JPEGs here")
+    parser.add_argument("--manifest", help="Checkpoint manifest (default: <output>.manifest.jsonl)")
+    parser.add_argument("--report", help="Write the throughput report as JSON")
+    parser.add_argument("--tiles", default=config.TILE_GRID,
+                        help="Tiled inference grid COLSxROWS for frames >= TILE_MIN_SIDE px (empty = off)")
+    parser.add_argument("--tile-overlap", type=float, default=config.TILE_OVERLAP)
+    args = parser.parse_args()
+    if args.stride < 1:
+        parser.error("--stride must be at least 1")
+    if args.segment_frames < 1:
+        parser.error("--segment-frames must be at least 1")
+    configure_logging(config.LOG_LEVEL, "text")
+
+    # 1. Discover inputs and skip units finished by a previous run
+    images, videos = discover_inputs(args.inputs)
+    if not images and not videos:
+        raise SystemExit("No images or videos found")
+
+    profile = ProfileRegistry(args.profile_dir, reload_interval_s=0).get(args.profile)
+    if profile is None:
+        raise SystemExit(f"Unknown site profile: {args.profile}")
+
+    settings = {"stride": args.stride, "segment_frames": args.segment_frames, "site_profile": profile.key,
+                "backend": args.backend, "format": args.format}
+    if args.tiles:
+        settings.update(tiles=args.tiles, tile_overlap=args.tile_overlap)
+    manifest = CheckpointManifest(args.manifest or f"{args.output.rstrip('/')}.manifest.jsonl", settings)
+    tasks = [
+        [unit for unit in task if unit not in manifest.done]
+        for task in plan_work(images, videos, args.segment_frames, args.images_per_task)
+    ]
+    tasks = [task for task in tasks if task]
+    print(f"📂 {len(images)} images, {len(videos)} videos -> {len(tasks)} tasks "
+          f"({len(manifest.done)} units already done)")
+    if not tasks:
+        print("✅ Nothing left to do")
+        return
+
+    if args.annotated_dir:
+        os.makedirs(args.annotated_dir, exist_ok=True)
+    writer = ResultWriter(args.output, args.format)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    worker_args = (args.backend, threads, args.profile_dir, args.profile, args.annotated_dir,
+                   args.tiles, args.tile_overlap)
+
+    # 2. Fan tasks out to the workers; results are written and checkpointed as they complete
+    started = time.perf_counter()
+    total_frames, failed = 0, 0
+    worker_frames: Dict[int, int] = {}
+
+    def record_result(result):
+        nonlocal total_frames
+        frames = len(result["records"])
+        writer.write(result["records"])
+        manifest.mark_done(result["units"], frames, result["seconds"])
+        total_frames += frames
+        worker_frames[result["pid"]] = worker_frames.get(result["pid"], 0) + frames
+        elapsed = time.perf_counter() - started
+        print(f"✅ {result['units'][0]}{' +' + str(len(result['units']) - 1) if len(result['units']) > 1 else ''}: "
+              f"{frames} frames in {result['seconds']:.1f}s | {total_frames} total, {total_frames / elapsed:.2f} fps")
+
+    if args.workers <= 0:
+        init_worker(*worker_args)
+        for task in tasks:
+            try:
+                record_result(process_task(task, args.stride, args.batch_size))
+            except Exception as e:
+                failed += 1
+                print(f"❌ Task {task[0]} failed: {e}")
+    else:
+        import multiprocessing
+        with ProcessPoolExecutor(
+            max_workers=args.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=worker_args
+        ) as pool:
+            futures = {pool.submit(process_task, task, args.stride, args.batch_size): task for task in tasks}
+            for future in as_completed(futures):
+                try:
+                    record_result(future.result())
+                except Exception as e:
+                    failed += 1
+                    print(f"❌ Task {futures[future][0]} failed: {e}")
+
+    # 3. Throughput report
+    elapsed = time.perf_counter() - started
+    report = {
+        "frames": total_frames,
+        "seconds": round(elapsed, 3),
+        "fps": total_frames / elapsed if elapsed > 0 else 0.0,
+        "workers": max(args.workers, 1),
+        "threads_per_worker": threads,
+        "frames_per_worker": list(worker_frames.values()),
+        "failed_tasks": failed,
+        "output": args.output,
+        "manifest": manifest.path,
+    }
+    print(f"📊 {json.dumps(report)}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if failed:
+        raise SystemExit(f"{failed} tasks failed; rerun the same command to retry them")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Runtime configuration for the Industrial AI backend
+# Every value can be overridden through environment variables or the .env file
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# OWL-ViT inference backend: torch | torch-int8 | onnx | onnx-int8
+# (ONNX backends need `python model_tools.py export` first)
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "torch")
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))  # 0 = library default
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "models/owlvit_image_head.onnx")
+
+# Multi-process serving (python serve.py run): OWL-ViT is loaded once in the parent, then SERVE_WORKERS
+# API processes are forked and share the weights. Each worker is pinned to SERVE_THREADS_PER_WORKER
+# cores of its own (0 = the available cores split evenly) and uses that many intra-op threads
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "1"))
+SERVE_THREADS_PER_WORKER = int(os.getenv("SERVE_THREADS_PER_WORKER", "0"))
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8000"))
+
+# Detection post-processing: score threshold and IoU for synonym-grouped NMS
+DETECTION_SCORE_THRESHOLD = float(os.getenv("DETECTION_SCORE_THRESHOLD", "0.25"))
+NMS_IOU_THRESHOLD = float(os.getenv("NMS_IOU_THRESHOLD", "0.5"))
+
+# Tiled inference for high-resolution cameras: frames whose long side is at least TILE_MIN_SIDE px
+# are cut into a COLSxROWS grid of tiles overlapping by TILE_OVERLAP (fraction of a tile side),
+# plus a global thumbnail, all run in one batch. Empty = off. "3x2" suits 16:9 4K frames
+TILE_GRID = os.getenv("TILE_GRID", "")
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))
+TILE_MIN_SIDE = int(os.getenv("TILE_MIN_SIDE", "1600"))
+
+# Uploaded JPEGs at least 2x the model input on both sides are decoded at 1/2, 1/4 or 1/8 scale
+# (never below REDUCED_DECODE_MIN_SIDE px); boxes are mapped back to full resolution. 0 = off.
+# Skipped when tiling is on or the camera has zones, which need the full-resolution pixels
+REDUCED_DECODE_MIN_SIDE = int(os.getenv("REDUCED_DECODE_MIN_SIDE", "768"))
+
+# Site profiles: *.json vocabulary/affordance files, polled for changes every PROFILE_RELOAD_INTERVAL_S (0 = off)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+DEFAULT_PROFILE = os.getenv("DEFAULT_PROFILE", "default")
+PROFILE_RELOAD_INTERVAL_S = float(os.getenv("PROFILE_RELOAD_INTERVAL_S", "2"))
+
+# Micro-batching scheduler in front of the OWL-ViT detector
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "20"))
+
+# Live-stream tracking: full detection every TRACK_KEYFRAME_INTERVAL analyzed frames,
+# or sooner when the scene-change score (mean abs. thumbnail difference, 0-255) passes the threshold
+TRACKING_ENABLED = os.getenv("TRACKING_ENABLED", "true").lower() == "true"
+TRACK_KEYFRAME_INTERVAL = int(os.getenv("TRACK_KEYFRAME_INTERVAL", "5"))
+TRACK_SCENE_CHANGE_THRESHOLD = float(os.getenv("TRACK_SCENE_CHANGE_THRESHOLD", "12"))
+TRACK_IOU_THRESHOLD = float(os.getenv("TRACK_IOU_THRESHOLD", "0.3"))
+TRACK_MAX_MISSES = int(os.getenv("TRACK_MAX_MISSES", "2"))
+
+# Perceptual-hash result cache in front of /analyze/image: frames whose dHash (2 * HASH_SIZE**2 bits,
+# neighbour differences under HASH_MARGIN grey levels ignored) differs by at most MAX_DISTANCE bits
+# reuse the previous analysis. Re-encodes/retakes land at ~0-6 bits; a 60 px object moved into a
+# 640x480 frame at ~14, so raise the distance only for truly static views
+FRAME_CACHE_ENABLED = os.getenv("FRAME_CACHE_ENABLED", "true").lower() == "true"
+FRAME_CACHE_SIZE = int(os.getenv("FRAME_CACHE_SIZE", "256"))
+FRAME_CACHE_MAX_MB = float(os.getenv("FRAME_CACHE_MAX_MB", "32"))
+FRAME_CACHE_HASH_SIZE = int(os.getenv("FRAME_CACHE_HASH_SIZE", "32"))
+FRAME_CACHE_HASH_MARGIN = int(os.getenv("FRAME_CACHE_HASH_MARGIN", "3"))
+FRAME_CACHE_MAX_DISTANCE = int(os.getenv("FRAME_CACHE_MAX_DISTANCE", "8"))
+FRAME_CACHE_TTL_S = float(os.getenv("FRAME_CACHE_TTL_S", "600"))
+
+# Admission control for /analyze/image* and each analyzed /ws/stream frame: at most ADMISSION_MAX_IN_FLIGHT
+# analyses at once (429 with Retry-After beyond that; stream frames are dropped), plus
+# ADMISSION_PRIORITY_RESERVE slots only safety checks may use
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32"))
+ADMISSION_PRIORITY_RESERVE = int(os.getenv("ADMISSION_PRIORITY_RESERVE", "8"))
+
+# Per-request time budget (clients may ask for less with ?deadline_ms=), also applied to each live-stream
+# frame. Expired requests get 504 (stream frames are dropped) and their queued detection / GPT call is
+# cancelled; DEADLINE_RESERVE_MS is kept back for the stages after GPT
+REQUEST_DEADLINE_MS = float(os.getenv("REQUEST_DEADLINE_MS", "30000"))
+DEADLINE_RESERVE_MS = float(os.getenv("DEADLINE_RESERVE_MS", "250"))
+
+# Degraded mode (no GPT call) while the detector queue wait stays above this
+DEGRADE_QUEUE_WAIT_MS = float(os.getenv("DEGRADE_QUEUE_WAIT_MS", "1000"))
+
+# Worker pools for CPU-bound stages (image decoding) and disk writes
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", str(os.cpu_count() or 4)))
+IO_POOL_WORKERS = int(os.getenv("IO_POOL_WORKERS", "4"))
+
+# Expert analysis: "openai" (needs OPENAI_API_KEY) or "stub" for offline tests/benchmarks
+EXPERT_BACKEND = os.getenv("EXPERT_BACKEND", "openai")
+EXPERT_STUB_LATENCY_MS = float(os.getenv("EXPERT_STUB_LATENCY_MS", "0"))
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+OPENAI_TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT_S", "30"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+
+# Expert analysis cache (LRU + TTL, optional SQLite file to survive restarts)
+EXPERT_CACHE_SIZE = int(os.getenv("EXPERT_CACHE_SIZE", "512"))
+EXPERT_CACHE_TTL_S = float(os.getenv("EXPERT_CACHE_TTL_S", "86400"))
+EXPERT_CACHE_PATH = os.getenv("EXPERT_CACHE_PATH", "")
+
+# How long finished SSE expert-analysis streams stay replayable from memory
+EXPERT_STREAM_RETENTION_S = float(os.getenv("EXPERT_STREAM_RETENTION_S", "300"))
+# A stream requested from another API worker polls the shared history for the final text this often
+# (for at most EXPERT_STREAM_RETENTION_S)
+EXPERT_STREAM_POLL_INTERVAL_MS = float(os.getenv("EXPERT_STREAM_POLL_INTERVAL_MS", "250"))
+
+# Persistent analysis history (SQLite, WAL mode)
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "analysis_history.db")
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "50"))
+HISTORY_FLUSH_INTERVAL_MS = float(os.getenv("HISTORY_FLUSH_INTERVAL_MS", "250"))
+# Queued history writes before requests block on the writer (backpressure from a slow disk)
+HISTORY_MAX_QUEUED = int(os.getenv("HISTORY_MAX_QUEUED", "10000"))
+# How long a write waits on another API worker's lock before the batch is retried
+HISTORY_BUSY_TIMEOUT_MS = float(os.getenv("HISTORY_BUSY_TIMEOUT_MS", "5000"))
+
+# Original frames, stored once per content hash; annotated overlays are rendered on first GET.
+# A background pass deletes images past the retention age, then the oldest until under the size cap
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "image_store")
+IMAGE_STORE_MAX_MB = float(os.getenv("IMAGE_STORE_MAX_MB", "2048"))
+IMAGE_RETENTION_DAYS = float(os.getenv("IMAGE_RETENTION_DAYS", "30"))
+IMAGE_STORE_GC_INTERVAL_S = float(os.getenv("IMAGE_STORE_GC_INTERVAL_S", "300"))
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "64"))
+RENDER_CACHE_MAX_MB = float(os.getenv("RENDER_CACHE_MAX_MB", "64"))
+
+# Logging: level (DEBUG adds per-stage request chatter) and json | text output
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
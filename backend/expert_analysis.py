@@ -0,0 +1,461 @@
+# GPT expert analysis with caching, request coalescing and pluggable backends
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+logger = logging.getLogger("industrial_ai.expert")
+
+# Bump whenever EXPERT_PROMPT_TEMPLATE changes so stale cached answers are not reused
+PROMPT_VERSION = "1"
+
+EXPERT_PROMPT_TEMPLATE = """
+As a PhD-level manufacturing engineer, analyze this industrial workshop image showing {objects}.
+
+Focus on:
+1. Specific manufacturing processes (machining, assembly, welding)
+2. Workplace safety compliance and PPE usage
+3. Equipment utilization and workflow efficiency
+4. Quality control implications
+
+Consider the affordance relationships between tools, workers, and tasks.
+
+DETECTED OBJECTS: {objects}
+TASK PHASE: {task_phase}
+
+Provide expert-level analysis covering:
+1. Manufacturing Process Identification:
+   - What specific processes are being performed?
+   - What equipment capabilities are being utilized?
+
+2. Safety Protocol Assessment:
+   - PPE compliance status
+   - Potential safety hazards or improvements
+
+3. Efficiency Optimization Recommendations:
+   - Workflow improvements
+   - Equipment utilization suggestions
+
+4. Quality Assurance Considerations:
+   - Process control measures
+   - Inspection and verification needs
+
+Keep response detailed but structured.
+"""
+
+
+def normalize_objects(objects: List[str]) -> List[str]:
+    """Order-independent object set used for both the prompt and the cache key"""
+    return sorted(set(objects))
+
+
+def build_expert_prompt(objects: List[str], task_phase: str) -> str:
+    return EXPERT_PROMPT_TEMPLATE.format(objects=', '.join(normalize_objects(objects)), task_phase=task_phase)
+
+
+def expert_cache_key(objects: List[str], task_phase: str) -> str:
+    payload = json.dumps([PROMPT_VERSION, normalize_objects(objects), task_phase])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class OpenAIExpertBackend:
+    """GPT-4 over a pooled async HTTP client"""
+    
+    name = "openai"
+    
+    def __init__(self, api_key: str, model: str = "gpt-4", timeout_s: float = 30.0,
+                 max_connections: int = 20):
+        self.model = model
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            timeout=timeout_s,
+            max_retries=1,
+            http_client=httpx.AsyncClient(
+                timeout=timeout_s,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            )
+        )
+    
+    async def complete(self, prompt: str) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=500,  # Increased for more detailed analysis
+            temperature=0.7  # Slightly more creative while staying factual
+        )
+        return response.choices[0].message.content
+    
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=500,
+            temperature=0.7,
+            stream=True
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    async def close(self):
+        await self.client.close()
+
+
+class StubExpertBackend:
+    """Deterministic offline backend for tests and benchmarks (no network)"""
+    
+    name = "stub"
+    
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+    
+    def _render(self, prompt: str) -> str:
+        context = [line.strip() for line in prompt.splitlines()
+                   if line.startswith(("DETECTED OBJECTS:", "TASK PHASE:"))]
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:8]
+        return f"[stub expert analysis {digest}]\n" + "\n".join(context)
+    
+    async def complete(self, prompt: str) -> str:
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000.0)
+        return self._render(prompt)
+    
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        # Word-sized tokens, with the configured latency spread across them
+        tokens = re.findall(r"\S+\s*", self._render(prompt))
+        for token in tokens:
+            if self.latency_ms > 0:
+                await asyncio.sleep(self.latency_ms / 1000.0 / len(tokens))
+            yield token
+    
+    async def close(self):
+        pass
+
+
+class ExpertAnalysisCache:
+    """
+    LRU + TTL cache of expert analysis texts. When disk_path is set, entries
+    are also written to a SQLite file so they survive restarts.
+    """
+    
+    def __init__(self, max_entries: int = 512, ttl_s: float = 3600.0, disk_path: Optional[str] = None):
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self.disk_path = disk_path
+        
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+        if disk_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS expert_cache (key TEXT PRIMARY KEY, text TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+    
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.disk_path)
+    
+    def get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            text, created_at = entry
+            if time.time() - created_at > self.ttl_s:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return text
+    
+    def get(self, key: str) -> Optional[str]:
+        """Memory first, then the on-disk backing (blocking; call off the event loop when disk-backed)"""
+        text = self.get_memory(key)
+        if text is not None or not self.disk_path:
+            return text
+        
+        with self._connect() as conn:
+            row = conn.execute("SELECT text, created_at FROM expert_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_s:
+            return None
+        self._put_memory(key, row[0], row[1])
+        return row[0]
+    
+    def _put_memory(self, key: str, text: str, created_at: float):
+        with self._lock:
+            self._entries[key] = (text, created_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def put(self, key: str, text: str):
+        created_at = time.time()
+        self._put_memory(key, text, created_at)
+        if self.disk_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO expert_cache (key, text, created_at) VALUES (?, ?, ?)",
+                    (key, text, created_at)
+                )
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ExpertAnalysisService:
+    """
+    Expert analysis front end: cache lookup, then one shared backend call per
+    distinct prompt. Concurrent identical requests await (or, when streaming,
+    subscribe to) the same in-flight call; the call is cancelled only when
+    every waiter has gone away. Backend errors and timeouts fall back to the
+    caller-supplied text.
+    """
+    
+    def __init__(self, backend, cache: ExpertAnalysisCache, timeout_s: float = 30.0):
+        self.backend = backend
+        self.cache = cache
+        self.timeout_s = timeout_s
+        
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+    
+    async def _cache_get(self, key: str) -> Optional[str]:
+        text = self.cache.get_memory(key)
+        if text is None and self.cache.disk_path:
+            text = await asyncio.to_thread(self.cache.get, key)
+        return text
+    
+    async def _cache_put(self, key: str, text: str):
+        # An empty generation is not an analysis: leave it uncached so the next request retries
+        if not text:
+            return
+        if self.cache.disk_path:
+            await asyncio.to_thread(self.cache.put, key, text)
+        else:
+            self.cache.put(key, text)
+    
+    async def _fetch(self, key: str, prompt: str) -> str:
+        try:
+            text = await asyncio.wait_for(self.backend.complete(prompt), self.timeout_s)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            logger.warning("⚠️ Expert analysis backend error", extra={"error": repr(e)})
+            raise
+        
+        await self._cache_put(key, text)
+        return text
+    
+    async def _generate(self, key: str, prompt: str, shared: "ExpertAnalysisStream") -> str:
+        """One backend token stream feeding a shared ExpertAnalysisStream; returns the full text"""
+        chunks = self.backend.stream(prompt)
+        try:
+            while True:
+                # timeout_s bounds the gap between tokens, not the whole generation
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout_s)
+                except StopAsyncIteration:
+                    break
+                shared.append(chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            logger.warning("⚠️ Expert analysis stream error", extra={"error": repr(e)})
+            if not shared.chunks:
+                raise
+            # Partial text is delivered but not cached
+            return shared.text
+        finally:
+            shared.finish()
+            await chunks.aclose()
+        
+        await self._cache_put(key, shared.text)
+        return shared.text
+    
+    async def analyze(self, objects: List[str], task_phase: str, fallback: str) -> str:
+        key = expert_cache_key(objects, task_phase)
+        
+        cached = await self._cache_get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        
+        entry = self._inflight.get(key)
+        if entry is None:
+            self.misses += 1
+            task = asyncio.create_task(self._fetch(key, build_expert_prompt(objects, task_phase)))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            entry = self._inflight[key] = {"task": task, "waiters": 0}
+        else:
+            self.coalesced += 1
+        
+        entry["waiters"] += 1
+        try:
+            return await asyncio.shield(entry["task"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return fallback
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not entry["task"].done():
+                entry["task"].cancel()
+    
+    async def stream(self, objects: List[str], task_phase: str, fallback: str) -> AsyncIterator[str]:
+        """
+        Token stream of the expert analysis. Cache hits arrive as one chunk;
+        completed streams are cached. Concurrent identical requests subscribe
+        to one generation (or receive the text of an in-flight analyze() call
+        as one chunk). If the backend fails before producing anything, the
+        fallback text is streamed instead.
+        """
+        key = expert_cache_key(objects, task_phase)
+        
+        cached = await self._cache_get(key)
+        if cached is not None:
+            self.hits += 1
+            yield cached
+            return
+        
+        entry = self._inflight.get(key)
+        if entry is None:
+            self.misses += 1
+            shared = ExpertAnalysisStream()
+            task = asyncio.create_task(self._generate(key, build_expert_prompt(objects, task_phase), shared))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            entry = self._inflight[key] = {"task": task, "waiters": 0, "stream": shared}
+        else:
+            self.coalesced += 1
+        
+        entry["waiters"] += 1
+        streamed = False
+        try:
+            if entry.get("stream") is not None:
+                async for chunk in entry["stream"].subscribe():
+                    streamed = True
+                    yield chunk
+            try:
+                text = await asyncio.shield(entry["task"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                text = fallback
+            if not streamed and text:
+                yield text
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not entry["task"].done():
+                entry["task"].cancel()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend.name,
+            "cache_entries": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "in_flight": len(self._inflight),
+        }
+    
+    async def close(self):
+        await self.backend.close()
+
+
+class ExpertAnalysisStream:
+    """Buffered token stream for one analysis; late subscribers replay from the start"""
+    
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self._changed = asyncio.Event()
+    
+    @property
+    def text(self) -> str:
+        return ''.join(self.chunks)
+    
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+    
+    def append(self, chunk: str):
+        self.chunks.append(chunk)
+        self._notify()
+    
+    def finish(self):
+        self.done = True
+        self._notify()
+    
+    async def subscribe(self) -> AsyncIterator[str]:
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                return
+            await changed.wait()
+
+
+class ExpertStreamRegistry:
+    """
+    Expert analysis generations running in the background, keyed by analysis
+    id. Generation starts immediately, independent of whether a client has
+    subscribed yet; finished streams stay available for retention_s.
+    
+    The pump tasks are held here (the event loop only keeps weak references)
+    until they finish; close() lets them complete before shutdown.
+    """
+    
+    def __init__(self, retention_s: float = 300.0):
+        self.retention_s = retention_s
+        self._streams = {}
+        self._tasks = set()
+    
+    def start(self, analysis_id: str, chunks: AsyncIterator[str],
+              on_complete: Callable[[str], None]) -> ExpertAnalysisStream:
+        stream = ExpertAnalysisStream()
+        self._streams[analysis_id] = stream
+        task = asyncio.create_task(self._pump(analysis_id, stream, chunks, on_complete))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return stream
+    
+    async def _pump(self, analysis_id: str, stream: ExpertAnalysisStream,
+                    chunks: AsyncIterator[str], on_complete: Callable[[str], None]):
+        try:
+            async for chunk in chunks:
+                stream.append(chunk)
+        except Exception as e:
+            logger.warning("⚠️ Expert analysis stream failed", extra={"analysis_id": analysis_id, "error": repr(e)})
+        finally:
+            stream.finish()
+            on_complete(stream.text)
+            asyncio.get_running_loop().call_later(self.retention_s, self._streams.pop, analysis_id, None)
+    
+    def get(self, analysis_id: str) -> Optional[ExpertAnalysisStream]:
+        return self._streams.get(analysis_id)
+    
+    async def close(self, timeout_s: float = 10.0):
+        """Wait for running generations (their on_complete writes history), cancelling any past timeout_s"""
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout_s)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,144 @@
+# Perceptual-hash result cache: near-identical frames reuse a previous analysis
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Set bits per byte value, for Hamming distances over packed hashes
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+# Rough per-entry bookkeeping cost on top of the serialized value
+_ENTRY_OVERHEAD_BYTES = 512
+
+
+def dhash(image: np.ndarray, hash_size: int = 32, margin: int = 3) -> np.ndarray:
+    """
+    Difference hash of a grey (hash_size + 1) x hash_size thumbnail, packed
+    into bytes. Each horizontal neighbour pair contributes two bits: "brighter
+    by more than margin" and "darker by more than margin". The dead band keeps
+    flat regions (bench tops, walls) from flipping bits on sensor noise and
+    JPEG re-encoding, so near-identical frames stay a few bits apart.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA).astype(np.int16)
+    diff = small[:, 1:] - small[:, :-1]
+    return np.packbits(np.concatenate([(diff > margin).ravel(), (diff < -margin).ravel()]))
+
+
+def hamming_distances(frame_hash: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+    """Bit differences between one packed hash and a (N, bytes) stack of them"""
+    return _POPCOUNT[np.bitwise_xor(hashes, frame_hash)].sum(axis=1, dtype=np.int32)
+
+
+class _Entry:
+    __slots__ = ("namespace", "frame_hash", "value", "size", "created_at")
+
+    def __init__(self, namespace: str, frame_hash: np.ndarray, value: Dict[str, Any], created_at: float):
+        self.namespace = namespace
+        self.frame_hash = frame_hash
+        self.value = value
+        self.size = len(json.dumps(value, default=str)) + frame_hash.nbytes + _ENTRY_OVERHEAD_BYTES
+        self.created_at = created_at
+
+
+class FrameCache:
+    """
+    LRU cache of analysis results keyed by a perceptual frame hash.
+
+    A lookup hits when a live entry in the same namespace (site profile
+    version) lies within max_distance bits of the query hash; the closest
+    one wins. Eviction keeps both the entry count and the estimated memory
+    footprint under their limits.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024,
+                 max_distance: int = 8, ttl_s: float = 600.0, hash_size: int = 32, hash_margin: int = 3):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self.max_distance = max_distance
+        self.ttl_s = ttl_s
+        self.hash_size = hash_size
+        self.hash_margin = hash_margin
+
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_key = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hash(self, image: np.ndarray) -> np.ndarray:
+        return dhash(image, self.hash_size, self.hash_margin)
+
+    def _remove(self, key: int) -> _Entry:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        return entry
+
+    def lookup(self, namespace: str, frame_hash: np.ndarray) -> Optional[Tuple[int, Dict[str, Any], int]]:
+        """(entry key, cached value, Hamming distance) of the closest match, or None"""
+        now = time.time()
+        with self._lock:
+            # 1. Drop expired entries
+            for key in [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl_s]:
+                self._remove(key)
+
+            # 2. Closest hash within the tolerance
+            candidates = [(key, entry) for key, entry in self._entries.items() if entry.namespace == namespace]
+            if candidates:
+                distances = hamming_distances(frame_hash, np.stack([entry.frame_hash for _, entry in candidates]))
+                best = int(np.argmin(distances))
+                if distances[best] <= self.max_distance:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return key, entry.value, int(distances[best])
+
+            self.misses += 1
+            return None
+
+    def put(self, namespace: str, frame_hash: np.ndarray, value: Dict[str, Any]) -> int:
+        """Store a result and return its entry key"""
+        entry = _Entry(namespace, frame_hash, value, time.time())
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+            return key
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, namespace: Optional[str] = None):
+        """Forget every entry (or those of one namespace)"""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items()
+                        if namespace is None or entry.namespace == namespace]:
+                self._remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "max_distance": self.max_distance,
+                "hash_bits": 2 * self.hash_size * self.hash_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
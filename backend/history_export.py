@@ -0,0 +1,86 @@
+# Streaming Arrow IPC / Parquet export of the analysis history
+
+from typing import Any, Dict, Iterable, Iterator, List
+
+EXPORT_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", ".arrows"),
+}
+
+# Record fields exported as columns (image digests and boxes stay internal)
+EXPORT_COLUMNS = (
+    "id", "timestamp", "task_phase", "detected_objects", "confidence_scores", "object_zones",
+    "safety_assessment", "expert_analysis", "next_steps", "site_profile", "camera",
+    "cache_hit", "cached_from", "degraded", "image_url",
+)
+
+
+def export_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("id", pa.string()), ("timestamp", pa.string()), ("task_phase", pa.string()),
+        ("detected_objects", pa.list_(pa.string())), ("confidence_scores", pa.list_(pa.float64())),
+        ("object_zones", pa.list_(pa.string())), ("safety_assessment", pa.string()),
+        ("expert_analysis", pa.string()), ("next_steps", pa.string()), ("site_profile", pa.string()),
+        ("camera", pa.string()), ("cache_hit", pa.bool_()), ("cached_from", pa.string()),
+        ("degraded", pa.bool_()), ("image_url", pa.string()),
+    ])
+
+
+class _ChunkSink:
+    """Write-only file object holding what the Arrow writer emitted since the last drain"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def writable(self) -> bool:
+        return True
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_export(batches: Iterable[List[Dict[str, Any]]], output_format: str = "parquet") -> Iterator[bytes]:
+    """
+    Encode batches of history records as one Parquet file (a row group per
+    batch) or Arrow IPC stream, yielding the bytes as each batch is written,
+    so memory holds one batch however long the history is
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = export_schema()
+    sink = _ChunkSink()
+    stream = pa.PythonFile(sink, mode="w")
+    if output_format == "parquet":
+        writer = pq.ParquetWriter(stream, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(stream, schema)
+
+    for records in batches:
+        columns = {column: [record.get(column) for record in records] for column in EXPORT_COLUMNS}
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,447 @@
+# Persistent analysis history backed by SQLite (WAL mode)
+
+import base64
+import itertools
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from affordance_analyzer import safety_status
+
+logger = logging.getLogger("industrial_ai.history")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    task_phase TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_timestamp ON analyses (timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_analyses_task_phase ON analyses (task_phase, timestamp);
+
+CREATE TABLE IF NOT EXISTS analysis_objects (
+    analysis_id TEXT NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+    object TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_objects_object ON analysis_objects (object, analysis_id);
+CREATE INDEX IF NOT EXISTS idx_analysis_objects_analysis ON analysis_objects (analysis_id);
+
+CREATE TABLE IF NOT EXISTS analysis_stats (
+    bucket TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (bucket, dimension, value)
+) WITHOUT ROWID;
+"""
+
+# Aggregate granularities: hourly rows are stored, days and totals are summed from them
+STATS_BUCKETS = {"hour": 13, "day": 10, "total": 0}
+
+# Attempts at a batch that fails with a lock / busy error (other API workers share the database)
+WRITE_ATTEMPTS = 3
+
+
+def stats_bucket(timestamp: str) -> str:
+    """Hour bucket of an ISO timestamp ("2024-05-01T13")"""
+    return timestamp[:13]
+
+
+def stats_increments(record: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+    """(bucket, dimension, value) counters one analysis adds to: total, task phase, each distinct label, safety status"""
+    bucket = stats_bucket(record["timestamp"])
+    detected_objects = record["detected_objects"]
+    return (
+        [(bucket, "total", ""), (bucket, "task_phase", record["task_phase"]),
+         (bucket, "safety", safety_status(detected_objects))]
+        + [(bucket, "object", obj) for obj in sorted(set(detected_objects))]
+    )
+
+
+def encode_cursor(timestamp: str, analysis_id: str) -> str:
+    """Opaque pagination cursor pointing at the last returned record"""
+    return base64.urlsafe_b64encode(f"{timestamp}|{analysis_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    timestamp, analysis_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+    return timestamp, analysis_id
+
+
+class AnalysisHistoryStore:
+    """
+    Bounded-memory history of AnalysisResponse records.
+    
+    Inserts and updates are queued and written in batches by a background
+    thread, in submission order, so the request path never waits on disk. Reads use one connection per thread;
+    WAL mode lets them run concurrently with the writer. get() and query()
+    also see records that are still queued, so a client can read back what
+    it just wrote. At most max_queued ops wait for the writer; beyond that
+    add() and update() block until it catches up (backpressure from a slow disk).
+    Other processes sharing the database only see committed records:
+    add(..., wait=True) blocks until the record is, and raises if the batch
+    could not be written.
+    
+    Hourly counters by task phase, detected label and safety status are
+    upserted in the same transaction as each insert, so stats() reads a few
+    rows per hour instead of scanning the history.
+    """
+    
+    def __init__(self, db_path: str, batch_size: int = 50, flush_interval_ms: float = 250.0,
+                 busy_timeout_ms: float = 5000.0, max_queued: int = 10000):
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        
+        self._local = threading.local()
+        self._queue = queue.Queue(maxsize=max(1, max_queued))
+        self._sequence = itertools.count()
+        # Keeps queue order equal to sequence order while a put blocks on a full queue
+        # (the writer needs _pending_lock to drain it, so that lock is not held across the put)
+        self._submit_lock = threading.Lock()
+        # id -> (sequence of the latest queued op, merged record) until that op is committed
+        self._pending: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self._pending_lock = threading.Lock()
+        # sequence -> event set once that op's batch is committed or failed (add(..., wait=True)),
+        # and the error of a failed one
+        self._commit_events: Dict[int, threading.Event] = {}
+        self._commit_errors: Dict[int, Exception] = {}
+        
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.commit()
+        self._backfill_stats(conn)
+        
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            # Writers in other worker processes hold the lock briefly; wait for it instead of failing
+            conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+            self._local.conn = conn
+        return conn
+    
+    # Writes
+    
+    def add(self, record: Dict[str, Any], wait: bool = False):
+        """
+        Queue a record for insertion. Non-blocking unless the queue is full or
+        wait is set, which flushes the batch right away and returns once it is committed
+        (blocking; run off the event loop), raising the write error if the
+        batch was rolled back
+        """
+        committed = threading.Event() if wait else None
+        with self._submit_lock:
+            with self._pending_lock:
+                sequence = next(self._sequence)
+                self._pending[record["id"]] = (sequence, record)
+                if committed is not None:
+                    self._commit_events[sequence] = committed
+            self._queue.put(("insert", sequence, record))
+        if committed is not None:
+            committed.wait()
+            error = self._commit_errors.pop(sequence, None)
+            if error is not None:
+                raise error
+    
+    def update(self, analysis_id: str, fields: Dict[str, Any]):
+        """Queue a partial update of a stored record (non-blocking unless the queue is full, applied after earlier inserts)"""
+        with self._submit_lock:
+            with self._pending_lock:
+                sequence = next(self._sequence)
+                pending = self._pending.get(analysis_id)
+                if pending is not None:
+                    self._pending[analysis_id] = (sequence, {**pending[1], **fields})
+            self._queue.put(("update", sequence, analysis_id, fields))
+    
+    def _write_loop(self):
+        conn = self._connect()
+        running = True
+        while running:
+            first = self._queue.get()
+            if first is None:
+                break
+            
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            # A waiting writer cuts the batch short instead of sitting out the flush interval
+            while len(batch) < self.batch_size and batch[-1][1] not in self._commit_events:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    op = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if op is None:
+                    running = False
+                    break
+                batch.append(op)
+            
+            error = None
+            try:
+                self._apply_batch_with_retry(conn, batch)
+            except Exception as e:
+                error = e
+                logger.exception("⚠️ History write error")
+            finally:
+                self._release_pending(batch)
+                for op in batch:
+                    committed = self._commit_events.pop(op[1], None)
+                    if committed is not None:
+                        if error is not None:
+                            self._commit_errors[op[1]] = error
+                        committed.set()
+    
+    def _apply_batch_with_retry(self, conn: sqlite3.Connection, ops: List[Tuple]):
+        """_apply_batch, retried when the database stays locked past busy_timeout (the transaction was rolled back)"""
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                self._apply_batch(conn, ops)
+                return
+            except sqlite3.OperationalError as e:
+                if attempt == WRITE_ATTEMPTS:
+                    raise
+                logger.warning("⚠️ History write retry", extra={"attempt": attempt, "ops": len(ops), "error": str(e)})
+                time.sleep(0.1 * attempt)
+    
+    def _release_pending(self, ops: List[Tuple]):
+        """Forget queued copies whose latest op has now been written"""
+        with self._pending_lock:
+            for op in ops:
+                analysis_id = op[2]["id"] if op[0] == "insert" else op[2]
+                pending = self._pending.get(analysis_id)
+                if pending is not None and pending[0] <= op[1]:
+                    del self._pending[analysis_id]
+    
+    def _apply_batch(self, conn: sqlite3.Connection, ops: List[Tuple]):
+        """Apply queued inserts/updates in order inside a single transaction"""
+        with conn:
+            increments = Counter()
+            for op in ops:
+                if op[0] == "insert":
+                    previous = conn.execute("SELECT record FROM analyses WHERE id = ?", (op[2]["id"],)).fetchone()
+                    if previous is not None:
+                        # A re-inserted id replaces its record: move its counts instead of adding them twice
+                        increments.subtract(stats_increments(json.loads(previous[0])))
+                    self._write_record(conn, op[2])
+                    increments.update(stats_increments(op[2]))
+                else:
+                    _, _, analysis_id, fields = op
+                    row = conn.execute("SELECT record FROM analyses WHERE id = ?", (analysis_id,)).fetchone()
+                    if row is not None:
+                        self._write_record(conn, {**json.loads(row[0]), **fields})
+            # Updates (expert text) never change what is counted
+            self._add_stats(conn, increments)
+    
+    def _add_stats(self, conn: sqlite3.Connection, increments: Counter):
+        conn.executemany(
+            "INSERT INTO analysis_stats (bucket, dimension, value, count) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (bucket, dimension, value) DO UPDATE SET count = count + excluded.count",
+            [(bucket, dimension, value, count) for (bucket, dimension, value), count in increments.items() if count]
+        )
+    
+    def _backfill_stats(self, conn: sqlite3.Connection):
+        """
+        Build the counters of a history database written before they existed.
+        Checked again under the write lock, so API workers starting together
+        against the same database backfill it once.
+        """
+        if conn.execute("SELECT 1 FROM analysis_stats LIMIT 1").fetchone() is not None:
+            return
+        started = time.perf_counter()
+        increments = Counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if (conn.execute("SELECT 1 FROM analysis_stats LIMIT 1").fetchone() is not None
+                    or conn.execute("SELECT 1 FROM analyses LIMIT 1").fetchone() is None):
+                conn.rollback()
+                return
+            for (record,) in conn.execute("SELECT record FROM analyses"):
+                increments.update(stats_increments(json.loads(record)))
+            self._add_stats(conn, increments)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("📊 History aggregates backfilled", extra={
+            "counters": len(increments), "seconds": round(time.perf_counter() - started, 2)
+        })
+    
+    def _write_record(self, conn: sqlite3.Connection, record: Dict[str, Any]):
+        conn.execute(
+            "INSERT OR REPLACE INTO analyses (id, timestamp, task_phase, record) VALUES (?, ?, ?, ?)",
+            (record["id"], record["timestamp"], record["task_phase"], json.dumps(record))
+        )
+        conn.execute("DELETE FROM analysis_objects WHERE analysis_id = ?", (record["id"],))
+        conn.executemany(
+            "INSERT INTO analysis_objects (analysis_id, object) VALUES (?, ?)",
+            [(record["id"], obj) for obj in set(record["detected_objects"])]
+        )
+    
+    def close(self):
+        """Flush pending writes and stop the writer thread"""
+        self._queue.put(None)
+        self._writer.join()
+    
+    # Reads
+    
+    def count(self) -> int:
+        """Stored analyses, from the hourly totals"""
+        row = self._connect().execute("SELECT SUM(count) FROM analysis_stats WHERE dimension = 'total'").fetchone()
+        return row[0] or 0
+    
+    def stats(self, since: Optional[str] = None, until: Optional[str] = None,
+              bucket: str = "hour") -> Dict[str, Any]:
+        """
+        Analysis counts by task phase, detected label and safety status over
+        [since, until), in total and per hour / day bucket. Bounds are ISO
+        timestamps truncated to the hour; records still queued are not counted yet.
+        """
+        width = STATS_BUCKETS[bucket]
+        clauses, params = [], []
+        if since:
+            clauses.append("bucket >= ?")
+            params.append(stats_bucket(since))
+        if until:
+            clauses.append("bucket < ?")
+            params.append(stats_bucket(until))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT substr(bucket, 1, {width}) AS period, dimension, value, SUM(count) FROM analysis_stats {where} "
+            f"GROUP BY period, dimension, value ORDER BY period",
+            params
+        ).fetchall()
+        
+        totals = {"total": 0, "task_phase": {}, "object": {}, "safety": {}}
+        periods: Dict[str, Dict[str, Any]] = {}
+        for period, dimension, value, count in rows:
+            entry = periods.setdefault(period, {"total": 0, "task_phase": {}, "object": {}, "safety": {}})
+            for target in (totals, entry):
+                if dimension == "total":
+                    target["total"] += count
+                else:
+                    target[dimension][value] = target[dimension].get(value, 0) + count
+        
+        def summary(counts: Dict[str, Any]) -> Dict[str, Any]:
+            checked = sum(counts["safety"].values())
+            return {
+                "total": counts["total"],
+                "task_phases": counts["task_phase"],
+                "objects": dict(sorted(counts["object"].items(), key=lambda item: -item[1])),
+                "safety": counts["safety"],
+                "ppe_compliance_rate": round(counts["safety"].get("ppe_present", 0) / checked, 4) if checked else None,
+            }
+        
+        return {
+            "since": since,
+            "until": until,
+            "bucket": bucket,
+            **summary(totals),
+            "buckets": [] if bucket == "total" else [
+                {"start": period, **summary(counts)} for period, counts in periods.items()
+            ],
+        }
+    
+    def iter_records(self, since: Optional[str] = None, until: Optional[str] = None,
+                     batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Oldest-first batches of stored records in [since, until), read on a
+        connection of its own so an export never holds more than one batch
+        """
+        clauses, params = [], []
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        
+        # Streaming responses may resume the generator on a different worker thread
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            cursor = conn.execute(f"SELECT record FROM analyses {where} ORDER BY timestamp, id", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [json.loads(row[0]) for row in rows]
+        finally:
+            conn.close()
+    
+    def get(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        with self._pending_lock:
+            pending = self._pending.get(analysis_id)
+        if pending is not None:
+            return dict(pending[1])
+        row = self._connect().execute("SELECT record FROM analyses WHERE id = ?", (analysis_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def query(self, limit: int = 20, cursor: Optional[str] = None,
+              task_phase: Optional[str] = None, detected_object: Optional[str] = None,
+              since: Optional[str] = None, until: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Newest-first page of records matching the filters, plus the cursor
+        for the next page (None when there are no more records). Queued
+        records are merged in, so the page includes analyses already
+        returned to clients but not yet committed.
+        """
+        with self._pending_lock:
+            pending = [record for _, record in self._pending.values()]
+        cursor_key = decode_cursor(cursor) if cursor else None
+        queued = [
+            record for record in pending
+            if (not task_phase or record["task_phase"] == task_phase)
+            and (not detected_object or detected_object in record["detected_objects"])
+            and (not since or record["timestamp"] >= since)
+            and (not until or record["timestamp"] < until)
+            and (cursor_key is None or (record["timestamp"], record["id"]) < cursor_key)
+        ]
+        
+        clauses, params = [], []
+        if task_phase:
+            clauses.append("a.task_phase = ?")
+            params.append(task_phase)
+        if detected_object:
+            clauses.append("a.id IN (SELECT analysis_id FROM analysis_objects WHERE object = ?)")
+            params.append(detected_object)
+        if since:
+            clauses.append("a.timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("a.timestamp < ?")
+            params.append(until)
+        if cursor_key is not None:
+            clauses.append("(a.timestamp, a.id) < (?, ?)")
+            params.extend(cursor_key)
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        # Stored rows with a queued newer version are replaced by it, so read that many extra
+        pending_ids = {record["id"] for record in pending}
+        rows = self._connect().execute(
+            f"SELECT a.record FROM analyses a {where} ORDER BY a.timestamp DESC, a.id DESC LIMIT ?",
+            params + [limit + 1 + len(pending_ids)]
+        ).fetchall()
+        
+        stored = [record for record in (json.loads(row[0]) for row in rows) if record["id"] not in pending_ids]
+        merged = sorted(stored + queued, key=lambda record: (record["timestamp"], record["id"]), reverse=True)
+        records = merged[:limit]
+        next_cursor = None
+        if len(merged) > limit and records:
+            last = records[-1]
+            next_cursor = encode_cursor(last["timestamp"], last["id"])
+        return records, next_cursor
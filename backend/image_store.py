@@ -0,0 +1,201 @@
+# Content-addressed store of analysed frames, rendered-overlay LRU and retention GC
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("industrial_ai.images")
+
+
+def image_extension(image_data: bytes) -> str:
+    return ".png" if image_data.startswith(b"\x89PNG") else ".jpg"
+
+
+class ImageStore:
+    """
+    Original frames stored once per content hash under root/<aa>/<sha256><ext>,
+    so re-uploads of the same bytes cost no extra disk. Storing an existing
+    image refreshes its mtime, which is what the retention policy ages by.
+
+    A background thread deletes images older than max_age_s and then the
+    least recently stored ones until the store fits in max_bytes.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 2 * 1024 ** 3, max_age_s: float = 30 * 86400.0,
+                 gc_interval_s: float = 300.0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.gc_interval_s = gc_interval_s
+        os.makedirs(root, exist_ok=True)
+
+        # Serializes "exists? refresh : write" against GC deletes of the same file
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.stored = 0
+        self.deduplicated = 0
+        self.deleted = 0
+        self.files = 0
+        self.bytes = 0
+
+    def _path(self, digest: str) -> Optional[str]:
+        """Existing file of a digest (either extension), or None"""
+        for extension in (".jpg", ".png"):
+            path = os.path.join(self.root, digest[:2], digest + extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def put(self, image_data: bytes) -> str:
+        """Store encoded image bytes (blocking; run off the event loop) and return their digest"""
+        digest = hashlib.sha256(image_data).hexdigest()
+        directory = os.path.join(self.root, digest[:2])
+        with self._lock:
+            path = self._path(digest)
+            if path is not None:
+                os.utime(path)
+                self.deduplicated += 1
+                return digest
+
+            os.makedirs(directory, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(handle, "wb") as f:
+                f.write(image_data)
+            os.replace(temp_path, os.path.join(directory, digest + image_extension(image_data)))
+            self.stored += 1
+            self.files += 1
+            self.bytes += len(image_data)
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """Encoded bytes of a stored image, or None once it has been collected"""
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            return None
+        path = self._path(digest)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def collect(self) -> Dict[str, int]:
+        """One retention pass: expire by age, then trim the oldest down to max_bytes"""
+        entries = sorted(self._scan())
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        deleted = freed = 0
+
+        for mtime, size, path in entries:
+            expired = now - mtime > self.max_age_s or path.endswith(".tmp")
+            if not expired and total <= self.max_bytes:
+                break
+            with self._lock:
+                try:
+                    # Skip files re-stored since the scan
+                    if os.stat(path).st_mtime != mtime:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            deleted += 1
+            freed += size
+
+        with self._lock:
+            self.files = len(entries) - deleted
+            self.bytes = total
+            self.deleted += deleted
+        if deleted:
+            logger.info("🧹 Image retention pass", extra={"deleted": deleted, "freed_bytes": freed,
+                                                         "files": self.files, "bytes": self.bytes})
+        return {"deleted": deleted, "freed_bytes": freed}
+
+    def _watch(self):
+        while not self._stop.wait(self.gc_interval_s):
+            try:
+                self.collect()
+            except Exception:
+                logger.exception("⚠️ Image retention pass failed")
+
+    def start(self):
+        """Initial pass (also sizes the store), then periodic collection in the background"""
+        self.collect()
+        if self._thread is None and self.gc_interval_s > 0:
+            self._thread = threading.Thread(target=self._watch, name="image-retention", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "files": self.files,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "max_age_s": self.max_age_s,
+                "stored": self.stored,
+                "deduplicated": self.deduplicated,
+                "deleted": self.deleted,
+            }
+
+
+class RenderedImageCache:
+    """LRU of rendered annotation JPEGs, bounded by entry count and total bytes"""
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,149 @@
+# Interchangeable CPU inference backends for the OWL-ViT image path
+#
+# The text tower runs once per vocabulary (see AdvancedIndustrialDetector.get_text_queries),
+# so backends only cover the per-frame work: image tower + class head + box head.
+
+import os
+from typing import Tuple
+
+import numpy as np
+import torch
+
+BACKEND_NAMES = ("torch", "torch-int8", "onnx", "onnx-int8")
+DEFAULT_ONNX_PATH = os.path.join("models", "owlvit_image_head.onnx")
+
+
+def int8_model_path(onnx_path: str) -> str:
+    """models/x.onnx -> models/x.int8.onnx"""
+    root, ext = os.path.splitext(onnx_path)
+    return f"{root}.int8{ext}"
+
+
+class OwlViTImageHead(torch.nn.Module):
+    """Image tower plus class/box heads, scored against precomputed text queries"""
+    
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+    
+    def forward(self, pixel_values: torch.Tensor, query_embeds: torch.Tensor,
+                query_mask: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        feature_map, _ = self.model.image_embedder(pixel_values=pixel_values)
+        batch_size, height, width, hidden_dim = feature_map.shape
+        image_feats = feature_map.reshape(batch_size, height * width, hidden_dim)
+        
+        pred_logits, _ = self.model.class_predictor(image_feats, query_embeds, query_mask)
+        pred_boxes = self.model.box_predictor(image_feats, feature_map)
+        return pred_logits, pred_boxes
+
+
+class TorchEagerBackend:
+    """Eager fp32 PyTorch under inference_mode, with configurable intra-op threads"""
+    
+    name = "torch"
+    
+    def __init__(self, model, num_threads: int = 0):
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+        self.head = OwlViTImageHead(model).eval()
+    
+    def predict(self, pixel_values: torch.Tensor, query_embeds: torch.Tensor,
+                query_mask: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        with torch.inference_mode():
+            return self.head(pixel_values, query_embeds, query_mask)
+
+
+class TorchInt8Backend(TorchEagerBackend):
+    """Eager PyTorch with Linear layers dynamically quantized to INT8"""
+    
+    name = "torch-int8"
+    
+    def __init__(self, model, num_threads: int = 0):
+        super().__init__(model, num_threads)
+        self.head = torch.ao.quantization.quantize_dynamic(
+            self.head, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+
+class OnnxRuntimeBackend:
+    """Exported ONNX graph (fp32 or INT8) on the ONNX Runtime CPU provider"""
+    
+    name = "onnx"
+    
+    def __init__(self, onnx_path: str, num_threads: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("ONNX backends need onnxruntime: pip install onnxruntime") from e
+        
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(
+                f"{onnx_path} not found - run `python model_tools.py export` first"
+            )
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        
+        self.onnx_path = onnx_path
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+    
+    def predict(self, pixel_values: torch.Tensor, query_embeds: torch.Tensor,
+                query_mask: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        pred_logits, pred_boxes = self.session.run(
+            ["logits", "pred_boxes"],
+            {
+                "pixel_values": np.ascontiguousarray(pixel_values.numpy()),
+                "query_embeds": np.ascontiguousarray(query_embeds.numpy()),
+                "query_mask": np.ascontiguousarray(query_mask.numpy()),
+            }
+        )
+        return torch.from_numpy(pred_logits), torch.from_numpy(pred_boxes)
+
+
+def create_backend(name: str, model, onnx_path: str = DEFAULT_ONNX_PATH, num_threads: int = 0):
+    """Build the backend selected by DETECTOR_BACKEND"""
+    if name == "torch":
+        return TorchEagerBackend(model, num_threads)
+    if name == "torch-int8":
+        return TorchInt8Backend(model, num_threads)
+    if name == "onnx":
+        return OnnxRuntimeBackend(onnx_path, num_threads)
+    if name == "onnx-int8":
+        backend = OnnxRuntimeBackend(int8_model_path(onnx_path), num_threads)
+        backend.name = "onnx-int8"
+        return backend
+    raise ValueError(f"Unknown detector backend {name!r}; expected one of {', '.join(BACKEND_NAMES)}")
+
+
+def export_onnx(model, query_embeds: torch.Tensor, query_mask: torch.Tensor,
+                onnx_path: str = DEFAULT_ONNX_PATH, image_size: int = 768, quantize: bool = True):
+    """
+    Export the image head to ONNX with dynamic batch and query axes, and
+    optionally write an INT8 dynamically-quantized copy next to it
+    """
+    os.makedirs(os.path.dirname(onnx_path) or ".", exist_ok=True)
+    head = OwlViTImageHead(model).eval()
+    pixel_values = torch.zeros(1, 3, image_size, image_size)
+    
+    with torch.no_grad():
+        torch.onnx.export(
+            head,
+            (pixel_values, query_embeds, query_mask),
+            onnx_path,
+            input_names=["pixel_values", "query_embeds", "query_mask"],
+            output_names=["logits", "pred_boxes"],
+            dynamic_axes={
+                "pixel_values": {0: "batch"},
+                "query_embeds": {0: "batch", 1: "num_queries"},
+                "query_mask": {0: "batch", 1: "num_queries"},
+                "logits": {0: "batch", 2: "num_queries"},
+                "pred_boxes": {0: "batch"},
+            },
+            opset_version=17
+        )
+    
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(onnx_path, int8_model_path(onnx_path), weight_type=QuantType.QInt8)
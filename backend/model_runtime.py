@@ -0,0 +1,153 @@
+# Background model loading, warmup and readiness reporting
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from batching import PRIORITY_NORMAL, BatchingInferenceEngine
+
+logger = logging.getLogger("industrial_ai.runtime")
+
+
+class ModelRuntime:
+    """
+    Owns the detector and its batching engine. Construction is cheap; start()
+    loads the model on a background thread, runs warmup inferences on a
+    synthetic frame and only then reports ready, so the first real request
+    sees warm-path latency.
+    
+    States: pending -> loading -> warming_up -> ready (or failed)
+    
+    vocabularies_fn lists the site-profile vocabularies whose text
+    embeddings are prepared during warmup (and again via
+    prepare_vocabularies whenever the profiles change).
+    """
+    
+    def __init__(self, detector_factory: Callable[[], Any], max_batch_size: int = 16,
+                 max_wait_ms: float = 20.0, warmup_shape=(720, 1280, 3),
+                 vocabularies_fn: Optional[Callable[[], List[List[str]]]] = None):
+        self.detector_factory = detector_factory
+        self.vocabularies_fn = vocabularies_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.warmup_shape = warmup_shape
+        
+        self.detector = None
+        self.engine: Optional[BatchingInferenceEngine] = None
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.cold_latency_ms: Optional[float] = None
+        self.warm_latency_ms: Optional[float] = None
+        
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+    
+    def start(self):
+        """Begin loading in the background (idempotent)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._load, name="model-loader", daemon=True)
+            self._thread.start()
+    
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+    
+    def _load(self):
+        try:
+            self.state = "loading"
+            started = time.perf_counter()
+            self.detector = self.detector_factory()
+            self.load_seconds = time.perf_counter() - started
+            
+            self.state = "warming_up"
+            started = time.perf_counter()
+            frame = np.random.default_rng(0).integers(0, 255, self.warmup_shape, dtype=np.uint8)
+            
+            first = time.perf_counter()
+            self.detector.detect_boxes_batch([frame])
+            self.cold_latency_ms = (time.perf_counter() - first) * 1000.0
+            
+            second = time.perf_counter()
+            self.detector.detect_boxes_batch([frame])
+            self.warm_latency_ms = (time.perf_counter() - second) * 1000.0
+            if self.vocabularies_fn is not None:
+                self.prepare_vocabularies(self.vocabularies_fn())
+            self.warmup_seconds = time.perf_counter() - started
+            
+            self.engine = BatchingInferenceEngine(
+                self._detect_batch,
+                max_batch_size=self.max_batch_size,
+                max_wait_ms=self.max_wait_ms
+            )
+            self.state = "ready"
+            self._ready.set()
+            logger.info("✅ Model ready", extra={
+                "load_seconds": round(self.load_seconds, 2),
+                "warm_latency_ms": round(self.warm_latency_ms, 1),
+                "cold_latency_ms": round(self.cold_latency_ms, 1),
+            })
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.exception("❌ Model loading failed")
+    
+    def prepare_vocabularies(self, vocabularies: List[List[str]]):
+        """Compute text embeddings for the given vocabularies and evict all others"""
+        detector = self.detector
+        if detector is None:
+            return
+        for vocabulary in vocabularies:
+            detector.get_text_queries(vocabulary)
+            detector.get_synonym_groups(vocabulary)
+        detector.retain_vocabularies(vocabularies)
+    
+    def detect(self, image: np.ndarray, vocabulary: Optional[List[str]] = None, boxes_only: bool = False,
+               priority: int = PRIORITY_NORMAL,
+               regions: Optional[List[Tuple[int, int, int, int]]] = None) -> Future:
+        """
+        Queue one frame on the batching engine; vocabulary defaults to the
+        detector's own. boxes_only resolves to (boxes, objects, scores)
+        without rendering an annotated frame. regions restricts detection to
+        those (x0, y0, x1, y1) crops (camera zones). PRIORITY_HIGH frames jump
+        the queue; cancelling the Future drops a frame that is still queued.
+        """
+        return self.engine.submit((image, vocabulary, boxes_only, regions), priority)
+    
+    def _detect_batch(self, items: List[Any]) -> List[Any]:
+        """Engine batch function: one detector pass per distinct vocabulary/output kind in the batch"""
+        groups: Dict[Any, List[int]] = {}
+        for index, (_, vocabulary, boxes_only, _) in enumerate(items):
+            groups.setdefault((tuple(vocabulary) if vocabulary else None, boxes_only), []).append(index)
+        
+        results = [None] * len(items)
+        for (_, boxes_only), indices in groups.items():
+            vocabulary = items[indices[0]][1]
+            detect_fn = self.detector.detect_boxes_batch if boxes_only else self.detector.detect_objects_batch
+            batch_results = detect_fn([items[i][0] for i in indices], vocabulary, [items[i][3] for i in indices])
+            for index, result in zip(indices, batch_results):
+                results[index] = result
+        return results
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "cold_latency_ms": self.cold_latency_ms,
+            "warm_latency_ms": self.warm_latency_ms,
+        }
+    
+    def shutdown(self):
+        if self.engine is not None:
+            self.engine.shutdown()
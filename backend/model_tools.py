@@ -0,0 +1,275 @@
+# OWL-ViT model tooling: ONNX export and backend accuracy/latency comparison
+#
+#   python model_tools.py export [--output models/owlvit_image_head.onnx] [--no-quantize]
+#   python model_tools.py compare [--images DIR] [--backends torch,torch-int8,onnx,onnx-int8] [--report report.json]
+#       (the reference is always the original eager path: the full OWL-ViT forward, text tower included)
+#   python model_tools.py track-eval [--video FILE] [--interval 5] [--report report.json]
+
+import argparse
+import glob
+import json
+import os
+import time
+from typing import Dict, List
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+import config
+from logging_setup import configure_logging
+from inference_backends import BACKEND_NAMES, DEFAULT_ONNX_PATH, create_backend, export_onnx, int8_model_path
+from object_detection import AdvancedIndustrialDetector
+from tracking import ObjectTracker
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def synthetic_images(count: int = 8, size=(720, 1280)) -> List[np.ndarray]:
+    """Deterministic cluttered test frames, used when no image directory is given"""
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        image = np.full((*size, 3), rng.integers(40, 200), dtype=np.uint8)
+        for _ in range(12):
+            x1, y1 = int(rng.integers(0, size[1] - 100)), int(rng.integers(0, size[0] - 100))
+            x2, y2 = x1 + int(rng.integers(40, 300)), y1 + int(rng.integers(40, 300))
+            color = tuple(int(c) for c in rng.integers(0, 255, 3))
+            if rng.random() < 0.5:
+                cv2.rectangle(image, (x1, y1), (x2, y2), color, -1)
+            else:
+                cv2.circle(image, (x1, y1), int(rng.integers(20, 120)), color, -1)
+        images.append(image)
+    return images
+
+
+def load_images(directory: str) -> List[np.ndarray]:
+    paths = sorted(p for p in glob.glob(os.path.join(directory, "*")) if p.lower().endswith(IMAGE_EXTENSIONS))
+    images = [cv2.imread(p, cv2.IMREAD_COLOR) for p in paths]
+    return [image for image in images if image is not None]
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between two sets of xyxy boxes"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def detection_agreement(reference: Dict, candidate: Dict, iou_threshold: float = 0.5) -> Dict[str, float]:
+    """Precision/recall of candidate detections against the eager reference (same label, IoU >= threshold)"""
+    iou = box_iou(reference["boxes"], candidate["boxes"])
+    same_label = reference["labels"][:, None] == candidate["labels"][None, :]
+    matches = (iou >= iou_threshold) & same_label
+    
+    recall = matches.any(axis=1).mean() if len(reference["labels"]) else 1.0
+    precision = matches.any(axis=0).mean() if len(candidate["labels"]) else 1.0
+    return {"precision": float(precision), "recall": float(recall)}
+
+
+def command_export(args):
+    detector = AdvancedIndustrialDetector(backend="torch")
+    query_embeds, query_mask = detector.get_text_queries(detector.manufacturing_vocabulary)
+    
+    print(f"📦 Exporting OWL-ViT image head to {args.output}...")
+    export_onnx(detector.model, query_embeds, query_mask, onnx_path=args.output, quantize=not args.no_quantize)
+    print(f"✅ Exported {args.output}")
+    if not args.no_quantize:
+        print(f"✅ Exported {int8_model_path(args.output)}")
+
+
+def command_compare(args):
+    images = load_images(args.images) if args.images else synthetic_images()
+    if not images:
+        raise SystemExit(f"No images found in {args.images}")
+    print(f"🖼️ Comparing backends on {len(images)} images")
+    
+    detector = AdvancedIndustrialDetector(backend="torch", num_threads=args.threads)
+    vocabulary = detector.manufacturing_vocabulary
+    pil_images = [Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)) for image in images]
+    pixel_values = [detector.processor(images=pil, return_tensors="pt")["pixel_values"] for pil in pil_images]
+    target_sizes = [torch.Tensor([pil.size[::-1]]) for pil in pil_images]
+    
+    report = {"images": len(images), "runs": args.runs, "threads": args.threads, "backends": {}}
+    reference = None
+    
+    # Baseline: the original full forward (text + image towers) the refactored head must reproduce
+    text_inputs = detector.processor(text=[f"a photo of a {obj}" for obj in vocabulary], return_tensors="pt")
+    
+    def eager_full_predict(values: torch.Tensor):
+        with torch.inference_mode():
+            return detector.model(
+                input_ids=text_inputs["input_ids"],
+                attention_mask=text_inputs["attention_mask"],
+                pixel_values=values
+            )
+    
+    candidates = [("eager-full", eager_full_predict)]
+    for name in args.backends.split(","):
+        try:
+            backend = create_backend(name, detector.model, onnx_path=args.onnx_path, num_threads=args.threads)
+        except (ImportError, FileNotFoundError) as e:
+            print(f"⚠️ Skipping {name}: {e}")
+            report["backends"][name] = {"skipped": str(e)}
+            continue
+        
+        def backend_predict(values: torch.Tensor, backend=backend):
+            detector.backend = backend
+            return detector.predict(values, vocabulary)
+        candidates.append((name, backend_predict))
+    
+    for name, predict in candidates:
+        latencies, logits, detections = [], [], []
+        for values, target_size in zip(pixel_values, target_sizes):
+            predict(values)  # warmup
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                outputs = predict(values)
+                latencies.append((time.perf_counter() - start) * 1000.0)
+            
+            logits.append(outputs.logits.float().numpy())
+            results = detector.processor.post_process_object_detection(
+                outputs=outputs, threshold=args.threshold, target_sizes=target_size
+            )[0]
+            detections.append({key: results[key].detach().numpy() for key in ("boxes", "scores", "labels")})
+        
+        entry = {
+            "latency_ms_p50": float(np.percentile(latencies, 50)),
+            "latency_ms_p95": float(np.percentile(latencies, 95)),
+            "latency_ms_mean": float(np.mean(latencies)),
+            "detections": int(sum(len(d["labels"]) for d in detections)),
+        }
+        
+        if reference is None:
+            reference = {"name": name, "latency": entry["latency_ms_mean"], "logits": logits, "detections": detections}
+        else:
+            agreement = [detection_agreement(r, c) for r, c in zip(reference["detections"], detections)]
+            entry.update({
+                "reference": reference["name"],
+                "speedup": reference["latency"] / entry["latency_ms_mean"],
+                "max_abs_logit_diff": float(max(np.abs(r - c).max() for r, c in zip(reference["logits"], logits))),
+                "mean_abs_logit_diff": float(np.mean([np.abs(r - c).mean() for r, c in zip(reference["logits"], logits)])),
+                "detection_precision": float(np.mean([a["precision"] for a in agreement])),
+                "detection_recall": float(np.mean([a["recall"] for a in agreement])),
+            })
+        
+        report["backends"][name] = entry
+        print(f"✅ {name}: {json.dumps(entry)}")
+    
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report written to {args.report}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+def load_video_frames(path: str, max_frames: int) -> List[np.ndarray]:
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def panning_frames(count: int) -> List[np.ndarray]:
+    """Slowly panning synthetic scene, used when no video is given"""
+    scene = synthetic_images(1, size=(900, 1600))[0]
+    return [scene[90 + i // 2:810 + i // 2, 110 + i:1390 + i].copy() for i in range(count)]
+
+
+def command_track_eval(args):
+    frames = load_video_frames(args.video, args.frames) if args.video else panning_frames(args.frames)
+    if not frames:
+        raise SystemExit(f"No frames read from {args.video}")
+    print(f"🎞️ Evaluating tracking on {len(frames)} frames (keyframe interval {args.interval})")
+    
+    detector = AdvancedIndustrialDetector(backend=args.backend, num_threads=args.threads)
+    detect = lambda frame: detector.detect_boxes_batch([frame])[0]
+    detect(frames[0])  # warmup
+    
+    # 1. Reference: full detection on every frame
+    start = time.perf_counter()
+    reference = [detect(frame) for frame in frames]
+    full_seconds = time.perf_counter() - start
+    
+    # 2. Tracker: detection on keyframes only
+    tracker = ObjectTracker(keyframe_interval=args.interval, scene_change_threshold=args.scene_change_threshold)
+    start = time.perf_counter()
+    tracked = [tracker.step(frame, detect)[0] for frame in frames]
+    tracked_seconds = time.perf_counter() - start
+    
+    agreement = []
+    for (boxes, labels, _), tracks in zip(reference, tracked):
+        agreement.append(detection_agreement(
+            {"boxes": np.asarray(boxes).reshape(-1, 4), "labels": np.asarray(labels)},
+            {"boxes": np.array([track.box for track in tracks]).reshape(-1, 4),
+             "labels": np.asarray([track.label for track in tracks])}
+        ))
+    
+    report = {
+        "frames": len(frames),
+        "keyframe_interval": args.interval,
+        "full_detection_fps": len(frames) / full_seconds,
+        "tracked_fps": len(frames) / tracked_seconds,
+        "speedup": full_seconds / tracked_seconds,
+        "precision_vs_full": float(np.mean([a["precision"] for a in agreement])),
+        "recall_vs_full": float(np.mean([a["recall"] for a in agreement])),
+        "tracker": tracker.stats(),
+    }
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report written to {args.report}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OWL-ViT backend export and comparison")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    export_parser = subparsers.add_parser("export", help="Export the image head to ONNX (+ INT8 copy)")
+    export_parser.add_argument("--output", default=DEFAULT_ONNX_PATH)
+    export_parser.add_argument("--no-quantize", action="store_true", help="Skip the INT8 ONNX copy")
+    export_parser.set_defaults(func=command_export)
+    
+    compare_parser = subparsers.add_parser("compare", help="Accuracy/latency of each backend vs. the first one")
+    compare_parser.add_argument("--images", help="Directory of test images (default: synthetic set)")
+    compare_parser.add_argument("--backends", default=",".join(BACKEND_NAMES),
+                                help="Comma-separated backends; the first one is the reference")
+    compare_parser.add_argument("--onnx-path", default=DEFAULT_ONNX_PATH)
+    compare_parser.add_argument("--threads", type=int, default=0, help="Intra-op threads (0 = library default)")
+    compare_parser.add_argument("--runs", type=int, default=5, help="Timed runs per image")
+    compare_parser.add_argument("--threshold", type=float, default=0.25, help="Detection score threshold")
+    compare_parser.add_argument("--report", help="Write the JSON report to this file")
+    compare_parser.set_defaults(func=command_compare)
+    
+    track_parser = subparsers.add_parser("track-eval", help="Tracked vs. per-frame detection: fps and agreement")
+    track_parser.add_argument("--video", help="Video file (default: synthetic panning scene)")
+    track_parser.add_argument("--frames", type=int, default=120)
+    track_parser.add_argument("--interval", type=int, default=5, help="Keyframe interval")
+    track_parser.add_argument("--scene-change-threshold", type=float, default=12.0)
+    track_parser.add_argument("--backend", default="torch")
+    track_parser.add_argument("--threads", type=int, default=0)
+    track_parser.add_argument("--report", help="Write the JSON report to this file")
+    track_parser.set_defaults(func=command_track_eval)
+    
+    args = parser.parse_args()
+    configure_logging(config.LOG_LEVEL, "text")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,81 +1,320 @@
-import torch
-from PIL import Image
-from transformers import AutoProcessor, AutoModelForObjectDetection
+# OWL-ViT zero-shot detector with pluggable CPU inference backends
+
+import logging
+import threading
+from typing import List, Optional, Tuple
+
 import numpy as np
-import cv2
-from typing import List, Tuple
+import torch
+from transformers import OwlViTProcessor, OwlViTForObjectDetection
+from transformers.models.owlvit.modeling_owlvit import OwlViTObjectDetectionOutput
 
-class EnhancedObjectDetection:
-    def __init__(self):
-        # 1. Primary detector - OWL-ViT is superior to YOLO for industrial objects
-        self.processor = AutoProcessor.from_pretrained("google/owlvit-base-patch32")
-        self.model = AutoModelForObjectDetection.from_pretrained("google/owlvit-base-patch32")
-        
-        # 2. Domain-specific vocabulary for manufacturing
-        self.manufacturing_vocabulary = [
-            # Tools
-            "screwdriver", "hammer", "wrench", "pliers", "saw", "drill", "clamp",
-            "measuring tape", "level", "soldering iron", "multimeter", "caliper",
-            
-            # Safety equipment
-            "safety glasses", "gloves", "mask", "hard hat", "ear protection", "safety boots",
-            "face shield", "respirator", "safety harness", "fire extinguisher",
-            
-            # Materials
-            "wood", "metal", "plastic", "wire", "pipe", "sheet metal", "circuit board",
-            "resistor", "capacitor", "bolt", "screw", "nail", "washer", "nut",
-            
-            # Machinery
-            "lathe", "milling machine", "cnc machine", "band saw", "drill press",
-            "3d printer", "conveyor belt", "robot arm", "welding machine",
+from affordance_analyzer import AffordanceAnalyzer
+from annotation import draw_detections
+from inference_backends import DEFAULT_ONNX_PATH, create_backend
+from postprocessing import merge_tiled_detections, postprocess_detections, synonym_group_ids
+from preprocessing import PixelValuesBuilder
+from site_profiles import DEFAULT_VOCABULARY
+from tiling import region_views, tile_views
+
+logger = logging.getLogger("industrial_ai.detector")
+
+OWLVIT_MODEL_NAME = "google/owlvit-base-patch32"
+
+# Set by preload_owlvit() in a pre-fork parent: forked workers reuse (and share the pages of) these weights
+_preloaded: Optional[Tuple[OwlViTProcessor, OwlViTForObjectDetection]] = None
+
+def load_owlvit() -> Tuple[OwlViTProcessor, OwlViTForObjectDetection]:
+    """Processor and eval-mode model, from the preloaded copy when there is one"""
+    if _preloaded is not None:
+        return _preloaded
+    processor = OwlViTProcessor.from_pretrained(OWLVIT_MODEL_NAME)
+    model = OwlViTForObjectDetection.from_pretrained(OWLVIT_MODEL_NAME).eval()
+    return processor, model
+
+def preload_owlvit() -> Tuple[OwlViTProcessor, OwlViTForObjectDetection]:
+    """
+    Load the weights once before forking workers. The model is only ever
+    read afterwards, so the forked processes keep sharing its pages.
+    """
+    global _preloaded
+    _preloaded = load_owlvit()
+    return _preloaded
+
+class AdvancedIndustrialDetector:
+    """
+    PhD-Level Object Detection combining OWL-ViT with Affordance Theory
+    
+    Research Contribution: Zero-shot detection of industrial objects with
+    real-time affordance-based instruction generation
+    """
+    
+    def __init__(self, backend: str = "torch", num_threads: int = 0,
+                 onnx_path: str = DEFAULT_ONNX_PATH, vocabulary: Optional[List[str]] = None,
+                 score_threshold: float = 0.25, nms_iou_threshold: float = 0.5,
+                 tile_grid: Optional[Tuple[int, int]] = None, tile_overlap: float = 0.2,
+                 tile_min_side: int = 1600):
+        logger.info("🔬 Loading PhD-level detection system...")
+        
+        # 1. Load OWL-ViT with correct model classes
+        self.processor, self.model = load_owlvit()
+        logger.info("✅ OWL-ViT model loaded")
+        
+        # Per-frame image path runs on the configured CPU backend
+        self.backend = create_backend(backend, self.model, onnx_path=onnx_path, num_threads=num_threads)
+        logger.info("✅ Inference backend ready", extra={"backend": self.backend.name})
+        
+        # 2. Manufacturing-specific vocabulary (site profiles pass their own per request)
+        self.manufacturing_vocabulary = vocabulary or list(DEFAULT_VOCABULARY)
+        
+        # 3. Text query embeddings and NMS synonym groups are computed once per vocabulary
+        self.score_threshold = score_threshold
+        self.nms_iou_threshold = nms_iou_threshold
+        self._synonym_group_cache = {}
+        self._text_query_cache = {}
+        self._text_query_lock = threading.Lock()
+        self.get_text_queries(self.manufacturing_vocabulary)
+        logger.info("✅ Cached text embeddings", extra={"queries": len(self.manufacturing_vocabulary)})
+        
+        # Optional tiled mode for high-resolution frames: (columns, rows) tiles + a global view
+        self.tile_grid = tile_grid
+        self.tile_overlap = tile_overlap
+        self.tile_min_side = tile_min_side
+        # Frames go straight to normalized pixel_values in a reused buffer (no PIL / processor copies)
+        self.pixel_values_builder = PixelValuesBuilder.from_image_processor(self.processor.image_processor)
+        self.input_size = self.pixel_values_builder.size
+        if tile_grid is not None:
+            logger.info("✅ Tiled inference enabled", extra={
+                "grid": f"{tile_grid[0]}x{tile_grid[1]}", "overlap": tile_overlap, "min_side": tile_min_side
+            })
+        
+        # 4. Initialize Affordance Theory Engine
+        self.affordance_analyzer = AffordanceAnalyzer()
+        logger.info("✅ Affordance theory engine initialized")
+        
+    def get_text_queries(self, vocabulary: List[str]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Return (query_embeds, query_mask) for a vocabulary, running the
+        OWL-ViT text tower only the first time the vocabulary is seen
+        """
+        key = tuple(vocabulary)
+        with self._text_query_lock:
+            cached = self._text_query_cache.get(key)
+            if cached is not None:
+                return cached
             
-            # Workpieces
-            "workpiece", "assembly", "component", "product", "prototype",
+            text_inputs = self.processor(
+                text=[f"a photo of a {obj}" for obj in vocabulary],
+                return_tensors="pt"
+            )
+            with torch.no_grad():
+                query_embeds = self.model.owlvit.get_text_features(
+                    input_ids=text_inputs["input_ids"],
+                    attention_mask=text_inputs["attention_mask"]
+                )
+            # A query whose first token is 0 is padding (same rule as OWL-ViT forward)
+            query_mask = text_inputs["input_ids"][:, 0] > 0
             
-            # People
-            "person", "worker", "technician", "engineer", "operator"
-        ]
+            cached = (query_embeds.unsqueeze(0), query_mask.unsqueeze(0))
+            self._text_query_cache[key] = cached
+            return cached
+    
+    def predict(self, pixel_values: torch.Tensor, vocabulary: List[str]) -> OwlViTObjectDetectionOutput:
+        """
+        Run only the image tower and the class/box heads against cached
+        text embeddings. Accepts a batch of preprocessed images.
+        """
+        query_embeds, query_mask = self.get_text_queries(vocabulary)
+        batch_size = pixel_values.shape[0]
+        
+        pred_logits, pred_boxes = self.backend.predict(
+            pixel_values,
+            query_embeds.expand(batch_size, -1, -1),
+            query_mask.expand(batch_size, -1)
+        )
+        return OwlViTObjectDetectionOutput(logits=pred_logits, pred_boxes=pred_boxes)
     
     def detect_objects(self, image: np.ndarray) -> Tuple[List[str], List[float], np.ndarray]:
         """
-        Detect objects in the image with confidence scores and return annotated image
+        PhD Research Method: Zero-shot industrial object detection
+        with confidence scoring and visual annotation
+        """
+        return self.detect_objects_batch([image])[0]
+    
+    def detect_objects_batch(self, images: List[np.ndarray], vocabulary: Optional[List[str]] = None,
+                             regions: Optional[List[Optional[List[Tuple[int, int, int, int]]]]] = None
+                             ) -> List[Tuple[List[str], List[float], np.ndarray]]:
+        """
+        Batched zero-shot detection: one OWL-ViT forward pass for all images,
+        results returned per image in input order. vocabulary defaults to
+        manufacturing_vocabulary.
+        """
+        return [
+            self._annotate_detections(image, boxes, objects, scores)
+            for image, (boxes, objects, scores) in zip(images, self.detect_boxes_batch(images, vocabulary, regions))
+        ]
+    
+    def detect_boxes_batch(self, images: List[np.ndarray], vocabulary: Optional[List[str]] = None,
+                           regions: Optional[List[Optional[List[Tuple[int, int, int, int]]]]] = None,
+                           raise_errors: bool = False) -> List[Tuple[np.ndarray, List[str], List[float]]]:
+        """
+        Detection without annotation: (xyxy boxes in image pixels, object
+        names, scores) per image. Used by the stream tracker.
+        
+        regions optionally gives, per image, the (x0, y0, x1, y1) windows
+        (camera zones) to look at; only those crops go through the model.
+        
+        A failed pass returns empty detections, unless raise_errors is set
+        (batch jobs must not record a model failure as "nothing detected").
         """
-        # Convert to PIL Image for OWL-ViT
-        pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-        
-        # Process with OWL-ViT for precise detection
-        inputs = self.processor(text=self.manufacturing_vocabulary, images=pil_image, return_tensors="pt")
-        outputs = self.model(**inputs)
-        
-        # Convert outputs to normalized bounding boxes and scores
-        target_sizes = torch.Tensor([pil_image.size[::-1]])
-        results = self.processor.post_process_object_detection(
-            outputs=outputs, 
-            threshold=0.1,  # Lower threshold to catch more objects
-            target_sizes=target_sizes
-        )[0]
-        
-        # Extract detections
-        boxes = results["boxes"].detach().numpy()
-        scores = results["scores"].detach().numpy()
-        labels = results["labels"].detach().numpy()
-        
-        # Get object names and convert boxes to supervision format
-        detected_objects = [self.manufacturing_vocabulary[i] for i in labels]
-        confidence_scores = scores.tolist()
-        
-        # Draw boxes on image - using basic OpenCV since supervision might not be installed
-        annotated_image = image.copy()
-        for box, label, score in zip(boxes, labels, scores):
-            x1, y1, x2, y2 = box.astype(int)
-            obj_name = self.manufacturing_vocabulary[label]
+        vocabulary = vocabulary or self.manufacturing_vocabulary
+        try:
+            if self.tile_grid is not None or (regions is not None and any(regions)):
+                return self._detect_boxes_tiled(images, vocabulary, regions)
             
-            # Draw rectangle
-            cv2.rectangle(annotated_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            return [
+                (boxes, [vocabulary[label] for label in labels], scores.tolist())
+                for boxes, scores, labels in self._run_views(
+                    images, vocabulary, [image.shape[:2] for image in images]
+                )
+            ]
             
-            # Draw label
-            label_text = f"{obj_name}: {score:.2f}"
-            cv2.putText(annotated_image, label_text, (x1, y1-10), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        except Exception:
+            logger.exception("⚠️ OWL-ViT detection error")
+            if raise_errors:
+                raise
+            return [(np.zeros((0, 4), dtype=np.float32), [], []) for _ in images]
+    
+    def _run_views(self, images: List[np.ndarray], vocabulary: List[str],
+                   target_sizes: List[Tuple[int, int]]) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """One forward pass over all images; boxes decoded to each (height, width) target size"""
+        # One resize per image straight into the normalized batch buffer
+        pixel_values = torch.from_numpy(self.pixel_values_builder(images))
         
-        return detected_objects, confidence_scores, annotated_image
\ No newline at end of file
+        # Process with OWL-ViT using cached manufacturing vocabulary embeddings
+        outputs = self.predict(pixel_values, vocabulary)
+        
+        # Vectorized thresholding + synonym-grouped NMS (keeps distinct instances)
+        return postprocess_detections(
+            outputs.logits,
+            outputs.pred_boxes,
+            torch.Tensor(target_sizes),
+            self.get_synonym_groups(vocabulary),
+            score_threshold=self.score_threshold,
+            iou_threshold=self.nms_iou_threshold
+        )
+    
+    def _detect_boxes_tiled(self, images: List[np.ndarray], vocabulary: List[str],
+                            regions: Optional[List[Optional[List[Tuple[int, int, int, int]]]]] = None
+                            ) -> List[Tuple[np.ndarray, List[str], List[float]]]:
+        """
+        Multi-view detection: every large frame (or region crop) is cut into
+        overlapping tiles plus a global thumbnail, all views of all frames run
+        as one batch, and the boxes are mapped back to frame coordinates and
+        merged across views.
+        """
+        # 1. Views of every frame (small frames and crops stay a single view)
+        regions = regions or [None] * len(images)
+        views = [
+            region_views(image, windows, self.tile_grid, self.tile_overlap, self.tile_min_side, self.input_size)
+            if windows else
+            tile_views(image, self.tile_grid, self.tile_overlap, self.tile_min_side, self.input_size)
+            for image, windows in zip(images, regions)
+        ]
+        flat_views = [view for frame_views in views for view in frame_views]
+        
+        # 2. One forward pass, boxes decoded in each view's window
+        view_results = iter(self._run_views(
+            [view.image for view in flat_views], vocabulary, [view.size for view in flat_views]
+        ))
+        group_ids = self.get_synonym_groups(vocabulary).numpy()
+        
+        # 3. Back to frame coordinates, merged across tiles
+        results = []
+        for frame_views in views:
+            parts = [(view, next(view_results)) for view in frame_views]
+            boxes = np.concatenate([view.to_frame(view_boxes) for view, (view_boxes, _, _) in parts])
+            scores = np.concatenate([view_scores for _, (_, view_scores, _) in parts])
+            labels = np.concatenate([view_labels for _, (_, _, view_labels) in parts])
+            clipped = np.concatenate([view.clipped(view_boxes) for view, (view_boxes, _, _) in parts])
+            
+            keep, merged_scores = merge_tiled_detections(
+                boxes, scores, group_ids[labels], clipped, iou_threshold=self.nms_iou_threshold
+            )
+            results.append((boxes[keep], [vocabulary[label] for label in labels[keep]], merged_scores.tolist()))
+        return results
+    
+    def get_synonym_groups(self, vocabulary: List[str]) -> torch.Tensor:
+        """label index -> synonym group index used by NMS, cached per vocabulary"""
+        key = tuple(vocabulary)
+        with self._text_query_lock:
+            groups = self._synonym_group_cache.get(key)
+            if groups is None:
+                groups = self._synonym_group_cache[key] = synonym_group_ids(vocabulary)
+            return groups
+    
+    def retain_vocabularies(self, vocabularies: List[List[str]]):
+        """Drop cached embeddings and synonym groups of vocabularies no longer in use"""
+        keep = {tuple(vocabulary) for vocabulary in vocabularies}
+        keep.add(tuple(self.manufacturing_vocabulary))
+        # Same lock as the lookups: the engine thread inserts while the profile watcher evicts
+        with self._text_query_lock:
+            for key in [key for key in self._text_query_cache if key not in keep]:
+                del self._text_query_cache[key]
+            for key in [key for key in self._synonym_group_cache if key not in keep]:
+                del self._synonym_group_cache[key]
+    
+    def _annotate_detections(self, image: np.ndarray, boxes: np.ndarray, detected_objects: List[str],
+                             confidence_scores: List[float]) -> Tuple[List[str], List[float], np.ndarray]:
+        """Annotate one image with its post-processed detections"""
+        if len(boxes) == 0:
+            logger.debug("⚠️ No objects detected by OWL-ViT")
+            return [], [], image
+        
+        # Create annotated image with professional styling
+        annotated_image = self._create_professional_annotation(
+            image, boxes, detected_objects, confidence_scores
+        )
+        
+        logger.debug("✅ OWL-ViT detections", extra={"objects": detected_objects})
+        return detected_objects, confidence_scores, annotated_image
+    
+    def _create_professional_annotation(self, image, boxes, objects, scores):
+        """Create publication-quality annotated images"""
+        return draw_detections(image, boxes, objects, scores)
+
+class EnhancedObjectDetection(AdvancedIndustrialDetector):
+    """
+    General workshop detector, kept for existing imports. Shares the
+    AdvancedIndustrialDetector pipeline with a broader, less specific vocabulary.
+    """
+    
+    def __init__(self, backend: str = "torch", num_threads: int = 0, onnx_path: str = DEFAULT_ONNX_PATH):
+        super().__init__(
+            backend=backend,
+            num_threads=num_threads,
+            onnx_path=onnx_path,
+            vocabulary=[
+                # Tools
+                "screwdriver", "hammer", "wrench", "pliers", "saw", "drill", "clamp",
+                "measuring tape", "level", "soldering iron", "multimeter", "caliper",
+                
+                # Safety equipment
+                "safety glasses", "gloves", "mask", "hard hat", "ear protection", "safety boots",
+                "face shield", "respirator", "safety harness", "fire extinguisher",
+                
+                # Materials
+                "wood", "metal", "plastic", "wire", "pipe", "sheet metal", "circuit board",
+                "resistor", "capacitor", "bolt", "screw", "nail", "washer", "nut",
+                
+                # Machinery
+                "lathe", "milling machine", "cnc machine", "band saw", "drill press",
+                "3d printer", "conveyor belt", "robot arm", "welding machine",
+                
+                # Workpieces
+                "workpiece", "assembly", "component", "product", "prototype",
+                
+                # People
+                "person", "worker", "technician", "engineer", "operator"
+            ]
+        )
@@ -0,0 +1,154 @@
+# Vectorized OWL-ViT post-processing with class-aware, synonym-grouped NMS
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import torch
+
+try:
+    from torchvision.ops import batched_nms as _torchvision_batched_nms
+except ImportError:  # torchvision is optional; the pure-torch path below is equivalent
+    _torchvision_batched_nms = None
+
+# Vocabulary entries containing any of these terms describe the same kind of object
+SYNONYM_RULES = [
+    (("mill", "milling"), "milling_machine"),
+    (("lathe", "turning"), "lathe"),
+    (("hat", "helmet"), "head_protection"),
+    (("glasses", "goggles"), "eye_protection"),
+]
+
+
+def synonym_group_key(name: str) -> str:
+    base_name = name.lower()
+    for terms, group_key in SYNONYM_RULES:
+        if any(term in base_name for term in terms):
+            return group_key
+    return base_name.replace(' ', '_')
+
+
+def synonym_group_ids(vocabulary: Sequence[str]) -> torch.Tensor:
+    """label index -> synonym group index, computed once per vocabulary"""
+    groups = {}
+    return torch.tensor([groups.setdefault(synonym_group_key(name), len(groups)) for name in vocabulary])
+
+
+def pairwise_iou(boxes: torch.Tensor) -> torch.Tensor:
+    """IoU matrix for xyxy boxes"""
+    area = (boxes[:, 2] - boxes[:, 0]).clamp(min=0) * (boxes[:, 3] - boxes[:, 1]).clamp(min=0)
+    top_left = torch.max(boxes[:, None, :2], boxes[None, :, :2])
+    bottom_right = torch.min(boxes[:, None, 2:], boxes[None, :, 2:])
+    wh = (bottom_right - top_left).clamp(min=0)
+    intersection = wh[..., 0] * wh[..., 1]
+    return intersection / (area[:, None] + area[None, :] - intersection).clamp(min=1e-9)
+
+
+def grouped_nms(boxes: torch.Tensor, scores: torch.Tensor, groups: torch.Tensor,
+                iou_threshold: float) -> torch.Tensor:
+    """
+    Greedy NMS applied independently within each synonym group. Returns
+    kept indices sorted by descending score; overlapping boxes from
+    different groups never suppress each other.
+    """
+    if len(scores) == 0:
+        return torch.empty(0, dtype=torch.long)
+    if _torchvision_batched_nms is not None:
+        return _torchvision_batched_nms(boxes, scores, groups, iou_threshold)
+    
+    order = scores.argsort(descending=True)
+    boxes, groups = boxes[order], groups[order]
+    suppresses = (pairwise_iou(boxes) > iou_threshold) & (groups[:, None] == groups[None, :])
+    
+    keep = torch.ones(len(order), dtype=torch.bool)
+    for i in range(len(order)):
+        if keep[i]:
+            keep[i + 1:] &= ~suppresses[i, i + 1:]
+    return order[keep]
+
+
+def decode_detections(logits: torch.Tensor, pred_boxes: torch.Tensor, target_sizes: torch.Tensor,
+                      score_threshold: float = 0.25) -> List[Tuple[torch.Tensor, torch.Tensor, torch.Tensor]]:
+    """
+    Best label per patch, score threshold and cxcywh -> image xyxy for a
+    batch. Returns (boxes, scores, labels) tensors per image, before NMS.
+    """
+    best_logits, labels = logits.max(dim=-1)
+    scores = torch.sigmoid(best_logits)
+    
+    cx, cy, w, h = pred_boxes.unbind(-1)
+    boxes = torch.stack([cx - 0.5 * w, cy - 0.5 * h, cx + 0.5 * w, cy + 0.5 * h], dim=-1)
+    img_h, img_w = target_sizes.unbind(-1)
+    boxes = boxes * torch.stack([img_w, img_h, img_w, img_h], dim=-1)[:, None, :]
+    
+    results = []
+    for image_boxes, image_scores, image_labels in zip(boxes, scores, labels):
+        above = image_scores > score_threshold
+        results.append((image_boxes[above], image_scores[above], image_labels[above]))
+    return results
+
+
+def postprocess_detections(logits: torch.Tensor, pred_boxes: torch.Tensor, target_sizes: torch.Tensor,
+                           group_ids: torch.Tensor, score_threshold: float = 0.25,
+                           iou_threshold: float = 0.5) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Batched replacement for post_process_object_detection + per-detection
+    filtering: decode_detections, then grouped NMS. Returns (boxes, scores,
+    labels) per image.
+    """
+    results = []
+    for image_boxes, image_scores, image_labels in decode_detections(logits, pred_boxes, target_sizes, score_threshold):
+        keep = grouped_nms(image_boxes, image_scores, group_ids[image_labels], iou_threshold)
+        results.append((
+            image_boxes[keep].numpy(),
+            image_scores[keep].numpy(),
+            image_labels[keep].numpy(),
+        ))
+    return results
+
+
+def merge_tiled_detections(boxes: np.ndarray, scores: np.ndarray, groups: np.ndarray, clipped: np.ndarray,
+                           iou_threshold: float = 0.5,
+                           containment_threshold: float = 0.7) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge detections from overlapping tiles and the global view of one frame
+    (all boxes already in frame coordinates). Within a synonym group a box
+    suppresses another when their IoU passes iou_threshold, or when one of
+    them was cut by an inner tile edge and the smaller lies mostly inside the
+    larger (intersection / smaller area > containment_threshold).
+    
+    Complete boxes are preferred over cut ones, and each kept box takes the
+    best score of the boxes it absorbed. Returns (kept indices, merged
+    scores), sorted by descending score.
+    """
+    if len(scores) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    
+    order = np.lexsort((-scores, clipped))
+    boxes, scores, groups, clipped = boxes[order], scores[order], groups[order], clipped[order]
+    
+    area = np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+    top_left = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    bottom_right = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+    wh = np.clip(bottom_right - top_left, 0, None)
+    intersection = wh[..., 0] * wh[..., 1]
+    iou = intersection / np.maximum(area[:, None] + area[None, :] - intersection, 1e-9)
+    containment = intersection / np.maximum(np.minimum(area[:, None], area[None, :]), 1e-9)
+    
+    suppresses = (groups[:, None] == groups[None, :]) & (
+        (iou > iou_threshold) | ((clipped[:, None] | clipped[None, :]) & (containment > containment_threshold))
+    )
+    
+    alive = np.ones(len(order), dtype=bool)
+    kept, merged_scores = [], []
+    for i in range(len(order)):
+        if not alive[i]:
+            continue
+        absorbed = alive & suppresses[i]
+        absorbed[:i + 1] = False
+        alive &= ~absorbed
+        kept.append(i)
+        merged_scores.append(scores[absorbed].max(initial=scores[i]))
+    
+    kept, merged_scores = np.asarray(kept), np.asarray(merged_scores, dtype=np.float32)
+    by_score = np.argsort(-merged_scores, kind="stable")
+    return order[kept[by_score]], merged_scores[by_score]
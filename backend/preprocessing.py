@@ -0,0 +1,138 @@
+# Fast OWL-ViT ingest: reduced-scale JPEG decoding and direct-to-tensor preprocessing without PIL
+
+import threading
+from typing import Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+# libjpeg can decode straight to 1/2, 1/4 or 1/8 scale (DCT scaling), skipping most of the IDCT work
+REDUCED_DECODE_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# Start-of-frame markers (baseline, progressive, lossless, ...), which carry the image size
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# OWL-ViT (CLIP) defaults, used when no image processor config is at hand
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+
+def jpeg_size(image_data: bytes) -> Optional[Tuple[int, int]]:
+    """(height, width) from a JPEG's frame header, without decoding; None for other formats"""
+    if not image_data.startswith(b"\xff\xd8"):
+        return None
+    position, end = 2, len(image_data)
+    while position + 4 <= end:
+        if image_data[position] != 0xFF:
+            return None
+        marker = image_data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            position += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if position + 9 > end:
+                return None
+            return (int.from_bytes(image_data[position + 5:position + 7], "big"),
+                    int.from_bytes(image_data[position + 7:position + 9], "big"))
+        position += 2 + int.from_bytes(image_data[position + 2:position + 4], "big")
+    return None
+
+
+def reduction_factor(height: int, width: int, min_side: int) -> int:
+    """Largest decode scale-down (1, 2, 4 or 8) that keeps both sides at least min_side"""
+    if min_side <= 0:
+        return 1
+    for factor in (8, 4, 2):
+        if -(-height // factor) >= min_side and -(-width // factor) >= min_side:
+            return factor
+    return 1
+
+
+def decode_reduced(image_data: bytes, min_side: int = 0) -> Tuple[Optional[np.ndarray], Optional[Tuple[int, int]]]:
+    """
+    Decode JPEG/PNG bytes into a BGR array, at 1/2, 1/4 or 1/8 scale when a
+    JPEG is that much larger than min_side (the model input size) on both
+    sides. Returns the array and the (height, width) of the full-size image.
+    """
+    buffer = np.frombuffer(image_data, np.uint8)
+    size = jpeg_size(image_data) if min_side > 0 else None
+    factor = reduction_factor(*size, min_side) if size is not None else 1
+    image = cv2.imdecode(buffer, REDUCED_DECODE_FLAGS[factor] if factor > 1 else cv2.IMREAD_COLOR)
+    if image is None:
+        return None, None
+    if factor == 1:
+        return image, image.shape[:2]
+
+    height, width = size
+    # EXIF orientation is applied after decoding, so a rotated photo comes out transposed
+    if image.shape[:2] != (-(-height // factor), -(-width // factor)):
+        height, width = width, height
+    return image, (height, width)
+
+
+def scale_boxes(boxes: np.ndarray, from_shape: Tuple[int, ...], to_shape: Tuple[int, ...]) -> np.ndarray:
+    """xyxy boxes in an image of from_shape mapped onto the same image at to_shape"""
+    (from_height, from_width), (to_height, to_width) = from_shape[:2], to_shape[:2]
+    if (from_height, from_width) == (to_height, to_width):
+        return boxes
+    scale = np.array([to_width / from_width, to_height / from_height] * 2, dtype=np.float32)
+    return np.asarray(boxes, dtype=np.float32).reshape(-1, 4) * scale
+
+
+class PixelValuesBuilder:
+    """
+    BGR uint8 frames -> normalized float32 NCHW pixel_values, equivalent to
+    the OWL-ViT image processor (stretch to size x size, RGB, rescale,
+    mean/std normalize) up to interpolation differences.
+
+    Each frame is resized once with OpenCV, and the channel swap, rescale
+    and normalization are fused into one multiply-add per channel that
+    writes into a per-thread batch buffer reused across calls. The returned
+    array is that buffer: it is only valid until the same thread's next call.
+    """
+
+    def __init__(self, size: int = 768, mean: Sequence[float] = CLIP_MEAN, std: Sequence[float] = CLIP_STD):
+        self.size = size
+        std = np.asarray(std, dtype=np.float32)
+        # (pixel / 255 - mean) / std == pixel * scale + offset, per RGB channel
+        self.scale = 1.0 / (255.0 * std)
+        self.offset = -np.asarray(mean, dtype=np.float32) / std
+        self._local = threading.local()
+
+    @classmethod
+    def from_image_processor(cls, image_processor) -> "PixelValuesBuilder":
+        size = image_processor.size
+        return cls(
+            int(size["height"] if isinstance(size, dict) else size),
+            image_processor.image_mean,
+            image_processor.image_std
+        )
+
+    def _buffer(self, batch_size: int) -> np.ndarray:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or len(buffer) < batch_size:
+            buffer = np.empty((batch_size, 3, self.size, self.size), dtype=np.float32)
+            self._local.buffer = buffer
+        return buffer[:batch_size]
+
+    def resize(self, image: np.ndarray) -> np.ndarray:
+        height, width = image.shape[:2]
+        if (height, width) == (self.size, self.size):
+            return image
+        # Area averaging when shrinking (anti-aliased like the processor's PIL resize), bicubic when enlarging
+        interpolation = cv2.INTER_AREA if height > self.size or width > self.size else cv2.INTER_CUBIC
+        return cv2.resize(image, (self.size, self.size), interpolation=interpolation)
+
+    def __call__(self, images: Sequence[np.ndarray]) -> np.ndarray:
+        pixel_values = self._buffer(len(images))
+        for index, image in enumerate(images):
+            resized = self.resize(image)
+            for channel in range(3):
+                # RGB channel c is BGR channel 2 - c
+                out = pixel_values[index, channel]
+                np.multiply(resized[:, :, 2 - channel], self.scale[channel], out=out)
+                out += self.offset[channel]
+        return pixel_values
@@ -0,0 +1,295 @@
+# Multi-process API serving with OWL-ViT weights shared between pre-forked workers
+#
+#   python serve.py run [--workers 4] [--threads-per-worker 0] [--host 0.0.0.0] [--port 8000]
+#   python serve.py scale [--workers 1,2,4] [--duration 20] [--batch-size 1] [--resolution 1280x720]
+#                         [--no-share] [--report scaling.json]
+#
+# The parent loads the weights once (with a single intra-op thread, so no OpenMP pool exists
+# at fork time), freezes the GC generation holding them and forks the workers. The weights are
+# never written afterwards, so their pages stay shared copy-on-write. Each worker is pinned to
+# its own slice of cores and runs that many torch / OpenCV / CPU-pool threads.
+#
+# Per-worker state: admission limits, the frame cache, the render cache and live expert streams
+# (SSE) live in each process, and /metrics reports the worker that answers the scrape. The UI's
+# follow-up requests (image_url, expert_analysis_stream) usually reach another worker, so with
+# more than one worker every analysis is committed to the shared history before its response
+# is sent. A stream requested from a worker that is not generating it polls the history until
+# the generating worker stores the final text (the record is marked expert_pending until then).
+
+import argparse
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from multiprocessing.connection import wait
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+import torch
+
+import config
+from logging_setup import configure_logging
+from metrics import process_memory_bytes
+from model_tools import synthetic_images
+from object_detection import AdvancedIndustrialDetector, preload_owlvit
+
+logger = logging.getLogger("industrial_ai.serve")
+
+# Seconds a stopping worker gets to finish in-flight requests before it is killed
+GRACEFUL_TIMEOUT_S = 30.0
+
+
+def available_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_slices(workers: int, threads_per_worker: int = 0) -> List[List[int]]:
+    """Disjoint core lists, one per worker (they wrap around when more cores are asked for than exist)"""
+    cpus = available_cpus()
+    per_worker = threads_per_worker or max(1, len(cpus) // workers)
+    if workers * per_worker > len(cpus):
+        logger.warning("⚠️ More worker threads than cores, slices overlap", extra={
+            "workers": workers, "threads_per_worker": per_worker, "cpus": len(cpus)
+        })
+    return [[cpus[(index * per_worker + offset) % len(cpus)] for offset in range(per_worker)]
+            for index in range(workers)]
+
+
+def pin_worker(cpus: List[int]):
+    """Restrict this process to its cores and size every thread pool to match"""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(len(cpus))
+    cv2.setNumThreads(len(cpus))
+    # Read by backend_api when the worker imports it
+    config.TORCH_NUM_THREADS = len(cpus)
+    if "CPU_POOL_WORKERS" not in os.environ:
+        config.CPU_POOL_WORKERS = len(cpus)
+
+
+def load_shared_weights():
+    """Load OWL-ViT in the parent so forked workers share it"""
+    # 1. No intra-op thread pool in the parent: OpenMP pools do not survive fork
+    torch.set_num_threads(1)
+
+    # 2. Load the weights once
+    started = time.perf_counter()
+    preload_owlvit()
+    logger.info("✅ Shared OWL-ViT weights loaded", extra={"seconds": round(time.perf_counter() - started, 2)})
+
+    # 3. Keep the GC from touching (and so un-sharing) the pages of objects that exist at fork time
+    gc.collect()
+    gc.freeze()
+
+
+def listen_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve_worker(index: int, cpus: List[int], sock: socket.socket):
+    """One API process: pinned, then uvicorn on the inherited listening socket"""
+    pin_worker(cpus)
+    import uvicorn
+    import backend_api
+
+    logger.info("🔧 Worker started", extra={"worker": index, "pid": os.getpid(), "cpus": cpus})
+    server = uvicorn.Server(uvicorn.Config(backend_api.app, log_config=None))
+    server.run(sockets=[sock])
+
+
+def command_run(args):
+    context = multiprocessing.get_context("fork")
+    slices = cpu_slices(args.workers, args.threads_per_worker)
+    sock = listen_socket(args.host, args.port)
+    load_shared_weights()
+    # Inherited by the forked workers: backend_api commits history before responding when > 1
+    config.SERVE_WORKERS = args.workers
+
+    def start(index: int) -> multiprocessing.Process:
+        process = context.Process(target=serve_worker, args=(index, slices[index], sock), name=f"api-worker-{index}")
+        process.start()
+        return process
+
+    workers = {index: start(index) for index in range(args.workers)}
+    print(f"🚀 Serving on http://{args.host}:{args.port} with {args.workers} workers")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Restart workers that die; the weights are still loaded here, so a restart is cheap
+    while not stopping:
+        wait([process.sentinel for process in workers.values()], timeout=1.0)
+        for index, process in list(workers.items()):
+            if not process.is_alive() and not stopping:
+                logger.warning("⚠️ Worker exited, restarting", extra={"worker": index, "exitcode": process.exitcode})
+                time.sleep(1.0)
+                workers[index] = start(index)
+
+    for process in workers.values():
+        if process.is_alive():
+            process.terminate()
+    deadline = time.monotonic() + GRACEFUL_TIMEOUT_S
+    for process in workers.values():
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            process.kill()
+    sock.close()
+    print("👋 All workers stopped")
+
+
+def scale_worker(index: int, cpus: List[int], shared: bool, images: List[np.ndarray], batch_size: int,
+                 duration_s: float, ready, go, results):
+    """Throughput probe: detector batches for duration_s, then report frames and memory"""
+    pin_worker(cpus)
+    if not shared:
+        # Baseline: every worker loads its own copy, as separate uvicorn workers did
+        import object_detection
+        object_detection._preloaded = None
+    detector = AdvancedIndustrialDetector(
+        backend=config.DETECTOR_BACKEND,
+        num_threads=len(cpus),
+        onnx_path=config.ONNX_MODEL_PATH,
+        score_threshold=config.DETECTION_SCORE_THRESHOLD,
+        nms_iou_threshold=config.NMS_IOU_THRESHOLD
+    )
+    batches = [images[i:i + batch_size] for i in range(0, len(images) - batch_size + 1, batch_size)]
+    detector.detect_boxes_batch(batches[0])
+    detector.detect_boxes_batch(batches[0])
+    ready.put(index)
+    go.wait()
+
+    frames, latencies_ms = 0, []
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration_s:
+        batch = batches[len(latencies_ms) % len(batches)]
+        batch_started = time.perf_counter()
+        detector.detect_boxes_batch(batch)
+        latencies_ms.append((time.perf_counter() - batch_started) * 1000.0)
+        frames += len(batch)
+    seconds = time.perf_counter() - started
+
+    results.put({
+        "worker": index,
+        "cpus": cpus,
+        "frames": frames,
+        "seconds": round(seconds, 3),
+        "fps": round(frames / seconds, 3),
+        "p50_batch_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        **{f"{key}_mb": round(value / 2 ** 20, 1) for key, value in process_memory_bytes().items()},
+    })
+
+
+def scale_case(workers: int, args, images: List[np.ndarray]) -> Dict[str, Any]:
+    context = multiprocessing.get_context("fork")
+    ready, results, go = context.Queue(), context.Queue(), context.Event()
+    slices = cpu_slices(workers, args.threads_per_worker)
+    processes = [
+        context.Process(target=scale_worker, args=(index, slices[index], not args.no_share, images,
+                                                   args.batch_size, args.duration, ready, go, results))
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get()
+    go.set()
+    per_worker = sorted((results.get() for _ in processes), key=lambda entry: entry["worker"])
+    parent = process_memory_bytes()
+    for process in processes:
+        process.join()
+
+    def total(key: str) -> float:
+        return round(sum(entry.get(key, 0.0) for entry in per_worker), 1)
+
+    return {
+        "workers": workers,
+        "threads_per_worker": len(slices[0]),
+        "throughput_fps": round(sum(entry["frames"] for entry in per_worker)
+                                / max(entry["seconds"] for entry in per_worker), 3),
+        "rss_per_worker_mb": round(total("rss_mb") / workers, 1),
+        "uss_per_worker_mb": round(total("uss_mb") / workers, 1),
+        # Workers plus the parent holding the shared weights: the real footprint of the deployment
+        "total_pss_mb": round(total("pss_mb") + parent.get("pss", 0.0) / 2 ** 20, 1),
+        "per_worker": per_worker,
+    }
+
+
+def command_scale(args):
+    if not args.no_share:
+        load_shared_weights()
+    width, height = (int(part) for part in args.resolution.lower().split("x"))
+    images = synthetic_images(max(8, args.batch_size), size=(height, width))
+
+    cases = []
+    for workers in [int(value) for value in args.workers.split(",")]:
+        print(f"⏱️ {workers} worker(s), {'shared' if not args.no_share else 'per-worker'} weights...")
+        case = scale_case(workers, args, images)
+        print(f"✅ {workers} worker(s): {case['throughput_fps']} fps, "
+              f"RSS {case['rss_per_worker_mb']} MB/worker, USS {case['uss_per_worker_mb']} MB/worker, "
+              f"total PSS {case['total_pss_mb']} MB")
+        cases.append(case)
+
+    report = {
+        "backend": config.DETECTOR_BACKEND,
+        "shared_weights": not args.no_share,
+        "cpus": len(available_cpus()),
+        "batch_size": args.batch_size,
+        "resolution": args.resolution,
+        "duration_s": args.duration,
+        "cases": cases,
+    }
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report written to {args.report}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process serving with shared OWL-ViT weights")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Serve the API from pre-forked workers")
+    run_parser.add_argument("--workers", type=int, default=config.SERVE_WORKERS)
+    run_parser.add_argument("--threads-per-worker", type=int, default=config.SERVE_THREADS_PER_WORKER,
+                            help="Cores pinned to each worker (0 = split the available cores evenly)")
+    run_parser.add_argument("--host", default=config.SERVE_HOST)
+    run_parser.add_argument("--port", type=int, default=config.SERVE_PORT)
+    run_parser.set_defaults(func=command_run)
+
+    scale_parser = subparsers.add_parser("scale", help="Per-worker memory and aggregate throughput vs. worker count")
+    scale_parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    scale_parser.add_argument("--threads-per-worker", type=int, default=config.SERVE_THREADS_PER_WORKER)
+    scale_parser.add_argument("--duration", type=float, default=20.0, help="Timed seconds per worker count")
+    scale_parser.add_argument("--batch-size", type=int, default=1)
+    scale_parser.add_argument("--resolution", default="1280x720", help="Synthetic frame size (WxH)")
+    scale_parser.add_argument("--no-share", action="store_true",
+                              help="Load the weights in every worker instead (the old multi-worker behaviour)")
+    scale_parser.add_argument("--report", help="Write the JSON report to this file")
+    scale_parser.set_defaults(func=command_scale)
+
+    args = parser.parse_args()
+    configure_logging(config.LOG_LEVEL, "text" if args.command == "scale" else config.LOG_FORMAT)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# Per-site detection vocabularies and affordance rule profiles, hot-reloaded from JSON files
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from affordance_analyzer import AffordanceAnalyzer
+from zones import CameraZones
+
+logger = logging.getLogger("industrial_ai.profiles")
+
+# Manufacturing vocabulary used when no site profile narrows it down
+DEFAULT_VOCABULARY = [
+    # More Specific Person Terms
+    "industrial worker", "machinist", "operator", "technician", "engineer",
+    "supervisor", "inspector", "apprentice", "person", "worker",
+
+    # More Specific Equipment
+    "CNC mill", "vertical mill", "horizontal mill", "milling machine",
+    "precision lathe", "metal lathe", "turning machine", "lathe",
+    "drill press", "band saw", "welding machine", "cnc machine",
+
+    # More Specific Safety Terms
+    "safety helmet", "hard hat", "protective helmet", "safety glasses",
+    "protective glasses", "safety goggles", "work gloves", "safety gloves",
+    "protective gloves", "face mask", "safety mask", "respirator",
+
+    # Precision Tools
+    "screwdriver", "hammer", "wrench", "pliers", "saw", "drill", "clamp",
+    "measuring tape", "level", "soldering iron", "multimeter", "caliper",
+    "micrometer", "torque wrench", "allen key", "file", "chisel",
+
+    # Materials & Components
+    "wood", "metal", "plastic", "wire", "pipe", "sheet metal",
+    "circuit board", "resistor", "capacitor", "bolt", "screw",
+    "nail", "washer", "nut", "bearing", "spring",
+
+    # Workpieces & Assemblies
+    "workpiece", "assembly", "component", "product", "prototype",
+    "jig", "fixture", "template", "blueprint", "schematic",
+
+    # Common Objects (for broader detection)
+    "laptop", "computer", "phone", "tablet", "camera", "bottle", "cup",
+    "pen", "pencil", "paper", "book", "chair", "table", "box",
+    "scissors", "knife", "spoon", "fork"
+]
+
+# Optional affordance tables a profile file may override (missing ones keep the built-in rules)
+AFFORDANCE_TABLES = ("affordances", "task_patterns", "tool_pairs", "dangerous_tools", "safety_equipment", "next_steps")
+
+
+class SiteProfile:
+    """
+    One version of a named site profile: the OWL-ViT query vocabulary, an
+    AffordanceAnalyzer whose rule indexes were compiled when the file loaded,
+    and the work-area zones of the site's fixed cameras
+    """
+
+    def __init__(self, name: str, version: str, vocabulary: List[str], analyzer: AffordanceAnalyzer,
+                 description: str = "", source: Optional[str] = None,
+                 cameras: Optional[Dict[str, CameraZones]] = None):
+        self.name = name
+        self.version = version
+        self.vocabulary = vocabulary
+        self.analyzer = analyzer
+        self.description = description
+        self.source = source
+        self.cameras = cameras or {}
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@{self.version}"
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "description": self.description,
+            "source": self.source,
+            "vocabulary_size": len(self.vocabulary),
+            "cameras": sorted(self.cameras),
+        }
+
+    def camera_zones(self, camera: Optional[str]) -> Optional[CameraZones]:
+        """Zones of a camera / station id; None (whole frame) for cameras without zones"""
+        return self.cameras.get(camera) if camera else None
+
+
+def builtin_profile(name: str = "default") -> SiteProfile:
+    """Profile backed by the in-code vocabulary and affordance rules"""
+    return SiteProfile(name, "builtin", list(DEFAULT_VOCABULARY), AffordanceAnalyzer(),
+                       description="Built-in manufacturing vocabulary")
+
+
+def load_profile_file(path: str) -> SiteProfile:
+    """
+    Parse a profile JSON file:
+    {"description": ..., "vocabulary": [...], "task_patterns": {...}, "tool_pairs": [[[a, b], activity]], ...,
+     "cameras": {"<camera id>": {"zones": [{"name": ..., "rect": [x0, y0, x1, y1]}, ...]}}}
+    The version is a content hash, so an unchanged file keeps its caches.
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+    data = json.loads(content)
+
+    name = data.get("name") or os.path.splitext(os.path.basename(path))[0]
+    vocabulary = data.get("vocabulary") or DEFAULT_VOCABULARY
+    if not isinstance(vocabulary, list) or not all(isinstance(term, str) for term in vocabulary):
+        raise ValueError("'vocabulary' must be a list of strings")
+
+    tables = {table: data[table] for table in AFFORDANCE_TABLES if table in data}
+    analyzer = AffordanceAnalyzer(**tables)
+
+    cameras = {camera: CameraZones.from_dict(camera, spec) for camera, spec in data.get("cameras", {}).items()}
+    for camera_zones in cameras.values():
+        for zone in camera_zones.zones:
+            unknown = set(zone.task_phases or ()) - set(analyzer.task_patterns)
+            if unknown:
+                raise ValueError(f"Zone {zone.name!r} of camera {camera_zones.camera!r} has unknown task phases: {sorted(unknown)}")
+
+    return SiteProfile(
+        name,
+        hashlib.sha256(content).hexdigest()[:12],
+        list(vocabulary),
+        analyzer,
+        description=data.get("description", ""),
+        source=path,
+        cameras=cameras
+    )
+
+
+class ProfileRegistry:
+    """
+    Named site profiles loaded from *.json files in profile_dir.
+
+    A background thread polls the directory and swaps in new versions of
+    changed files without a restart; a file that fails to parse keeps its
+    previous version. Listeners are called with the full profile list after
+    every change so per-version caches (text embeddings) can be prepared
+    before requests use the new version.
+
+    Profiles are keyed by their "name" (the file name when absent). When
+    several files use the same name, the first path in sorted order wins
+    and the others are skipped with a warning. A file may take the name of
+    the built-in profile ("default") to replace it with a site-wide
+    vocabulary; the built-in returns when that file is removed.
+    """
+
+    def __init__(self, profile_dir: str, default_profile: str = "default", reload_interval_s: float = 2.0):
+        self.profile_dir = profile_dir
+        self.default_profile = default_profile
+        self.reload_interval_s = reload_interval_s
+
+        self._builtin = builtin_profile()
+        self._profiles: Dict[str, SiteProfile] = {}
+        self._file_state: Dict[str, Tuple[int, int]] = {}
+        self._file_profiles: Dict[str, SiteProfile] = {}
+        self._listeners: List[Callable[[List[SiteProfile]], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.reload()
+
+    def add_listener(self, listener: Callable[[List[SiteProfile]], None]):
+        self._listeners.append(listener)
+
+    def get(self, name: Optional[str] = None) -> Optional[SiteProfile]:
+        """Current version of a profile (the default profile when name is empty)"""
+        return self._profiles.get(name or self.default_profile)
+
+    def profiles(self) -> List[SiteProfile]:
+        return sorted(self._profiles.values(), key=lambda profile: profile.name)
+
+    def reload(self) -> bool:
+        """Rescan profile_dir; returns True when any profile was added, changed or removed"""
+        with self._lock:
+            paths = []
+            if os.path.isdir(self.profile_dir):
+                paths = sorted(
+                    os.path.join(self.profile_dir, filename)
+                    for filename in os.listdir(self.profile_dir) if filename.endswith(".json")
+                )
+
+            changed = set(self._file_state) != set(paths)
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                state = (stat.st_mtime_ns, stat.st_size)
+                if self._file_state.get(path) == state:
+                    continue
+
+                self._file_state[path] = state
+                try:
+                    profile = load_profile_file(path)
+                except Exception as e:
+                    logger.warning("⚠️ Site profile not loaded", extra={"path": path, "error": str(e)})
+                    continue
+
+                previous = self._file_profiles.get(path)
+                if previous is None or previous.version != profile.version or previous.name != profile.name:
+                    self._file_profiles[path] = profile
+                    changed = True
+                    logger.info("📋 Loaded site profile", extra={"site_profile": profile.key, "queries": len(profile.vocabulary)})
+
+            for path in set(self._file_state) - set(paths):
+                del self._file_state[path]
+                self._file_profiles.pop(path, None)
+
+            if not changed and self._profiles:
+                return False
+
+            profiles = {self._builtin.name: self._builtin}
+            sources: Dict[str, str] = {}
+            for path, profile in sorted(self._file_profiles.items()):
+                if profile.name in sources:
+                    logger.warning("⚠️ Duplicate site profile name, file skipped", extra={
+                        "site_profile": profile.name, "path": path, "kept_path": sources[profile.name]
+                    })
+                    continue
+                if profile.name == self._builtin.name:
+                    logger.info("📋 Site profile file replaces the built-in profile", extra={
+                        "site_profile": profile.name, "path": path
+                    })
+                sources[profile.name] = path
+                profiles[profile.name] = profile
+            self._profiles = profiles
+            current = self.profiles()
+
+        for listener in self._listeners:
+            try:
+                listener(current)
+            except Exception:
+                logger.exception("⚠️ Site profile listener failed")
+        return True
+
+    def start(self):
+        """Poll profile_dir for changes in the background (no-op when reload_interval_s <= 0)"""
+        if self._thread is None and self.reload_interval_s > 0:
+            self._thread = threading.Thread(target=self._watch, name="profile-watcher", daemon=True)
+            self._thread.start()
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval_s):
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("⚠️ Site profile reload failed")
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
@@ -0,0 +1,116 @@
+# Live-stream analysis sessions with latest-frame-wins frame dropping
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class FrameDropped(Exception):
+    """The frame was not analyzed (server full, deadline); the session carries on with the next one"""
+
+
+class LatestFrameSlot:
+    """Single-slot mailbox: a new frame overwrites any frame not yet analyzed"""
+    
+    def __init__(self):
+        self._entry = None
+        self._event = asyncio.Event()
+    
+    def put(self, entry: Any) -> bool:
+        """Store the newest frame; returns True if a stale frame was dropped"""
+        dropped = self._entry is not None
+        self._entry = entry
+        self._event.set()
+        return dropped
+    
+    async def get(self) -> Any:
+        """Wait for a frame and take it out of the slot"""
+        await self._event.wait()
+        entry, self._entry = self._entry, None
+        self._event.clear()
+        return entry
+
+
+class StreamSession:
+    """
+    One live camera stream. Frames are received continuously, but only the
+    most recent one is analyzed whenever the previous analysis has finished,
+    so latency stays bounded by roughly two inference times instead of
+    growing with a backlog.
+    
+    analyze_fn may raise FrameDropped to skip a frame; the client gets a
+    "dropped" message and the frame counts as dropped, not analyzed.
+    """
+    
+    def __init__(self, analyze_fn: Callable[[Any], Awaitable[Dict[str, Any]]],
+                 send_fn: Callable[[Dict[str, Any]], Awaitable[None]],
+                 on_frame_dropped: Optional[Callable[[], None]] = None):
+        self.analyze_fn = analyze_fn
+        self.send_fn = send_fn
+        self.on_frame_dropped = on_frame_dropped
+        self.slot = LatestFrameSlot()
+        
+        self.started_at = time.monotonic()
+        self.frames_received = 0
+        self.frames_analyzed = 0
+        self.frames_dropped = 0
+        self._latencies_ms = deque(maxlen=100)
+    
+    async def run(self, receive_fn: Callable[[], Awaitable[Optional[Any]]]):
+        """Receive frames until receive_fn returns None (client disconnected)"""
+        analyzer = asyncio.create_task(self._analyze_loop())
+        try:
+            while True:
+                frame = await receive_fn()
+                if frame is None:
+                    break
+                self.frames_received += 1
+                if self.slot.put((time.monotonic(), frame)):
+                    self.frames_dropped += 1
+                    if self.on_frame_dropped is not None:
+                        self.on_frame_dropped()
+        finally:
+            analyzer.cancel()
+            await asyncio.gather(analyzer, return_exceptions=True)
+    
+    async def _analyze_loop(self):
+        while True:
+            received_at, frame = await self.slot.get()
+            try:
+                result = await self.analyze_fn(frame)
+                message = {"type": "detections", **result}
+            except FrameDropped as e:
+                self.frames_dropped += 1
+                if self.on_frame_dropped is not None:
+                    self.on_frame_dropped()
+                await self.send_fn({
+                    "type": "dropped",
+                    "detail": str(e),
+                    "latency_ms": round((time.monotonic() - received_at) * 1000.0, 1),
+                    "stats": self.stats(),
+                })
+                continue
+            except Exception as e:
+                message = {"type": "error", "detail": str(e)}
+            
+            latency_ms = (time.monotonic() - received_at) * 1000.0
+            self.frames_analyzed += 1
+            self._latencies_ms.append(latency_ms)
+            
+            message["latency_ms"] = round(latency_ms, 1)
+            message["stats"] = self.stats()
+            await self.send_fn(message)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Per-session counters and recent end-to-end latency"""
+        latencies = list(self._latencies_ms)
+        elapsed = time.monotonic() - self.started_at
+        return {
+            "frames_received": self.frames_received,
+            "frames_analyzed": self.frames_analyzed,
+            "frames_dropped": self.frames_dropped,
+            "analyzed_fps": round(self.frames_analyzed / elapsed, 2) if elapsed > 0 else 0.0,
+            "mean_latency_ms": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+            "max_latency_ms": round(max(latencies), 1) if latencies else 0.0,
+        }
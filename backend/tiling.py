@@ -0,0 +1,105 @@
+# Overlapping tiles + a global thumbnail, for small-object recall on high-resolution frames
+
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# A box within this fraction of a tile side from an inner tile edge was probably cut by the tile
+EDGE_MARGIN = 0.02
+
+
+def parse_tile_grid(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """"3x2" -> (3 columns, 2 rows); empty / "off" / "1x1" disable tiling"""
+    if not value or value.lower() in ("off", "none", "0"):
+        return None
+    cols, rows = (int(part) for part in value.lower().split("x"))
+    if cols < 1 or rows < 1:
+        raise ValueError(f"Invalid tile grid: {value}")
+    return None if cols == rows == 1 else (cols, rows)
+
+
+def tile_windows(height: int, width: int, cols: int, rows: int,
+                 overlap: float = 0.2) -> List[Tuple[int, int, int, int]]:
+    """(x0, y0, x1, y1) windows of a cols x rows grid where neighbours share `overlap` of a tile side"""
+    def spans(length: int, count: int) -> List[Tuple[int, int]]:
+        if count == 1:
+            return [(0, length)]
+        tile = length / (count - (count - 1) * overlap)
+        step = tile * (1.0 - overlap)
+        return [(int(round(i * step)), length if i == count - 1 else int(round(i * step + tile)))
+                for i in range(count)]
+
+    return [(x0, y0, x1, y1) for y0, y1 in spans(height, rows) for x0, x1 in spans(width, cols)]
+
+
+class TileView:
+    """One model input cut from a frame: its pixels and the window it covers"""
+
+    __slots__ = ("image", "x0", "y0", "x1", "y1", "inner_edges")
+
+    def __init__(self, image: np.ndarray, window: Tuple[int, int, int, int], frame_shape: Tuple[int, ...]):
+        self.image = image
+        self.x0, self.y0, self.x1, self.y1 = window
+        height, width = frame_shape[:2]
+        # Left, top, right, bottom: True where the window edge lies inside the frame
+        self.inner_edges = np.array([self.x0 > 0, self.y0 > 0, self.x1 < width, self.y1 < height])
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(height, width) of the window in frame pixels, the target size for box decoding"""
+        return self.y1 - self.y0, self.x1 - self.x0
+
+    def to_frame(self, boxes: np.ndarray) -> np.ndarray:
+        """Window xyxy -> frame xyxy"""
+        return boxes + np.array([self.x0, self.y0, self.x0, self.y0], dtype=boxes.dtype)
+
+    def clipped(self, boxes: np.ndarray) -> np.ndarray:
+        """Boxes (window xyxy) touching an inner tile edge, i.e. possibly only part of an object"""
+        height, width = self.size
+        margin_x, margin_y = EDGE_MARGIN * width, EDGE_MARGIN * height
+        touches = np.stack([
+            boxes[:, 0] <= margin_x,
+            boxes[:, 1] <= margin_y,
+            boxes[:, 2] >= width - margin_x,
+            boxes[:, 3] >= height - margin_y,
+        ], axis=1)
+        return (touches & self.inner_edges).any(axis=1)
+
+
+def tile_views(image: np.ndarray, grid: Optional[Tuple[int, int]], overlap: float = 0.2,
+               min_side: int = 0, input_size: int = 768) -> List[TileView]:
+    """
+    The model inputs for one frame. Frames below min_side (or with tiling
+    off) are a single untouched view; larger frames become the grid tiles
+    plus a global thumbnail, each pre-shrunk to the model input size with
+    area interpolation (cheaper and less aliased than the processor resize).
+    """
+    height, width = image.shape[:2]
+    if grid is None or max(height, width) < min_side:
+        return [TileView(image, (0, 0, width, height), image.shape)]
+
+    def shrink(crop: np.ndarray) -> np.ndarray:
+        if max(crop.shape[:2]) <= input_size:
+            return crop
+        return cv2.resize(crop, (input_size, input_size), interpolation=cv2.INTER_AREA)
+
+    cols, rows = grid
+    views = [TileView(shrink(image), (0, 0, width, height), image.shape)]
+    for x0, y0, x1, y1 in tile_windows(height, width, cols, rows, overlap):
+        views.append(TileView(shrink(image[y0:y1, x0:x1]), (x0, y0, x1, y1), image.shape))
+    return views
+
+
+def region_views(image: np.ndarray, windows: List[Tuple[int, int, int, int]], grid: Optional[Tuple[int, int]],
+                 overlap: float = 0.2, min_side: int = 0, input_size: int = 768) -> List[TileView]:
+    """
+    The model inputs for selected (x0, y0, x1, y1) regions of a frame (camera
+    zones): each region is cropped and treated like a frame of its own (tiled
+    when large), with the view windows kept in frame coordinates
+    """
+    views = []
+    for x0, y0, x1, y1 in windows:
+        for view in tile_views(image[y0:y1, x0:x1], grid, overlap, min_side, input_size):
+            views.append(TileView(view.image, (view.x0 + x0, view.y0 + y0, view.x1 + x0, view.y1 + y0), image.shape))
+    return views
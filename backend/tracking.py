@@ -0,0 +1,283 @@
+# Temporal object tracking for camera streams: full OWL-ViT detection on keyframes only
+
+import itertools
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def box_iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between two sets of xyxy boxes"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+class KalmanBoxFilter:
+    """Constant-velocity Kalman filter over box centre and size (cx, cy, w, h)"""
+
+    def __init__(self, box: np.ndarray, process_noise: float = 4.0, measurement_noise: float = 1.0):
+        x1, y1, x2, y2 = (float(v) for v in box)
+        self.x = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, 0, 0, 0, 0], dtype=np.float64)
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 100.0, 100.0, 100.0, 100.0])
+        self.F = np.eye(8)
+        self.F[:4, 4:] = np.eye(4)
+        self.H = np.eye(4, 8)
+        self.Q = np.diag([process_noise] * 4 + [process_noise * 0.01] * 4)
+        self.R = np.eye(4) * measurement_noise
+
+    def predict(self):
+        self.x = self.F @ self.x
+        self.x[2:4] = np.maximum(self.x[2:4], 1.0)
+        self.P = self.F @ self.P @ self.F.T + self.Q
+
+    def update(self, box: np.ndarray):
+        x1, y1, x2, y2 = (float(v) for v in box)
+        z = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1])
+        y = z - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+
+    @property
+    def box(self) -> np.ndarray:
+        cx, cy, w, h = self.x[:4]
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+
+class Track:
+    """One tracked object with a stable id across keyframes"""
+
+    def __init__(self, track_id: int, label: str, score: float, box: np.ndarray, frame_index: int):
+        self.id = track_id
+        self.label = label
+        self.score = score
+        self.filter = KalmanBoxFilter(box)
+        self.first_frame = frame_index
+        self.last_detected_frame = frame_index
+        self.hits = 1
+        self.misses = 0
+
+    @property
+    def box(self) -> np.ndarray:
+        return self.filter.box
+
+    def to_dict(self, frame_index: int, image_shape: Tuple[int, ...]) -> Dict[str, Any]:
+        height, width = image_shape[:2]
+        x1, y1, x2, y2 = self.box
+        return {
+            "id": self.id,
+            "label": self.label,
+            "score": round(float(self.score), 4),
+            "box": [int(max(0, x1)), int(max(0, y1)), int(min(width, x2)), int(min(height, y2))],
+            "age_frames": frame_index - self.first_frame,
+            "frames_since_detection": frame_index - self.last_detected_frame,
+            "hits": self.hits,
+        }
+
+
+class ObjectTracker:
+    """
+    Carries detections between keyframes so OWL-ViT does not have to run on
+    every frame of a slowly changing workshop scene.
+
+    Between keyframes each track's box is moved by the median sparse
+    optical flow (Lucas-Kanade) of corner points inside it, smoothed by a
+    constant-velocity Kalman filter. A keyframe (full detection) is
+    requested every keyframe_interval frames, when the scene-change score
+    (mean absolute difference of a small grayscale thumbnail against the
+    last keyframe, 0-255) exceeds scene_change_threshold, or when flow is
+    lost for most tracks. On keyframes detections are matched to tracks by
+    IoU (same label), so track ids persist while objects stay in view.
+
+    Not thread-safe: use one tracker per stream, fed frames in order.
+    """
+
+    def __init__(self, keyframe_interval: int = 5, scene_change_threshold: float = 12.0,
+                 iou_threshold: float = 0.3, max_misses: int = 2, flow_max_side: int = 480,
+                 min_flow_points: int = 3):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.scene_change_threshold = scene_change_threshold
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.flow_max_side = flow_max_side
+        self.min_flow_points = min_flow_points
+
+        self.tracks: List[Track] = []
+        self.frame_index = -1
+        self.frames_since_keyframe = 0
+        self.keyframes = 0
+        self.propagated_frames = 0
+        self._ids = itertools.count(1)
+        self._keyframe_thumb: Optional[np.ndarray] = None
+        self._previous_gray: Optional[np.ndarray] = None
+        self._previous_scale = 1.0
+        self._flow_lost = False
+        self._prepared: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, float]] = None
+
+    def _prepare(self, frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray, float]:
+        """Downscaled grayscale for flow and a 64x36 thumbnail for scene change, computed once per frame"""
+        if self._prepared is not None and self._prepared[0] is frame:
+            return self._prepared[1:]
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        scale = min(1.0, self.flow_max_side / max(gray.shape[:2]))
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        thumb = cv2.resize(gray, (64, 36), interpolation=cv2.INTER_AREA).astype(np.float32)
+        self._prepared = (frame, gray, thumb, scale)
+        return gray, thumb, scale
+
+    def scene_change(self, frame: np.ndarray) -> float:
+        _, thumb, _ = self._prepare(frame)
+        if self._keyframe_thumb is None:
+            return float("inf")
+        return float(np.abs(thumb - self._keyframe_thumb).mean())
+
+    def needs_detection(self, frame: np.ndarray) -> Tuple[bool, str]:
+        """Whether this frame should be a keyframe, and why"""
+        if self._keyframe_thumb is None:
+            return True, "first_frame"
+        if self.frames_since_keyframe + 1 >= self.keyframe_interval:
+            return True, "interval"
+        if self._flow_lost:
+            return True, "tracking_lost"
+        if self.scene_change(frame) > self.scene_change_threshold:
+            return True, "scene_change"
+        return False, ""
+
+    def _advance(self, frame: np.ndarray):
+        """Predict every track into the new frame and refine with optical flow when possible"""
+        gray, _, scale = self._prepare(frame)
+        self.frame_index += 1
+        previous_boxes = [track.box for track in self.tracks]
+        for track in self.tracks:
+            track.filter.predict()
+
+        if self._previous_gray is None or not self.tracks or self._previous_gray.shape != gray.shape:
+            return
+
+        # Corner points inside each track box (in flow-image coordinates), tracked in one LK call
+        points, owners = [], []
+        for index, track in enumerate(self.tracks):
+            x1, y1, x2, y2 = (previous_boxes[index] * self._previous_scale).astype(int)
+            x1, y1 = max(x1, 0), max(y1, 0)
+            x2, y2 = min(x2, gray.shape[1]), min(y2, gray.shape[0])
+            if x2 - x1 < 4 or y2 - y1 < 4:
+                continue
+            corners = cv2.goodFeaturesToTrack(self._previous_gray[y1:y2, x1:x2], maxCorners=20,
+                                              qualityLevel=0.01, minDistance=3)
+            if corners is None:
+                continue
+            corners = corners.reshape(-1, 2) + np.array([x1, y1], dtype=np.float32)
+            points.append(corners)
+            owners.extend([index] * len(corners))
+
+        if not points:
+            self._flow_lost = True
+            return
+
+        previous_points = np.concatenate(points).astype(np.float32).reshape(-1, 1, 2)
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(self._previous_gray, gray, previous_points, None,
+                                                          winSize=(15, 15), maxLevel=2)
+        status = status.reshape(-1).astype(bool)
+        shifts = (next_points - previous_points).reshape(-1, 2) / scale
+        owners = np.asarray(owners)
+
+        lost = 0
+        for index, track in enumerate(self.tracks):
+            valid = (owners == index) & status
+            if valid.sum() < self.min_flow_points:
+                lost += 1
+                continue
+            dx, dy = np.median(shifts[valid], axis=0)
+            track.filter.update(previous_boxes[index] + np.array([dx, dy, dx, dy]))
+        self._flow_lost = lost > len(self.tracks) / 2
+
+    def _finish_frame(self, frame: np.ndarray):
+        gray, _, scale = self._prepare(frame)
+        self._previous_gray = gray
+        self._previous_scale = scale
+
+    def propagate(self, frame: np.ndarray) -> List[Track]:
+        """Non-keyframe: move existing tracks without running the detector"""
+        self._advance(frame)
+        self._finish_frame(frame)
+        self.frames_since_keyframe += 1
+        self.propagated_frames += 1
+        return self.visible_tracks()
+
+    def update(self, frame: np.ndarray, boxes: np.ndarray, labels: List[str], scores: List[float]) -> List[Track]:
+        """Keyframe: associate fresh detections with tracks, start new tracks, retire missed ones"""
+        self._advance(frame)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+        # Greedy IoU matching, best pairs first, labels must agree
+        track_boxes = np.array([track.box for track in self.tracks]).reshape(-1, 4)
+        iou = box_iou_matrix(track_boxes, boxes)
+        for t, track in enumerate(self.tracks):
+            for d, label in enumerate(labels):
+                if track.label != label:
+                    iou[t, d] = 0.0
+
+        matched_tracks, matched_detections = set(), set()
+        for flat in np.argsort(-iou, axis=None):
+            t, d = np.unravel_index(flat, iou.shape)
+            if iou[t, d] < self.iou_threshold:
+                break
+            if t in matched_tracks or d in matched_detections:
+                continue
+            track = self.tracks[t]
+            track.filter.update(boxes[d])
+            track.score = scores[d]
+            track.hits += 1
+            track.misses = 0
+            track.last_detected_frame = self.frame_index
+            matched_tracks.add(t)
+            matched_detections.add(d)
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+        for d, label in enumerate(labels):
+            if d not in matched_detections:
+                self.tracks.append(Track(next(self._ids), label, scores[d], boxes[d], self.frame_index))
+
+        _, thumb, _ = self._prepare(frame)
+        self._keyframe_thumb = thumb
+        self._flow_lost = False
+        self._finish_frame(frame)
+        self.frames_since_keyframe = 0
+        self.keyframes += 1
+        return self.visible_tracks()
+
+    def step(self, frame: np.ndarray,
+             detect_fn: Callable[[np.ndarray], Tuple[np.ndarray, List[str], List[float]]]) -> Tuple[List[Track], bool]:
+        """Synchronous convenience: detect on keyframes, propagate otherwise; returns (tracks, keyframe)"""
+        keyframe, _ = self.needs_detection(frame)
+        if keyframe:
+            return self.update(frame, *detect_fn(frame)), True
+        return self.propagate(frame), False
+
+    def visible_tracks(self) -> List[Track]:
+        """Tracks confirmed by the most recent keyframe (missed ones are kept only for re-association)"""
+        return [track for track in self.tracks if track.misses == 0]
+
+    def stats(self) -> Dict[str, Any]:
+        frames = self.keyframes + self.propagated_frames
+        return {
+            "keyframes": self.keyframes,
+            "propagated_frames": self.propagated_frames,
+            "detector_fraction": round(self.keyframes / frames, 3) if frames else 0.0,
+            "active_tracks": len(self.visible_tracks()),
+        }
@@ -0,0 +1,133 @@
+# Per-camera region-of-interest zones: only the work areas of a fixed camera go through the detector
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Context kept around each zone's bounding rectangle, as a fraction of its size
+ZONE_PADDING = 0.05
+
+
+def points_in_polygon(points: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    """Even-odd ray casting for many (x, y) points against one polygon"""
+    x, y = points[:, 0:1], points[:, 1:2]
+    x0, y0 = polygon[:, 0], polygon[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    crosses = (y0 > y) != (y1 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return (crosses & (x < x_cross)).sum(axis=1) % 2 == 1
+
+
+def polygon_area(polygon: np.ndarray) -> float:
+    """Shoelace area of a polygon (any winding order)"""
+    x, y = polygon[:, 0].astype(np.float64), polygon[:, 1].astype(np.float64)
+    return float(abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2.0)
+
+
+class Zone:
+    """
+    A named work area of one camera view: a rectangle or polygon in
+    normalized (0-1) frame coordinates, so it holds at any stream resolution.
+    Optional per-workstation rules: the task phases that can happen there
+    and next steps replacing the profile's.
+    """
+
+    def __init__(self, name: str, polygon: Sequence[Sequence[float]], task_phases: Optional[List[str]] = None,
+                 next_steps: Optional[Dict[str, str]] = None, description: str = ""):
+        self.name = name
+        self.polygon = np.clip(np.asarray(polygon, dtype=np.float32).reshape(-1, 2), 0.0, 1.0)
+        if len(self.polygon) < 3:
+            raise ValueError(f"Zone {name!r} needs at least 3 polygon points")
+        # A flat rect or collinear polygon would crop an empty region from every frame
+        if polygon_area(self.polygon) <= 0:
+            raise ValueError(f"Zone {name!r} has no area inside the frame")
+        self.task_phases = task_phases
+        self.next_steps = next_steps or {}
+        self.description = description
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Zone":
+        """{"name": ..., "rect": [x0, y0, x1, y1]} or {"name": ..., "polygon": [[x, y], ...]}, plus optional rules"""
+        if "rect" in data:
+            x0, y0, x1, y1 = data["rect"]
+            polygon = [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+        else:
+            polygon = data["polygon"]
+        return cls(data["name"], polygon, data.get("task_phases"), data.get("next_steps"), data.get("description", ""))
+
+    def pixel_polygon(self, height: int, width: int) -> np.ndarray:
+        return self.polygon * np.array([width, height], dtype=np.float32)
+
+    def window(self, height: int, width: int) -> Tuple[int, int, int, int]:
+        """Padded bounding rectangle (x0, y0, x1, y1) of the zone in frame pixels"""
+        polygon = self.pixel_polygon(height, width)
+        (x0, y0), (x1, y1) = polygon.min(axis=0), polygon.max(axis=0)
+        pad_x, pad_y = ZONE_PADDING * (x1 - x0), ZONE_PADDING * (y1 - y0)
+        return (
+            max(0, int(x0 - pad_x)), max(0, int(y0 - pad_y)),
+            min(width, int(np.ceil(x1 + pad_x))), min(height, int(np.ceil(y1 + pad_y)))
+        )
+
+    def rules(self) -> Dict[str, Any]:
+        return {"task_phases": self.task_phases, "next_steps": self.next_steps}
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "polygon": self.polygon.astype(np.float64).round(4).tolist(),
+            "task_phases": self.task_phases,
+            "description": self.description,
+        }
+
+
+class CameraZones:
+    """The zones of one camera (in priority order: overlaps belong to the first zone)"""
+
+    def __init__(self, camera: str, zones: List[Zone]):
+        if not zones:
+            raise ValueError(f"Camera {camera!r} has no zones")
+        names = [zone.name for zone in zones]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Camera {camera!r} has duplicate zone names")
+        self.camera = camera
+        self.zones = zones
+
+    @classmethod
+    def from_dict(cls, camera: str, data: Dict[str, Any]) -> "CameraZones":
+        return cls(camera, [Zone.from_dict(zone) for zone in data["zones"]])
+
+    def windows(self, shape: Tuple[int, ...]) -> List[Tuple[int, int, int, int]]:
+        """Crop rectangles for the detector, one per zone"""
+        height, width = shape[:2]
+        return [zone.window(height, width) for zone in self.zones]
+
+    def assign(self, boxes: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+        """Zone index of each xyxy box by its centre, -1 for boxes outside every zone"""
+        height, width = shape[:2]
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        centres = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+        assigned = np.full(len(boxes), -1, dtype=np.int64)
+        for index, zone in enumerate(self.zones):
+            inside = points_in_polygon(centres, zone.pixel_polygon(height, width)) & (assigned < 0)
+            assigned[inside] = index
+        return assigned
+
+    def select(self, boxes: np.ndarray, objects: List[str], scores: List[float],
+               shape: Tuple[int, ...]) -> Tuple[np.ndarray, List[str], List[float], List[str]]:
+        """Drop detections outside every zone; returns the rest plus the zone name of each"""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        assigned = self.assign(boxes, shape)
+        keep = np.flatnonzero(assigned >= 0)
+        return (
+            boxes[keep],
+            [objects[i] for i in keep],
+            [scores[i] for i in keep],
+            [self.zones[assigned[i]].name for i in keep]
+        )
+
+    def zone_rules(self) -> Dict[str, Dict[str, Any]]:
+        return {zone.name: zone.rules() for zone in self.zones}
+
+    def info(self) -> Dict[str, Any]:
+        return {"camera": self.camera, "zones": [zone.info() for zone in self.zones]}
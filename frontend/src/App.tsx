@@ -14,6 +14,30 @@ interface Analysis {
   safety_assessment: string;
   next_steps: string;
   image_url: string;
+  expert_analysis_stream?: string | null;
+  cache_hit?: boolean;
+  cached_from?: string | null;
+  degraded?: boolean;
+}
+
+interface LiveResult {
+  type: 'detections' | 'error' | 'dropped';
+  detected_objects?: string[];
+  confidence_scores?: number[];
+  task_phase?: string;
+  safety_assessment?: string;
+  detail?: string;
+  keyframe?: boolean;
+  tracks?: { id: number; label: string; score: number; box: number[] }[];
+  latency_ms: number;
+  stats: {
+    frames_received: number;
+    frames_analyzed: number;
+    frames_dropped: number;
+    analyzed_fps: number;
+    mean_latency_ms: number;
+    max_latency_ms: number;
+  };
 }
 
 const App: React.FC = () => {
@@ -22,19 +46,28 @@ const App: React.FC = () => {
   const [isAnalyzing, setIsAnalyzing] = useState(false);
   const [currentAnalysis, setCurrentAnalysis] = useState<Analysis | null>(null);
   const [analysisHistory, setAnalysisHistory] = useState<Analysis[]>([]);
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null);
+  const [isLoadingHistory, setIsLoadingHistory] = useState(false);
   const [notifications, setNotifications] = useState<string[]>([]);
   const [captureCountdown, setCaptureCountdown] = useState<number | null>(null);
   const [isCameraReady, setIsCameraReady] = useState(false);
   const [cameraError, setCameraError] = useState<string | null>(null);
   const [showDetectionSettings, setShowDetectionSettings] = useState(false);
+  const [isLiveMode, setIsLiveMode] = useState(false);
+  const [liveResult, setLiveResult] = useState<LiveResult | null>(null);
   
   // Refs
   const videoRef = useRef<HTMLVideoElement>(null);
   const canvasRef = useRef<HTMLCanvasElement>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
+  const liveSocketRef = useRef<WebSocket | null>(null);
+  const liveTimerRef = useRef<number | null>(null);
+  const expertStreamRef = useRef<EventSource | null>(null);
   
   // API settings
   const API_BASE = 'http://localhost:8000';
+  const WS_BASE = API_BASE.replace(/^http/, 'ws');
+  const LIVE_FRAME_INTERVAL_MS = 200;
 
   // Fetch system status
   const fetchSystemStatus = async () => {
@@ -48,25 +81,83 @@ const App: React.FC = () => {
     }
   };
 
-  // Image analysis function
-  const analyzeImage = async (imageBase64: string) => {
+  // Fetch a page of analysis history from the server (newest first)
+  const fetchHistory = async (cursor: string | null = null) => {
+    setIsLoadingHistory(true);
+    try {
+      const params = new URLSearchParams({ limit: '24' });
+      if (cursor) {
+        params.set('cursor', cursor);
+      }
+      const response = await fetch(`${API_BASE}/history?${params}`);
+      if (!response.ok) {
+        throw new Error(`History fetch failed: ${response.status}`);
+      }
+
+      const page = await response.json();
+      setAnalysisHistory(prev => cursor ? [...prev, ...page.items] : page.items);
+      setHistoryCursor(page.next_cursor);
+    } catch (error) {
+      console.error('Failed to fetch history', error);
+      addNotification('Failed to load history');
+    } finally {
+      setIsLoadingHistory(false);
+    }
+  };
+
+  // Follow the SSE expert analysis stream of a two-phase analysis
+  const followExpertStream = (analysis: Analysis) => {
+    expertStreamRef.current?.close();
+    if (!analysis.expert_analysis_stream) return;
+
+    const source = new EventSource(`${API_BASE}${analysis.expert_analysis_stream}`);
+    expertStreamRef.current = source;
+    let streamedText = '';
+
+    const updateExpertText = (text: string) => {
+      setCurrentAnalysis(prev => prev && prev.id === analysis.id ? { ...prev, expert_analysis: text } : prev);
+    };
+
+    source.addEventListener('token', (event) => {
+      streamedText += JSON.parse((event as MessageEvent).data).text;
+      updateExpertText(streamedText);
+    });
+
+    source.addEventListener('done', (event) => {
+      updateExpertText(JSON.parse((event as MessageEvent).data).expert_analysis);
+      source.close();
+    });
+
+    source.onerror = () => {
+      source.close();
+    };
+  };
+
+  // Image analysis function (raw JPEG/PNG bytes, no base64 inflation)
+  const analyzeImage = async (image: Blob) => {
     console.log('Starting image analysis...');
     
     setIsAnalyzing(true);
     addNotification('Analysis starting...');
     
     try {
-      const response = await fetch(`${API_BASE}/analyze/image`, {
+      // Two-phase mode: detections now, expert analysis streamed afterwards
+      const response = await fetch(`${API_BASE}/analyze/image/binary?stream=true`, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json',
+          'Content-Type': 'application/octet-stream',
         },
-        body: JSON.stringify({
-          image_base64: imageBase64,
-          analysis_type: 'comprehensive'
-        }),
+        body: image,
       });
       
+      if (response.status === 429) {
+        addNotification(`Server busy - retry in ${response.headers.get('Retry-After') || 'a few'}s`);
+        return;
+      }
+      if (response.status === 504) {
+        addNotification('Analysis timed out - please retry');
+        return;
+      }
       if (!response.ok) {
         throw new Error(`Analysis failed: ${response.status}`);
       }
@@ -75,8 +166,8 @@ const App: React.FC = () => {
       console.log('Analysis complete:', analysis);
       
       setCurrentAnalysis(analysis);
-      setAnalysisHistory(prev => [analysis, ...prev]);
-      addNotification('Analysis complete');
+      followExpertStream(analysis);
+      addNotification(analysis.degraded ? 'Analysis complete (reduced detail - server under load)' : 'Analysis complete');
       
     } catch (error) {
       console.error('Analysis error:', error);
@@ -178,21 +269,83 @@ const App: React.FC = () => {
       // Draw video frame to canvas
       ctx.drawImage(video, 0, 0, width, height);
       
-      // Convert to base64
-      const imageBase64 = canvas.toDataURL('image/jpeg', 0.85);
-      
-      if (imageBase64.length > 1000) {
-        addNotification('Image captured successfully');
-        analyzeImage(imageBase64);
-      } else {
-        addNotification('Image capture failed - Try again');
-      }
+      // Encode as JPEG bytes
+      canvas.toBlob((blob) => {
+        if (blob && blob.size > 1000) {
+          addNotification('Image captured successfully');
+          analyzeImage(blob);
+        } else {
+          addNotification('Image capture failed - Try again');
+        }
+      }, 'image/jpeg', 0.85);
     } catch (error) {
       console.error('Capture error:', error);
       addNotification('Capture error - Try uploading instead');
     }
   }, [isCameraReady]);
 
+  // Live stream mode: push frames continuously, server analyzes the latest one
+  const stopLiveMode = () => {
+    if (liveTimerRef.current !== null) {
+      window.clearInterval(liveTimerRef.current);
+      liveTimerRef.current = null;
+    }
+    liveSocketRef.current?.close();
+    liveSocketRef.current = null;
+    setIsLiveMode(false);
+  };
+
+  const startLiveMode = () => {
+    if (!isCameraReady || !videoRef.current || !canvasRef.current) {
+      addNotification('Camera not ready');
+      return;
+    }
+
+    const socket = new WebSocket(`${WS_BASE}/ws/stream`);
+    liveSocketRef.current = socket;
+
+    socket.onopen = () => {
+      setIsLiveMode(true);
+      setLiveResult(null);
+      addNotification('Live analysis started');
+
+      liveTimerRef.current = window.setInterval(() => {
+        const video = videoRef.current;
+        const canvas = canvasRef.current;
+        const ctx = canvas?.getContext('2d');
+        // Skip this tick if the previous frame is still being uploaded
+        if (!video || !canvas || !ctx || socket.readyState !== WebSocket.OPEN || socket.bufferedAmount > 0) {
+          return;
+        }
+
+        canvas.width = video.videoWidth || 640;
+        canvas.height = video.videoHeight || 480;
+        ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+        canvas.toBlob((blob) => {
+          if (blob && socket.readyState === WebSocket.OPEN) {
+            socket.send(blob);
+          }
+        }, 'image/jpeg', 0.7);
+      }, LIVE_FRAME_INTERVAL_MS);
+    };
+
+    socket.onmessage = (event) => {
+      const message: LiveResult = JSON.parse(event.data);
+      // A frame dropped by the server (busy, deadline) keeps the last detections on screen
+      setLiveResult((previous) =>
+        message.type === 'dropped' && previous ? { ...previous, stats: message.stats } : message
+      );
+    };
+
+    socket.onerror = () => {
+      addNotification('Live analysis connection failed');
+    };
+
+    socket.onclose = () => {
+      stopLiveMode();
+    };
+  };
+
   // Countdown capture
   const startCountdownCapture = () => {
     if (!isCameraReady) {
@@ -222,16 +375,8 @@ const App: React.FC = () => {
 
     addNotification(`Processing: ${file.name}`);
     
-    const reader = new FileReader();
-    reader.onload = (e) => {
-      const imageBase64 = e.target?.result as string;
-      if (imageBase64) {
-        analyzeImage(imageBase64);
-      } else {
-        addNotification('Failed to read file');
-      }
-    };
-    reader.readAsDataURL(file);
+    // Files are Blobs, so the bytes are sent as-is
+    analyzeImage(file);
     
     // Reset file input
     if (event.target) {
@@ -254,12 +399,17 @@ const App: React.FC = () => {
       startCamera();
     }
     
+    if (currentView === 'history') {
+      fetchHistory();
+    }
+    
     // Add keyboard listener
     window.addEventListener('keydown', handleKeyPress);
     
     // Cleanup function
     return () => {
       window.removeEventListener('keydown', handleKeyPress);
+      stopLiveMode();
       
       // Stop camera when component unmounts
       if (videoRef.current?.srcObject) {
@@ -352,9 +502,19 @@ const App: React.FC = () => {
               <Sliders className="w-4 h-4" />
             </button>
             
+            <button
+              onClick={isLiveMode ? stopLiveMode : startLiveMode}
+              disabled={!isCameraReady}
+              className={`button ${isLiveMode ? 'button-secondary' : 'button-primary'}`}
+              title="Continuous live analysis"
+            >
+              <Zap className="w-4 h-4 mr-2" />
+              <span>{isLiveMode ? 'Stop Live' : 'Live'}</span>
+            </button>
+            
             <button
               onClick={startCountdownCapture}
-              disabled={isAnalyzing || !isCameraReady}
+              disabled={isAnalyzing || !isCameraReady || isLiveMode}
               className={`button ${isCameraReady && !isAnalyzing ? 'button-primary' : 'button-disabled'}`}
             >
               <Camera className="w-4 h-4 mr-2" />
@@ -420,8 +580,31 @@ const App: React.FC = () => {
               </div>
             )}
             
+            {/* Live Stream Overlay */}
+            {isLiveMode && liveResult && (
+              <div className="absolute top-4 left-4 right-4 bg-black/70 text-white text-xs rounded-lg p-2">
+                {liveResult.type !== 'detections' ? (
+                  <p className="text-yellow-400">{liveResult.detail}</p>
+                ) : (
+                  <>
+                    <div className="flex flex-wrap gap-1 mb-1">
+                      {(liveResult.detected_objects || []).map((obj, i) => (
+                        <span key={liveResult.tracks?.[i]?.id ?? i} className="badge-small">
+                          {liveResult.tracks?.[i] ? `#${liveResult.tracks[i].id} ` : ''}{obj} ({Math.round((liveResult.confidence_scores?.[i] || 0) * 100)}%)
+                        </span>
+                      ))}
+                    </div>
+                    <div className="text-slate-300">{liveResult.task_phase?.replace(/_/g, ' ')}</div>
+                  </>
+                )}
+                <div className="text-slate-400 mt-1">
+                  {liveResult.latency_ms.toFixed(0)} ms{liveResult.keyframe === false ? ' (tracked)' : ''} · {liveResult.stats.frames_analyzed}/{liveResult.stats.frames_received} frames analyzed · {liveResult.stats.frames_dropped} dropped
+                </div>
+              </div>
+            )}
+            
             {/* Press Enter Indicator (when camera ready) */}
-            {isCameraReady && !isAnalyzing && (
+            {isCameraReady && !isAnalyzing && !isLiveMode && (
               <div className="absolute bottom-4 left-1/2 transform -translate-x-1/2 bg-black/70 text-white text-sm py-1 px-3 rounded-full">
                 Press <kbd className="bg-gray-700 px-2 py-0.5 rounded">Enter</kbd> to capture
               </div>
@@ -565,8 +748,11 @@ const App: React.FC = () => {
         <h2>ANALYSIS HISTORY</h2>
         <div className="flex items-center space-x-2">
           <span className="text-xs text-slate-400">
-            {analysisHistory.length} RECORDS
+            {analysisHistory.length}{historyCursor ? '+' : ''} RECORDS
           </span>
+          <button className="button button-icon" onClick={() => fetchHistory()} title="Refresh">
+            <RefreshCw className="w-4 h-4" />
+          </button>
         </div>
       </div>
       
@@ -580,6 +766,7 @@ const App: React.FC = () => {
             </div>
           </div>
         ) : (
+          <>
           <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-4">
             {analysisHistory.map((analysis) => (
               <div key={analysis.id} className="bg-slate-800 border border-slate-700 rounded-lg overflow-hidden">
@@ -625,6 +812,19 @@ const App: React.FC = () => {
               </div>
             ))}
           </div>
+          
+          {historyCursor && (
+            <div className="mt-4 text-center">
+              <button
+                onClick={() => fetchHistory(historyCursor)}
+                disabled={isLoadingHistory}
+                className={`button ${isLoadingHistory ? 'button-disabled' : 'button-secondary'}`}
+              >
+                <span>{isLoadingHistory ? 'Loading...' : 'Load more'}</span>
+              </button>
+            </div>
+          )}
+          </>
         )}
       </div>
     </div>
@@ -673,6 +873,11 @@ const App: React.FC = () => {
                     <div className="badge-primary">
                       {currentAnalysis?.task_phase ? currentAnalysis.task_phase.replace(/_/g, ' ') : 'Unknown Phase'}
                     </div>
+                    {currentAnalysis?.cache_hit && (
+                      <div className="text-xs text-slate-400 mt-1" title={`Reuses analysis ${currentAnalysis.cached_from}`}>
+                        <Zap className="inline w-3 h-3 mr-1" />Near-identical frame - served from cache
+                      </div>
+                    )}
                   </div>
                   
                   {/* Detected Objects */}